@@ -1,47 +1,26 @@
 #!/usr/bin/env python3
 import cv2
 import time
+from eartag_jetson.common.capture import open_capture, REFERENCE_WIDTH
 
 def nothing(x):
     pass
 
-def open_camera(idx, width, height):
-    # try default backend by index
-    cap = cv2.VideoCapture(idx)
-    if cap.isOpened():
-        return cap
-
-    # fallback: force V4L2 by index
-    cap = cv2.VideoCapture(idx, cv2.CAP_V4L2)
-    if cap.isOpened():
-        return cap
-
-    # fallback: GStreamer pipeline (replace YUY2 if your camera speaks MJPG)
-    pipeline = (
-        f'v4l2src device=/dev/video{idx} ! '
-        f'video/x-raw,format=YUY2,width={width},height={height} ! '
-        'videoconvert ! appsink'
-    )
-    cap = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
-    return cap
-
 def main():
     TARGET_W, TARGET_H = 4608, 2592
     # pick the index you know exists; try 0 then 1
     for cam_idx in (0, 1):
-        cap = open_camera(cam_idx, TARGET_W, TARGET_H)
-        if cap.isOpened():
-            print(f"✔️  Opened /dev/video{cam_idx}")
-            break
+        try:
+            cap, info = open_capture(cam_idx, width=TARGET_W, height=TARGET_H)
+        except IOError:
+            continue
+        print(f"✔️  Opened /dev/video{cam_idx} via {info.backend}")
+        break
     else:
         print("❌ Could not open any camera (tried 0 and 1)")
         return
 
-    # request target resolution & read back
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH,  TARGET_W)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, TARGET_H)
-    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    w, h = info.width, info.height
     print(f"⚙️  Running at {w}×{h}")
 
     # UI
@@ -62,6 +41,11 @@ def main():
 
             cv2.line(frame, (left,  0), (left,  h), (0, 0, 255), 2)
             cv2.line(frame, (right, 0), (right, h), (0, 0, 255), 2)
+            # EDGE_MARGIN is given at REFERENCE_WIDTH, whatever the capture size
+            ref = REFERENCE_WIDTH / w
+            cv2.putText(frame, f"EDGE_MARGIN L={left * ref:.0f} R={(w - right) * ref:.0f}",
+                        (20, max(40, h // 20)), cv2.FONT_HERSHEY_SIMPLEX, max(1.0, w / 1500),
+                        (0, 0, 255), 2)
 
             cv2.imshow("Tune", frame)
             if cv2.waitKey(1) & 0xFF == 27:  # ESC
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# DeadlineScheduler degrading and recovering on synthetic frame costs: no models needed.
+#   python3 -m pytest manual_tests/test_deadline.py
+from eartag_jetson.pipeline.deadline import DEGRADED_IMGSZ, IMGSZ, DeadlineScheduler
+
+
+def _window(sched, cost_ms):
+    for _ in range(sched.window):
+        sched.observe(cost_ms)
+
+
+def test_over_budget_degrades_one_step_per_window():
+    sched = DeadlineScheduler(100.0, window=5)
+    _window(sched, 150.0)
+    assert sched.level == 1 and sched.settle(0.999, 3) == (0.99, 2)
+    _window(sched, 140.0)
+    assert sched.level == 2 and sched.imgsz() == DEGRADED_IMGSZ
+    _window(sched, 120.0)
+    assert sched.level == 3
+    assert [sched.process_frame() for _ in range(4)] == [True, False, True, False]
+    _window(sched, 110.0)
+    assert sched.level == 3                 # no step left
+
+
+def test_recovers_only_when_the_frames_fit_without_the_step():
+    sched = DeadlineScheduler(100.0, order=("imgsz",), window=5, headroom=0.8)
+    _window(sched, 150.0)
+    assert sched.imgsz() == DEGRADED_IMGSZ
+    _window(sched, 60.0)                    # 2.5x saving: 150 ms again without it
+    assert sched.level == 1
+    _window(sched, 30.0)                    # 75 ms without it, under 0.8 × budget
+    assert sched.level == 0 and sched.imgsz() == IMGSZ
+
+
+def test_disabled_step_is_never_active():
+    sched = DeadlineScheduler(100.0, order=("imgsz", "skip"), window=5)
+    sched.disable("imgsz", "static engine input")
+    _window(sched, 150.0)
+    assert sched.imgsz() == IMGSZ
+    _window(sched, 150.0)
+    assert sched.active("skip")
+
+
+if __name__ == "__main__":
+    test_over_budget_degrades_one_step_per_window()
+    test_recovers_only_when_the_frames_fit_without_the_step()
+    test_disabled_step_is_never_active()
+    print("ok")
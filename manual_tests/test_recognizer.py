@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# PaddleRecognizer's instance pool with a stub OCR: no models needed.
+#   python3 -m pytest manual_tests/test_recognizer.py
+import threading
+import time
+import numpy as np
+from eartag_jetson.pipeline.recognizer import PaddleRecognizer
+
+
+class StubOCR:
+    def ocr(self, crop):
+        time.sleep(0.001)
+        return [[[None, (str(int(crop[0, 0, 0])), 0.9)]]]
+
+
+def _crops(n):
+    return [np.full((8, 8, 3), i, np.uint8) for i in range(n)]
+
+
+def _slow_ocr():
+    time.sleep(0.2)                     # a PaddleOCR load takes seconds
+    return StubOCR()
+
+
+def test_reads_keep_crop_order_across_instances():
+    rec = PaddleRecognizer(StubOCR(), workers=3, make_ocr=StubOCR)
+    for n in (1, 2, 3):
+        rec.set_workers(n)
+        assert [r[0] for r in rec.read(_crops(10))] == [str(i) for i in range(10)]
+    rec.close()
+
+
+def test_read_while_set_workers_is_loading():
+    rec = PaddleRecognizer(StubOCR(), workers=4, make_ocr=_slow_ocr)
+    grow = threading.Thread(target=rec.set_workers, args=(4,))
+    grow.start()
+    while grow.is_alive():
+        assert [r[0] for r in rec.read(_crops(6))] == [str(i) for i in range(6)]
+    grow.join()
+    assert rec.workers == 4 and len(rec.engines) == 4
+    rec.close()
+
+
+if __name__ == "__main__":
+    test_reads_keep_crop_order_across_instances()
+    test_read_while_set_workers_is_loading()
+    print("ok")
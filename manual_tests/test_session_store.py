@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Session store crash recovery and outbox retries on a temporary database: no camera or ESP32 needed.
+#   python3 -m pytest manual_tests/test_session_store.py
+import os
+import sqlite3
+import tempfile
+import time
+from eartag_jetson.pipeline import session_store
+from eartag_jetson.pipeline.session_store import DeliveryWorker, SessionStore
+
+ENTRIES = [
+    {"text": "1234", "frequency": 9, "median_x": 1200.0},
+    {"text": "5678", "frequency": 7, "median_x": 3000.0},
+]
+
+
+def _db():
+    return os.path.join(tempfile.mkdtemp(), "sessions.db")
+
+
+def _payload(tags_lr, end_ts):
+    return {"tags": tags_lr, "end": end_ts}
+
+
+def _open(store):
+    return store.open_session(frame_width=4608, edge_margin=500, close_thresh=250, top_n=4)
+
+
+def test_recover_queues_the_last_checkpoint_of_an_open_session():
+    path = _db()
+    crashed = SessionStore("CAM", path)
+    sid = _open(crashed)
+    crashed._next_checkpoint = 0.0          # skip the CHECKPOINT_S wait
+    crashed.checkpoint(sid, ENTRIES)
+    crashed.close()                         # worker died before close_session
+
+    store = SessionStore("CAM", path)
+    assert store.recover(_payload) == 1
+    store.close()
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT status FROM sessions WHERE id = ?", (sid,)).fetchone() == ("interrupted",)
+    (payload,) = conn.execute("SELECT payload FROM outbox WHERE session_id = ?", (sid,)).fetchone()
+    assert '"tags": ["1234", "5678"]' in payload
+    again = SessionStore("CAM", path)
+    assert again.recover(_payload) == 0     # nothing left open
+    again.close()
+
+
+def test_failed_delivery_is_retried_until_it_goes_out():
+    calls = []
+
+    def flaky(payload):
+        calls.append(payload)
+        if len(calls) < 3:
+            raise IOError("serial write timed out")
+
+    base = session_store.RETRY_BASE_S
+    session_store.RETRY_BASE_S = 0.01
+    try:
+        path = _db()
+        store = SessionStore("CAM", path)
+        store.close_session(_open(store), ENTRIES, None, {"tags": ["1234", "5678"]})
+        store.flush()
+        worker = DeliveryWorker(store, {"serial": flaky}).start()
+        deadline = time.monotonic() + 5.0
+        while len(calls) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        worker.stop()
+        store.close()
+    finally:
+        session_store.RETRY_BASE_S = base
+    assert len(calls) == 3
+    row = sqlite3.connect(path).execute("SELECT attempts, delivered, last_error FROM outbox").fetchone()
+    assert row[0] == 3 and row[1] is not None and row[2] == "serial write timed out"
+
+
+if __name__ == "__main__":
+    test_recover_queues_the_last_checkpoint_of_an_open_session()
+    test_failed_delivery_is_retried_until_it_goes_out()
+    print("ok")
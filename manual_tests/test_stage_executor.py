@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# StageExecutor ordering, error hand-off and close() on plain functions: no models needed.
+#   python3 -m pytest manual_tests/test_stage_executor.py
+import random
+import time
+from eartag_jetson.pipeline.stage_executor import Stage, StageExecutor
+
+
+def _jitter(x):
+    time.sleep(random.uniform(0, 0.01))     # OCR workers finish out of order
+    return x
+
+
+def _fail_on(bad):
+    def fn(x):
+        if x == bad:
+            raise ValueError(f"bad item {x}")
+        return x
+    return fn
+
+
+def test_results_in_order_with_parallel_ocr():
+    seen = []
+
+    def aggregate(x):
+        seen.append(x)
+        return x * 10
+
+    ex = StageExecutor([
+        Stage("yolo", lambda x: x),
+        Stage("ocr", _jitter, workers=3),
+        Stage("aggregate", aggregate, ordered=True),
+    ], depth=2).start()
+    outs = []
+    for i in range(30):
+        ex.submit(i)
+        outs += ex.poll()
+    outs += ex.close()
+    assert seen == list(range(30))
+    assert outs == [i * 10 for i in range(30)]
+
+
+def test_get_reraises_a_failed_item_in_its_place():
+    ex = StageExecutor([Stage("yolo", _fail_on(2)), Stage("ocr", _jitter, workers=2)]).start()
+    for i in range(5):
+        ex.submit(i)
+    assert [ex.get(timeout=5), ex.get(timeout=5)] == [0, 1]
+    try:
+        ex.get(timeout=5)
+    except ValueError as e:
+        assert "bad item 2" in str(e)
+    else:
+        raise AssertionError("get() did not re-raise the stage error")
+    assert [ex.get(timeout=5), ex.get(timeout=5)] == [3, 4]
+    assert ex.close() == []
+
+
+def test_poll_hands_out_good_results_before_the_error():
+    ex = StageExecutor([Stage("yolo", _fail_on(2))]).start()
+    for i in range(4):
+        ex.submit(i)
+    while ex.out.qsize() < 4:               # all four through the stage
+        time.sleep(0.01)
+    assert ex.poll() == [0, 1]
+    try:
+        ex.poll()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("poll() did not re-raise the stage error")
+    assert ex.poll() == [3]
+    ex.close()
+
+
+def test_close_drains_items_in_flight():
+    ex = StageExecutor([
+        Stage("yolo", lambda x: time.sleep(0.02) or x),
+        Stage("ocr", _jitter, workers=2),
+    ], depth=4).start()
+    for i in range(6):
+        ex.submit(i)
+    assert ex.close() == list(range(6))
+    assert all(not t.is_alive() for t in ex._threads)
+
+
+if __name__ == "__main__":
+    test_results_in_order_with_parallel_ocr()
+    test_get_reraises_a_failed_item_in_its_place()
+    test_poll_hands_out_good_results_before_the_error()
+    test_close_drains_items_in_flight()
+    print("ok")
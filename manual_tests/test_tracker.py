@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# Two frames of overlapping boxes through the tracker: no models needed.
+#   python3 -m pytest manual_tests/test_tracker.py
+from eartag_jetson.pipeline.summary import TAG_PATTERN
+from eartag_jetson.pipeline.tracker import TagTracker, TrackAggregate
+
+
+def _accept(text):
+    return text if TAG_PATTERN.fullmatch(text) else None
+
+
+def test_overlapping_boxes_continue_their_tracks():
+    tracker = TagTracker()
+    first  = tracker.update([(100, 100, 200, 150, 0.9), (1000, 100, 1100, 150, 0.9)])
+    second = tracker.update([(110, 102, 210, 152, 0.9), (1005, 98, 1105, 148, 0.9)])
+    assert [t.id for t in second] == [t.id for t in first]
+    assert len(tracker.active) == 2
+
+
+def test_reads_fuse_per_track():
+    agg = TrackAggregate(settle_p=0.9, min_reads=2)
+    frames = [
+        [(100, 100, 200, 150, 0.9), (1000, 100, 1100, 150, 0.9)],
+        [(110, 102, 210, 152, 0.9), (1005, 98, 1105, 148, 0.9)],
+    ]
+    for dets in frames:
+        tracks = agg.assign(dets)
+        agg.fold(dets, [("1234", 0.95), ("5678", 0.95)], _accept, tracks)
+    texts = {e["text"]: e["frequency"] for e in agg.entries()}
+    assert texts == {"1234": 2, "5678": 2}
+    assert all(t.settled for t in agg.tracker.active)
+
+
+if __name__ == "__main__":
+    test_overlapping_boxes_continue_their_tracks()
+    test_reads_fuse_per_track()
+    print("ok")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# benchmark/cpu_plan_benchmark.py
+"""
+Total fps of N concurrent camera workers with and without the CPU plan
+(pipeline/cpu_plan.py).
+
+Each worker is a spawned process that loads the models, waits for the others,
+then runs the multi-camera detector's per-frame loop (YOLO → crop → OCR →
+aggregate, as run_benchmark.py) over the same clip:
+
+    default   today's behaviour: OCR pool of cpu_count() - 1, library
+              thread pools at their defaults, no pinning
+    planned   cores split by plan_cpus, pools and pins from apply_plan
+
+CPU-only like run_benchmark.py, so the OCR/YOLO contention is the Orin's CPU
+side with the GPU taken out.
+
+    python3 cpu_plan_benchmark.py --clip /tmp/eartag_bench/clip_00.avi --cameras 1,2,4 --json cpu_plan.json
+"""
+import os
+os.environ['GLOG_minloglevel'] = '2'
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+import json
+import time
+import logging
+import argparse
+from multiprocessing import get_context
+from eartag_jetson.pipeline.cpu_plan import apply_plan, available_cpus, plan_cpus
+
+MODES = ("default", "planned")
+CONFIG = {"name": "cpu-plan", "edge_margin": 500, "close_thresh": 250, "top_n": 4}
+
+
+def _worker(name, plan, clip, weights, max_frames, ready, results):
+    from eartag_jetson.benchmark.run_benchmark import run_clip
+    from eartag_jetson.common.common_utils import get_logger
+    from eartag_jetson.pipeline.multi_detector import StallMultiDetector
+    logger = get_logger(f"cpu-plan-{name}", logging.WARNING)
+    if plan is not None:
+        apply_plan(plan, logger)
+    detector = StallMultiDetector(
+        caps={},
+        api_endpoint="",
+        min_detections=0,
+        streak_threshold=0,
+        logger=logger,
+        weights=weights,
+        ocr_workers=plan.ocr_workers if plan is not None else None,
+    )
+    timings = {s: [] for s in ("capture", "decode", "yolo", "crop", "ocr", "aggregate")}
+    ready.wait()                                # every worker has loaded its models
+    t0 = time.perf_counter()
+    try:
+        frames, _, _ = run_clip(detector, {"video": clip}, CONFIG, False, timings, max_frames=max_frames)
+    finally:
+        detector.shutdown()
+    results.put((name, frames, time.perf_counter() - t0))
+
+
+def measure(mode: str, n: int, clip: str, weights: str | None, max_frames: int | None) -> dict:
+    ctx = get_context("spawn")
+    names = [f"cam{i}" for i in range(n)]
+    plans = plan_cpus(names) if mode == "planned" else {}
+    ready = ctx.Barrier(n)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=_worker, args=(name, plans.get(name), clip, weights, max_frames, ready, results))
+        for name in names
+    ]
+    for p in procs:
+        p.start()
+    per_worker = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    fps = {name: frames / wall if wall else 0.0 for name, frames, wall in per_worker}
+    return {
+        "mode": mode,
+        "cameras": n,
+        "total_fps": sum(fps.values()),
+        "min_fps": min(fps.values()),
+        "per_worker_fps": fps,
+        "cores": {name: list(plan.cores) for name, plan in plans.items()},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Camera worker fps with and without the CPU plan")
+    ap.add_argument("--clip", required=True, help="video every worker reads")
+    ap.add_argument("--cameras", default="1,2,4")
+    ap.add_argument("--weights", help="YOLO .pt weights (default: resources/seg_model.pt)")
+    ap.add_argument("--frames", type=int, help="stop each worker after N frames")
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    print(f"{len(available_cpus())} CPUs available")
+    print(f"{'cameras':>8}{'mode':>10}{'total fps':>11}{'min fps':>9}")
+    results = []
+    for n in (int(c) for c in args.cameras.split(",")):
+        for mode in MODES:
+            r = measure(mode, n, args.clip, args.weights, args.frames)
+            results.append(r)
+            print(f"{n:>8}{mode:>10}{r['total_fps']:>11.2f}{r['min_fps']:>9.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
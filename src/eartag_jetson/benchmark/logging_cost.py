@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# benchmark/logging_cost.py
+"""
+Measure what logging costs the detector per frame.
+
+A "frame" is the log traffic of one `detect_and_aggregate` call: one
+"YOLO → N boxes" line, one "Accepted tag" line per box and a DEBUG line per
+box (filtered by level). Compares the original setup (formatter rebuilt per
+record, every line written synchronously) with the current one (cached
+formatters, QueueHandler → QueueListener, per-frame sampling).
+
+The queued rows run in a spawned worker logging into the queue of
+`setup_queue_logging`, with the listener live in this process, as in
+multi_stream_pipeline.py. Their time includes flushing the queue's feeder
+thread (pickling + pipe writes), which the worker pays too. Per record that
+put costs more than formatting and writing in place, so queueing every
+frame is slower than the legacy setup; the saving comes from the sampler,
+and the queue is there to give all workers one writer.
+
+    python3 logging_cost.py --frames 5000 --boxes 4
+"""
+import os
+import time
+import logging
+import argparse
+import logging.handlers
+from multiprocessing import get_context
+from colorama import Fore, Style
+from eartag_jetson.common.log_utils import FrameLogSampler, get_logger, setup_queue_logging
+
+
+class LegacyColorFormatter(logging.Formatter):
+    """The pre-cache formatter: builds a new Formatter for every record."""
+
+    def format(self, record):
+        level_color = {
+            "DEBUG": Fore.BLUE,
+            "INFO": Fore.GREEN,
+            "WARNING": Fore.YELLOW,
+            "ERROR": Fore.RED,
+            "CRITICAL": Fore.RED + Style.BRIGHT,
+        }.get(record.levelname, "")
+
+        fmt = (
+            f"{Fore.WHITE}[%(asctime)s]{Style.RESET_ALL} "
+            f"{level_color}[%(levelname)s]{Style.RESET_ALL} "
+            f"{Fore.YELLOW}[%(processName)s]{Style.RESET_ALL} "
+            f"{Fore.CYAN}%(filename)s{Style.RESET_ALL} "
+            f"- %(message)s"
+        )
+        formatter = logging.Formatter(fmt, datefmt="%Y-%m-%d %H:%M:%S")
+        return formatter.format(record)
+
+
+def legacy_frame(logger, boxes, sampler=None):
+    logger.info(f"YOLO → {boxes} boxes")
+    for i in range(boxes):
+        logger.debug(f"OCR on box {i}: '{1000 + i}' (0.98)")
+        logger.info(f"Accepted tag {1000 + i} at x={500 * i}")
+
+
+def current_frame(logger, boxes, sampler):
+    log_frame = sampler()
+    if log_frame:
+        logger.info("YOLO → %d boxes (%d frames not logged)", boxes, sampler.take_skipped())
+    for i in range(boxes):
+        logger.debug("OCR on box %d: '%s' (%.2f)", i, str(1000 + i), 0.98)
+        if log_frame:
+            logger.info("Accepted tag %s at x=%d", str(1000 + i), 500 * i)
+
+
+def time_frames(fn, logger, frames, boxes, interval=0.0) -> float:
+    """Mean microseconds per frame."""
+    sampler = FrameLogSampler(interval)
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        fn(logger, boxes, sampler)
+    return (time.perf_counter() - t0) / frames * 1e6
+
+
+def _queued_worker(queue, frames, boxes, interval, results):
+    logger = get_logger("bench-queued", queue=queue)
+    t0 = time.perf_counter()
+    time_frames(current_frame, logger, frames, boxes, interval)
+    queue.close()
+    queue.join_thread()                 # records pickled and written to the pipe
+    results.put((time.perf_counter() - t0) / frames * 1e6)
+
+
+def time_queued(ctx, queue, frames, boxes, interval=0.0) -> float:
+    """Mean microseconds per frame in a worker logging through `queue`."""
+    results = ctx.Queue()
+    p = ctx.Process(target=_queued_worker, args=(queue, frames, boxes, interval, results))
+    p.start()
+    us = results.get()
+    p.join()
+    return us
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Per-frame logging cost")
+    ap.add_argument("--frames", type=int, default=5000)
+    ap.add_argument("--boxes", type=int, default=4)
+    args = ap.parse_args()
+
+    sink = open(os.devnull, "w")
+
+    # original: rebuilt formatter, synchronous stream write, every line
+    legacy = logging.getLogger("bench-legacy")
+    legacy.setLevel(logging.INFO)
+    legacy.propagate = False
+    h = logging.StreamHandler(sink)
+    h.setFormatter(LegacyColorFormatter())
+    legacy.addHandler(h)
+
+    # cached formatter, still synchronous
+    cached = get_logger("bench-cached")
+    cached.handlers[0].setStream(sink)
+
+    # the production queue: a worker's QueueHandler, formatting + write in
+    # this process's listener
+    ctx = get_context("spawn")
+    queue, listener = setup_queue_logging(ctx)
+    for handler in listener.handlers:
+        handler.setStream(sink)
+
+    n, b = args.frames, args.boxes
+    try:
+        rows = [
+            ("legacy (per-record formatter)", time_frames(legacy_frame, legacy, n, b)),
+            ("cached formatter",              time_frames(current_frame, cached, n, b)),
+            ("queue handler, every frame",    time_queued(ctx, queue, n, b)),
+            ("queue handler, sampled 1/s",    time_queued(ctx, queue, n, b, 1.0)),
+        ]
+    finally:
+        listener.stop()
+    base = rows[0][1]
+    print(f"{'setup':<32}{'us/frame':>10}{'speedup':>9}")
+    for name, us in rows:
+        print(f"{name:<32}{us:>10.1f}{base / us:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# benchmark/memory_report.py
+"""
+Per-process RSS/PSS of camera workers with 1, 2 and 4 cameras.
+
+Every worker loads the models the way a camera process does (model_cache),
+runs one warm-up frame through YOLO and PaddleOCR, then idles while the
+parent reads /proc/<pid>/smaps_rollup. Three launch modes are compared:
+
+    spawn     – today's default: every worker holds a private copy
+    preload   – forkserver zygote with the models loaded (zygote.py);
+                workers share the weight pages copy-on-write
+    inference – one inference server holds the models (inference_server.py);
+                workers only hold an InferenceClient
+
+PSS splits shared pages between the processes using them, so the PSS total
+(workers + zygote or server) is the host memory cost of N cameras.
+
+On the Jetson the deployment runs a TensorRT engine and PaddleOCR on the
+GPU. Neither can be preloaded before fork (zygote.py shares the .pt weights
+only), and their CUDA allocations are not in smaps. So GPU memory per
+process is read as well: the nvmap client list on a Jetson (root only),
+else nvidia-smi. Where neither is available the GPU columns read 0.
+
+    python3 memory_report.py --cameras 1,2,4 --json memory.json
+"""
+import os
+os.environ['GLOG_minloglevel'] = '2'
+
+import json
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+import numpy as np
+
+MODES = ("spawn", "preload", "inference")
+NVMAP_CLIENTS = "/sys/kernel/debug/nvmap/iovmm/clients"
+
+
+def smaps_rollup(pid: int) -> dict[str, float]:
+    """Rss / Pss / Shared_* / Private_* of `pid`, in MB."""
+    out = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                out[parts[0].rstrip(":")] = int(parts[1]) / 1024.0
+    return out
+
+
+def gpu_memory() -> dict[int, float]:
+    """GPU memory per pid in MB: Jetson nvmap clients, else nvidia-smi."""
+    out: dict[int, float] = {}
+    try:
+        with open(NVMAP_CLIENTS) as f:
+            for line in f:
+                parts = line.split()
+                # "user  python3  1234  524288K"
+                if len(parts) == 4 and parts[2].isdigit() and parts[3].endswith("K"):
+                    out[int(parts[2])] = out.get(int(parts[2]), 0.0) + int(parts[3][:-1]) / 1024.0
+        return out
+    except OSError:
+        pass
+    try:
+        text = subprocess.run(
+            ["nvidia-smi", "--query-compute-apps=pid,used_memory", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=10, check=True,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return out
+    for line in text.splitlines():
+        pid, _, mb = line.partition(",")
+        if pid.strip().isdigit():
+            out[int(pid)] = out.get(int(pid), 0.0) + float(mb)
+    return out
+
+
+def _worker(weights, ready, done):
+    from eartag_jetson.pipeline.model_cache import load_models
+    model, ocr = load_models(weights)
+    frame = np.zeros((720, 1280, 3), np.uint8)
+    model(frame, verbose=False)
+    ocr.ocr(frame[:64, :160])
+    ready.set()
+    done.wait()
+
+
+def _client_worker(address, name, ready, done):
+    from eartag_jetson.pipeline.inference_server import InferenceClient
+    client = InferenceClient(address, name=name)
+    frame = np.zeros((720, 1280, 3), np.uint8)
+    client.detect(frame)
+    client.read([frame[:64, :160]])
+    ready.set()
+    done.wait()
+    client.close()
+
+
+def _forkserver_pid() -> int | None:
+    from multiprocessing import forkserver
+    return getattr(forkserver._forkserver, "_forkserver_pid", None)
+
+
+def measure(mode: str, n: int, weights: str | None) -> dict:
+    ctx = multiprocessing.get_context("forkserver" if mode == "preload" else "spawn")
+    done = ctx.Event()
+    server = None
+    if mode == "inference":
+        from eartag_jetson.pipeline.inference_server import serve
+        address = os.path.join(tempfile.mkdtemp(), "inference.sock")
+        server = ctx.Process(target=serve, kwargs={"address": address, "weights": weights})
+        server.start()
+    procs, readies = [], []
+    for i in range(n):
+        ready = ctx.Event()
+        if server is not None:
+            p = ctx.Process(target=_client_worker, args=(address, f"mem{i}", ready, done))
+        else:
+            p = ctx.Process(target=_worker, args=(weights, ready, done))
+        p.start()
+        procs.append(p)
+        readies.append(ready)
+    try:
+        for r in readies:
+            r.wait()
+        workers = [smaps_rollup(p.pid) for p in procs]
+        gpu = gpu_memory()
+        # the process every worker shares the models with, if any
+        shared_pid = server.pid if server is not None else (
+            _forkserver_pid() if mode == "preload" else None)
+        shared = smaps_rollup(shared_pid) if shared_pid else None
+    finally:
+        done.set()
+        for p in procs:
+            p.join()
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    worker_gpu = [gpu.get(p.pid, 0.0) for p in procs]
+    shared_gpu = gpu.get(shared_pid, 0.0) if shared_pid else 0.0
+    total_pss = sum(w["Pss"] for w in workers) + (shared["Pss"] if shared else 0.0)
+    return {
+        "mode": mode,
+        "cameras": n,
+        "rss_mb": [w["Rss"] for w in workers],
+        "pss_mb": [w["Pss"] for w in workers],
+        "gpu_mb": worker_gpu,
+        "shared_pss_mb": shared["Pss"] if shared else 0.0,
+        "shared_gpu_mb": shared_gpu,
+        "total_pss_mb": total_pss,
+        "total_gpu_mb": sum(worker_gpu) + shared_gpu,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Camera worker RSS/PSS by launch mode")
+    ap.add_argument("--cameras", default="1,2,4")
+    ap.add_argument("--modes", default=",".join(MODES))
+    ap.add_argument("--weights", help="YOLO .pt weights (default: resources/seg_model.pt)")
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    modes = args.modes.split(",")
+    if "preload" in modes:
+        # must be set before the forkserver starts
+        multiprocessing.get_context("forkserver").set_forkserver_preload(
+            ["eartag_jetson.pipeline.zygote"]
+        )
+
+    results = []
+    # "shared": the preload zygote or the inference server
+    print(f"{'mode':<11}{'cams':>5}{'RSS/worker':>12}{'PSS/worker':>12}{'GPU/worker':>12}"
+          f"{'shared PSS':>12}{'shared GPU':>12}{'total PSS':>11}{'total GPU':>11}")
+    for mode in modes:
+        for n in (int(x) for x in args.cameras.split(",")):
+            r = measure(mode, n, args.weights)
+            results.append(r)
+            print(f"{mode:<11}{n:>5}{np.mean(r['rss_mb']):>12.0f}{np.mean(r['pss_mb']):>12.0f}"
+                  f"{np.mean(r['gpu_mb']):>12.0f}{r['shared_pss_mb']:>12.0f}"
+                  f"{r['shared_gpu_mb']:>12.0f}{r['total_pss_mb']:>11.0f}{r['total_gpu_mb']:>11.0f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
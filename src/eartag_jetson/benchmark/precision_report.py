@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# benchmark/precision_report.py
+"""
+Accuracy vs latency of the YOLO builds (fp32 .pt / .engine, fp16 and int8
+engines, int8 ONNX) on a held-out clip, to choose EARTAG_PRECISION per
+deployment.
+
+Every build runs over the same frames (at the pipeline's detect_scale).
+Accuracy is measured against the reference build (the first one, fp32 by
+default): boxes are matched greedily at IoU ≥ 0.5 per frame, giving
+precision / recall / F1 and the mean confidence shift of the matched boxes.
+Latency is the per-frame model call, after a few warm-up frames.
+
+    python3 precision_report.py --clip saved_videos/video6_single.avi --json precision.json
+
+Leave the clip out of the calibration frames (quantize.py calib --exclude).
+"""
+import os
+os.environ['GLOG_minloglevel'] = '2'
+
+import json
+import time
+import argparse
+import numpy as np
+from eartag_jetson.common.capture import FrameScaler, open_capture
+from eartag_jetson.pipeline.inference_server import yolo_dets
+from eartag_jetson.pipeline.tracker import iou
+
+WARMUP   = 5
+IOU_HIT  = 0.5
+
+
+def builds(weights: str) -> list[tuple[str, str]]:
+    """(label, path) of every build next to `weights` that exists, fp32 first."""
+    from eartag_jetson.pipeline.model_cache import engine_path, onnx_int8_path
+    found = [("fp32-pt", weights)]
+    for label, path in (
+        ("fp32-engine", engine_path(weights)),
+        ("fp16-engine", engine_path(weights, "fp16")),
+        ("int8-engine", engine_path(weights, "int8")),
+        ("int8-onnx", onnx_int8_path(weights)),
+    ):
+        if os.path.exists(path):
+            found.append((label, path))
+    return found
+
+
+def run_build(path: str, clip: str, *, detect_scale: float, max_frames: int | None):
+    """Boxes per frame and model latency (ms) per frame of one build."""
+    from ultralytics import YOLO
+    model = YOLO(path, task="detect")
+    scaler = FrameScaler(detect_scale)
+    cap, _ = open_capture(clip)
+    dets, lat = [], []
+    try:
+        while max_frames is None or len(dets) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            small = scaler(frame)
+            t0 = time.perf_counter()
+            result = model(small, verbose=False)[0]
+            dt = (time.perf_counter() - t0) * 1000.0
+            dets.append(yolo_dets(result))
+            if len(dets) > WARMUP:
+                lat.append(dt)
+    finally:
+        cap.release()
+    return dets, lat
+
+
+def agreement(ref: list, test: list) -> dict[str, float]:
+    """Per-frame greedy IoU matching of `test` boxes against `ref` boxes."""
+    tp = fp = fn = 0
+    dconf = []
+    for r_boxes, t_boxes in zip(ref, test):
+        pairs = sorted(
+            ((iou(r, t), ri, ti) for ri, r in enumerate(r_boxes) for ti, t in enumerate(t_boxes)),
+            reverse=True,
+        )
+        used_r, used_t = set(), set()
+        for overlap, ri, ti in pairs:
+            if overlap < IOU_HIT:
+                break
+            if ri in used_r or ti in used_t:
+                continue
+            used_r.add(ri)
+            used_t.add(ti)
+            dconf.append(abs(r_boxes[ri][4] - t_boxes[ti][4]))
+        tp += len(used_r)
+        fn += len(r_boxes) - len(used_r)
+        fp += len(t_boxes) - len(used_t)
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "conf_shift": float(np.mean(dconf)) if dconf else 0.0,
+    }
+
+
+def main():
+    from eartag_jetson.pipeline.model_cache import default_weights
+    ap = argparse.ArgumentParser(description="YOLO build accuracy vs latency on a held-out clip")
+    ap.add_argument("--clip", required=True, help="held-out video (not used for calibration)")
+    ap.add_argument("--weights", help="YOLO .pt weights (default: resources/seg_model.pt)")
+    ap.add_argument("--builds", help="comma-separated model files (default: all builds found)")
+    ap.add_argument("--detect-scale", type=float, default=1.0)
+    ap.add_argument("--frames", type=int, help="stop after N frames")
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    weights = args.weights or default_weights()
+    if args.builds:
+        todo = [(os.path.basename(p), p) for p in args.builds.split(",")]
+    else:
+        todo = builds(weights)
+
+    results, ref = [], None
+    print(f"{'build':<14}{'MB':>7}{'p50 ms':>9}{'p95 ms':>9}{'prec':>7}{'recall':>8}{'F1':>7}{'Δconf':>8}")
+    for label, path in todo:
+        dets, lat = run_build(path, args.clip, detect_scale=args.detect_scale, max_frames=args.frames)
+        if ref is None:
+            ref = dets
+        r = {
+            "build": label,
+            "path": path,
+            "size_mb": os.path.getsize(path) / 1e6,
+            "frames": len(dets),
+            "p50_ms": float(np.percentile(lat, 50)) if lat else 0.0,
+            "p95_ms": float(np.percentile(lat, 95)) if lat else 0.0,
+            **agreement(ref, dets),
+        }
+        results.append(r)
+        print(f"{label:<14}{r['size_mb']:>7.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+              f"{r['precision']:>7.3f}{r['recall']:>8.3f}{r['f1']:>7.3f}{r['conf_shift']:>8.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"clip": args.clip, "reference": todo[0][0], "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
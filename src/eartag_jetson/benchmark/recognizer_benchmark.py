@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# benchmark/recognizer_benchmark.py
+"""
+Throughput and accuracy of the tag recognizers (recognizer.py) on labeled
+crops (a labels.tsv, see train_digit_ocr.py).
+
+Every recognizer reads the same crops in batches of --batch, the way
+read_crops() hands them over per frame:
+
+    paddle       PaddleOCR with text detection (the camera workers' path)
+    paddle-rec   PaddleOCR angle classifier + recognizer only (inference server)
+    digits       the digit-only CTC model on onnxruntime
+
+Reported per recognizer: crops/s, batch latency p50/p95 (after one warm-up
+batch), exact-match accuracy, per-character accuracy (same length reads)
+and the share of crops with no read at all. With --coarse every recognizer
+also runs coarse-to-fine at that height, with the share of escalated crops.
+
+    python3 recognizer_benchmark.py --labels val/labels.tsv --coarse 64 --json recognizers.json
+"""
+import os
+os.environ['GLOG_minloglevel'] = '2'
+
+import json
+import time
+import argparse
+import numpy as np
+from eartag_jetson.pipeline.recognizer import (
+    DIGIT_MODEL, ESCALATE_CONF, DigitRecognizer, PaddleRecognizer, TieredRecognizer,
+)
+from eartag_jetson.pipeline.train_digit_ocr import load_crops
+
+RECOGNIZERS = ("paddle", "paddle-rec", "digits")
+
+
+def make(kind: str, *, workers: int, digit_model: str):
+    if kind == "digits":
+        return DigitRecognizer(digit_model)
+    from eartag_jetson.pipeline.model_cache import load_ocr
+    rec = PaddleRecognizer(load_ocr(), detect_text=kind == "paddle", workers=workers,
+                           make_ocr=lambda: load_ocr(threads=1))
+    rec.set_workers(workers)
+    return rec
+
+
+def run(recognizer, crops, texts, batch: int) -> dict:
+    recognizer.read(crops[:batch])                      # warm-up
+    if isinstance(recognizer, TieredRecognizer):
+        recognizer.take_counts()
+    lat, reads = [], []
+    t0 = time.perf_counter()
+    for i in range(0, len(crops), batch):
+        tb = time.perf_counter()
+        reads.extend(recognizer.read(crops[i:i + batch]))
+        lat.append((time.perf_counter() - tb) * 1000.0)
+    wall = time.perf_counter() - t0
+
+    exact = chars = n_chars = missing = 0
+    for read, text in zip(reads, texts):
+        if read is None:
+            missing += 1
+            n_chars += len(text)
+            continue
+        exact += read[0] == text
+        n_chars += len(text)
+        if len(read[0]) == len(text):
+            chars += sum(a == b for a, b in zip(read[0], text))
+    n = len(crops)
+    return {
+        "crops": n,
+        "crops_per_s": n / wall if wall > 0 else 0.0,
+        "p50_ms": float(np.percentile(lat, 50)),
+        "p95_ms": float(np.percentile(lat, 95)),
+        "exact": exact / n,
+        "char": chars / n_chars if n_chars else 0.0,
+        "no_read": missing / n,
+        "escalated": (recognizer.take_counts()["ocr_escalated"] / n
+                      if isinstance(recognizer, TieredRecognizer) else None),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tag recognizer throughput and accuracy on labeled crops")
+    ap.add_argument("--labels", required=True, help="labels.tsv of held-out crops")
+    ap.add_argument("--recognizers", default=",".join(RECOGNIZERS))
+    ap.add_argument("--batch", type=int, default=8, help="crops per read() call (boxes per frame)")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="PaddleOCR instances, one thread each")
+    ap.add_argument("--digit-model", default=DIGIT_MODEL)
+    ap.add_argument("--coarse", type=int, default=0, help="also run coarse-to-fine at this crop height")
+    ap.add_argument("--escalate-conf", type=float, default=ESCALATE_CONF)
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    crops, texts = load_crops(args.labels)
+    if not crops:
+        raise SystemExit(f"No labeled crops in {args.labels}")
+
+    results = []
+    print(f"{'recognizer':<16}{'crops/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'exact':>8}{'char':>8}{'none':>7}{'esc':>7}")
+    for kind in args.recognizers.split(","):
+        for coarse in (0, args.coarse) if args.coarse else (0,):
+            recognizer = make(kind, workers=args.workers, digit_model=args.digit_model)
+            label = kind
+            if coarse:
+                recognizer = TieredRecognizer(recognizer, height=coarse, min_conf=args.escalate_conf)
+                label = f"{kind}@{coarse}"
+            try:
+                r = {"recognizer": label, **run(recognizer, crops, texts, args.batch)}
+            finally:
+                recognizer.close()
+            results.append(r)
+            esc = f"{r['escalated']:>7.3f}" if r["escalated"] is not None else f"{'-':>7}"
+            print(f"{label:<16}{r['crops_per_s']:>9.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+                  f"{r['exact']:>8.3f}{r['char']:>8.3f}{r['no_read']:>7.3f}{esc}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"labels": args.labels, "batch": args.batch, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# benchmark/run_benchmark.py
+"""
+CPU-only accuracy + throughput regression benchmark.
+
+Runs every pipeline configuration over a manifest of labeled clips (see
+synthetic.py for the format, or hand-write one for recorded sessions) and
+reports fps, p50/p95 per-stage latency (capture, decode, yolo, crop, ocr,
+aggregate), peak RSS and tag-ordering accuracy. Each configuration runs in
+its own spawned process so peak RSS is per configuration.
+
+    python3 run_benchmark.py --manifest /tmp/eartag_bench/manifest.json \
+        --json results.json --baseline last_release.json
+"""
+import os
+os.environ['GLOG_minloglevel'] = '2'
+os.environ['CUDA_VISIBLE_DEVICES'] = ''     # benchmark is CPU-only by design
+
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import numpy as np
+from eartag_jetson.common.capture import open_capture, read_timed
+from eartag_jetson.common.common_utils import get_logger
+from eartag_jetson.common.metrics import Metrics
+from eartag_jetson.pipeline.multi_detector import StallMultiDetector
+from eartag_jetson.pipeline.roster import HerdRoster
+from eartag_jetson.pipeline.summary import new_agg, build_summary, ordering_accuracy
+from eartag_jetson.pipeline.tracker import SETTLE_P
+
+STAGES = ("capture", "decode", "yolo", "crop", "ocr", "aggregate")
+
+# multi/single-default  edge/dedupe values shipped in the two pipeline scripts
+# multi-detect-1/4      YOLO at a quarter of the capture, OCR on full-res crops
+# multi-per-read        old per-read aggregation, no tag tracker
+# multi-no-settle       tracking without settling
+# multi-pipelined       YOLO/OCR of consecutive frames overlapped (stage_executor.py)
+# multi-coarse-64       OCR on 64 px crops first, full resolution for doubtful reads
+# multi-budget-150      per-frame budget the detector degrades to meet (deadline.py)
+DEFAULT_CONFIGS = [
+    {"name": "multi-default",  "edge_margin": 500, "close_thresh": 250, "top_n": 4},
+    {"name": "single-default", "edge_margin": 350, "close_thresh": 250, "top_n": 4},
+    {"name": "multi-detect-1/4", "edge_margin": 500, "close_thresh": 250, "top_n": 4,
+     "detect_scale": 0.25},
+    {"name": "multi-per-read", "edge_margin": 500, "close_thresh": 250, "top_n": 4,
+     "track": False},
+    {"name": "multi-no-settle", "edge_margin": 500, "close_thresh": 250, "top_n": 4,
+     "settle_p": 1.0},
+    {"name": "multi-pipelined", "edge_margin": 500, "close_thresh": 250, "top_n": 4,
+     "stages": {"yolo": 1, "ocr": 1}},
+    {"name": "multi-coarse-64", "edge_margin": 500, "close_thresh": 250, "top_n": 4,
+     "coarse_height": 64},
+    {"name": "multi-budget-150", "edge_margin": 500, "close_thresh": 250, "top_n": 4,
+     "frame_budget_ms": 150},
+]
+
+
+def _new_agg(config):
+    if config.get("track", True):
+        return new_agg(tracked=True, settle_p=config.get("settle_p", SETTLE_P))
+    return new_agg()
+
+
+def _summary(agg, info, config) -> list[str]:
+    return build_summary(
+        agg,
+        frame_width=info.width,
+        edge_margin=config["edge_margin"],
+        close_thresh=config["close_thresh"],
+        top_n=config["top_n"],
+    )
+
+
+def run_clip_pipelined(detector, clip, config, timings, utilization):
+    """
+    `run_clip` through the detector's StageExecutor (configs with "stages").
+    Stages overlap, so their latencies come from the detector's Metrics
+    (see run_config) and the busy share per stage is appended to `utilization`.
+    YOLO always runs here (--oracle-boxes does not apply).
+    """
+    cap, info = open_capture(clip["video"], logger=detector.logger)
+    agg = _new_agg(config)
+    calls0 = detector.metrics.counters.get("ocr_calls", 0)
+    ex = detector.stage_executor(agg).start()
+    frames = 0
+    try:
+        while True:
+            ret, frame, grab_s, decode_s, ts = read_timed(cap)
+            if not ret:
+                break
+            timings["capture"].append(grab_s * 1000.0)
+            timings["decode"].append(decode_s * 1000.0)
+            ex.submit((frame, ts))
+            ex.poll()
+            frames += 1
+    finally:
+        ex.close()
+        cap.release()
+    utilization.append(ex.utilization())
+    ocr_reads = int(detector.metrics.counters.get("ocr_calls", 0) - calls0)
+    return frames, ocr_reads, _summary(agg, info, config)
+
+
+def run_clip(detector, clip, config, oracle_boxes, timings, *, max_frames: int | None = None):
+    cap, info = open_capture(clip["video"], logger=detector.logger)
+
+    agg = _new_agg(config)
+    deadline = detector.deadline
+    frames = ocr_reads = 0
+    try:
+        while max_frames is None or frames < max_frames:
+            ret, frame, grab_s, decode_s, _ = read_timed(cap)
+            if not ret:
+                break
+            if deadline is not None and not deadline.process_frame():
+                deadline.skipped()
+                frames += 1
+                continue
+            t1 = time.perf_counter()
+            if oracle_boxes:
+                dets = [(*box, 1.0) for box in clip["boxes"][frames]]
+            else:
+                dets = detector.detect(frame)
+            t2 = time.perf_counter()
+            tracks, todo = detector.pending(dets, agg)
+            crops = detector.crop(frame, [dets[i] for i in todo])
+            t3 = time.perf_counter()
+            reads = detector.scatter(detector.read_crops(crops), todo, len(dets))
+            ocr_reads += len(crops)
+            t4 = time.perf_counter()
+            detector.aggregate(dets, reads, agg, tracks)
+            t5 = time.perf_counter()
+
+            for stage, dt in zip(STAGES, (grab_s, decode_s, t2 - t1, t3 - t2, t4 - t3, t5 - t4)):
+                timings[stage].append(dt * 1000.0)
+            if deadline is not None:
+                deadline.observe((t5 - t1) * 1000.0)
+            frames += 1
+    finally:
+        cap.release()
+
+    return frames, ocr_reads, _summary(agg, info, config)
+
+
+def run_config(config, clips, weights, oracle_boxes) -> dict:
+    """Benchmark one configuration over all clips (runs in a child process)."""
+    logger = get_logger(f"bench-{config['name']}", logging.WARNING)
+    detector = StallMultiDetector(
+        caps={},
+        api_endpoint="",
+        min_detections=0,
+        streak_threshold=0,
+        logger=logger,
+        weights=weights,
+        detect_scale=config.get("detect_scale", 1.0),
+        roster=HerdRoster.from_file(config["roster"]) if config.get("roster") else None,
+        stage_workers=config.get("stages"),
+        coarse_height=config.get("coarse_height", 0),
+        frame_budget_ms=config.get("frame_budget_ms", 0.0),
+        # every stage time of the run stays in the ring (pipelined configs)
+        metrics=Metrics(camera=config["name"], window=1 << 18),
+    )
+    pipelined = config.get("stages") is not None
+
+    timings = {s: [] for s in STAGES}
+    utilization = []
+    per_clip, total_frames, total_reads = [], 0, 0
+    start = time.perf_counter()
+    try:
+        for clip in clips:
+            if pipelined:
+                frames, ocr_reads, tags = run_clip_pipelined(detector, clip, config, timings,
+                                                             utilization)
+            else:
+                frames, ocr_reads, tags = run_clip(detector, clip, config, oracle_boxes, timings)
+            total_frames += frames
+            total_reads += ocr_reads
+            per_clip.append({
+                "name": clip.get("name", clip["video"]),
+                "frames": frames,
+                "ocr_reads": ocr_reads,
+                "truth": clip["tags"],
+                "pred": tags,
+                "accuracy": ordering_accuracy(tags, clip["tags"]),
+            })
+    finally:
+        detector.shutdown()
+    wall = time.perf_counter() - start
+    if pipelined:
+        for stage in ("yolo", "crop", "ocr", "aggregate"):
+            hist = detector.metrics.hists.get(stage)
+            timings[stage] = hist.values() if hist is not None else []
+
+    return {
+        "config": config["name"],
+        "frames": total_frames,
+        "fps": total_frames / wall if wall else 0.0,
+        "ocr_per_frame": total_reads / total_frames if total_frames else 0.0,
+        # share of coarse reads re-run at full resolution (coarse configs)
+        "ocr_escalation": detector.metrics.gauges.get("ocr_escalation_rate", 0.0),
+        # degradation level at the end of the run and frames dropped to meet the budget
+        "degrade_level": detector.metrics.gauges.get("degrade_level", 0),
+        "frames_skipped": int(detector.metrics.counters.get("frames_skipped", 0)),
+        "utilization": {
+            name: float(np.mean([u[name] for u in utilization])) for name in utilization[0]
+        } if utilization else {},
+        "latency_ms": {
+            s: {
+                "p50": float(np.percentile(v, 50)) if v else 0.0,
+                "p95": float(np.percentile(v, 95)) if v else 0.0,
+            }
+            for s, v in timings.items()
+        },
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        "accuracy": float(np.mean([c["accuracy"] for c in per_clip])) if per_clip else 0.0,
+        "exact": float(np.mean([c["pred"] == c["truth"] for c in per_clip])) if per_clip else 0.0,
+        "clips": per_clip,
+    }
+
+
+def print_report(results):
+    head = f"{'config':<18}{'fps':>7}{'ocr/f':>7}{'acc':>7}{'exact':>7}{'rss MB':>9}  " + "  ".join(
+        f"{s + ' p50/p95':>20}" for s in STAGES
+    )
+    print(head)
+    print("─" * len(head))
+    for r in results:
+        lat = "  ".join(
+            f"{r['latency_ms'][s]['p50']:>9.1f}/{r['latency_ms'][s]['p95']:<10.1f}" for s in STAGES
+        )
+        print(f"{r['config']:<18}{r['fps']:>7.2f}{r['ocr_per_frame']:>7.2f}{r['accuracy']:>7.2f}{r['exact']:>7.2f}"
+              f"{r['peak_rss_mb']:>9.0f}  {lat}")
+
+
+def compare_to_baseline(results, baseline, fps_tolerance) -> list[str]:
+    """Return a description of every regression against a previous results file."""
+    base = {r["config"]: r for r in baseline}
+    problems = []
+    for r in results:
+        b = base.get(r["config"])
+        if b is None:
+            continue
+        if r["fps"] < b["fps"] * (1.0 - fps_tolerance):
+            problems.append(f"{r['config']}: fps {r['fps']:.2f} < baseline {b['fps']:.2f}")
+        if r["accuracy"] < b["accuracy"]:
+            problems.append(f"{r['config']}: accuracy {r['accuracy']:.2f} < baseline {b['accuracy']:.2f}")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description="CPU-only ear-tag pipeline benchmark")
+    ap.add_argument("--manifest", required=True, help="clip manifest (JSON list)")
+    ap.add_argument("--configs", help="JSON list of configurations (default: shipped values)")
+    ap.add_argument("--weights", help="YOLO .pt weights (default: resources/seg_model.pt)")
+    ap.add_argument("--oracle-boxes", action="store_true",
+                    help="use the manifest's ground-truth boxes instead of YOLO")
+    ap.add_argument("--json", help="write results to this file")
+    ap.add_argument("--baseline", help="fail if results regress against this results file")
+    ap.add_argument("--fps-tolerance", type=float, default=0.10,
+                    help="allowed relative fps drop vs the baseline")
+    args = ap.parse_args()
+
+    with open(args.manifest) as f:
+        clips = json.load(f)
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+
+    results = []
+    for config in configs:
+        # fresh process per config → honest peak RSS, no warm caches carried over
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            results.append(
+                pool.submit(run_config, config, clips, args.weights, args.oracle_boxes).result()
+            )
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare_to_baseline(results, json.load(f), args.fps_tolerance)
+        for p in problems:
+            print(f"[REGRESSION] {p}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# common/capture.py
+"""
+Capture backend and metadata, negotiated once when a camera/video is opened.
+
+`CaptureInfo` records what the device actually delivers (resolution, fps,
+fourcc, backend) plus the detection downscale factor. Pixel settings such as
+EDGE_MARGIN and CLOSE_THRESH are expressed at REFERENCE_WIDTH (the 4608 px
+capture they were tuned on); stages convert them with `scale_px`, so running
+the camera at a lower resolution keeps the filters meaning the same thing.
+
+`open_capture` picks the backend: an explicit GStreamer pipeline (MJPEG
+decoded by nvjpegdec on the Jetson, appsink keeping only the newest frame),
+then V4L2 with a one-frame buffer, then OpenCV's default. `read_timed`
+splits each read into grab and retrieve time for the metrics; retrieve is
+the decode for V4L2 / FFmpeg captures, but only a buffer copy out of the
+appsink for GStreamer ones. GStreamer decodes inside the pipeline before
+grab returns and its decode time is not measured on its own, so there grab
+is reported as "capture+decode" and retrieve as "retrieve"
+(`CaptureInfo.grab_stage` / `decode_stage`).
+"""
+import os
+import time
+import logging
+from dataclasses import dataclass, replace
+import cv2
+
+REFERENCE_WIDTH  = 4608        # width the pixel settings are expressed at
+REFERENCE_HEIGHT = 2592
+CAPTURE_BACKEND  = os.environ.get("EARTAG_CAPTURE_BACKEND", "auto")
+CAPTURE_FORMAT   = os.environ.get("EARTAG_CAPTURE_FORMAT", "MJPG")
+
+
+@dataclass(frozen=True)
+class CaptureInfo:
+    source: str
+    width: int
+    height: int
+    fps: float = 0.0
+    fourcc: str = ""
+    backend: str = ""
+    detect_scale: float = 1.0     # detection runs on a frame downscaled by this
+
+    @property
+    def grab_stage(self) -> str:
+        """
+        Metrics stage for read_timed's grab time: "capture", or
+        "capture+decode" for GStreamer, whose wait for the frame includes
+        the decode (nvjpegdec / jpegdec run before the appsink).
+        """
+        return "capture+decode" if self.backend.startswith("gstreamer") else "capture"
+
+    @property
+    def decode_stage(self) -> str:
+        """
+        Metrics stage for read_timed's retrieve time: "decode" where retrieve
+        decodes (V4L2, FFmpeg, OpenCV default), "retrieve" for GStreamer,
+        whose pipeline has decoded the frame before grab returns.
+        """
+        return "retrieve" if self.backend.startswith("gstreamer") else "decode"
+
+    @property
+    def ref_scale(self) -> float:
+        """Capture pixels per reference pixel."""
+        return self.width / REFERENCE_WIDTH
+
+    def scale_px(self, ref_px: float) -> float:
+        """Convert a distance given at REFERENCE_WIDTH into capture pixels."""
+        return ref_px * self.ref_scale
+
+    def norm_x(self, x: float) -> float:
+        return x / self.width
+
+    def with_detect_scale(self, scale: float) -> "CaptureInfo":
+        return replace(self, detect_scale=scale)
+
+
+def _fourcc_str(code: float) -> str:
+    code = int(code)
+    return "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4)).strip("\x00 ")
+
+
+def negotiate(cap: cv2.VideoCapture, source, *, width: int | None = None,
+              height: int | None = None, fps: float | None = None,
+              backend: str | None = None,
+              logger: logging.Logger | None = None) -> CaptureInfo:
+    """
+    Request `width`×`height`@`fps` (when given) and read back what the device
+    accepted. If the backend can't report a size, one frame is grabbed to
+    measure it.
+    """
+    logger = logger or logging.getLogger(__name__)
+    if width and height:
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    if fps:
+        cap.set(cv2.CAP_PROP_FPS, fps)
+
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    if not (w and h):
+        ret, frame = cap.read()
+        if not ret:
+            raise IOError(f"Cannot read a frame from {source} to measure its size")
+        h, w = frame.shape[:2]
+
+    if backend is None:
+        try:
+            backend = cap.getBackendName()
+        except cv2.error:
+            backend = ""
+    info = CaptureInfo(
+        source=str(source),
+        width=w,
+        height=h,
+        fps=cap.get(cv2.CAP_PROP_FPS) or 0.0,
+        fourcc=_fourcc_str(cap.get(cv2.CAP_PROP_FOURCC)),
+        backend=backend,
+    )
+    if width and (w, h) != (width, height):
+        logger.warning(f"{source}: asked for {width}x{height}, got {w}x{h}")
+    logger.info(
+        f"{source}: {info.width}x{info.height} @ {info.fps:.1f} fps, "
+        f"fourcc={info.fourcc or '?'}, backend={info.backend or '?'}"
+    )
+    return info
+
+
+def _device_path(source) -> str:
+    if isinstance(source, int) or (isinstance(source, str) and source.isdigit()):
+        return f"/dev/video{int(source)}"
+    return str(source)
+
+
+def _caps(media: str, width, height, fps) -> str:
+    caps = media
+    if width and height:
+        caps += f",width={width},height={height}"
+    if fps:
+        caps += f",framerate={int(fps)}/1"
+    return caps
+
+
+def gst_pipeline(source, *, fmt: str = "MJPG", decoder: str = "nvjpegdec",
+                 width: int | None = None, height: int | None = None,
+                 fps: float | None = None) -> str:
+    """
+    Explicit GStreamer pipeline ending in a BGR appsink that keeps only the
+    newest frame (drop=true max-buffers=1 sync=false), so a slow consumer
+    never works through a backlog of stale frames.
+
+    `source` is a V4L2 device (index or /dev/videoN) or "videotestsrc"
+    (synthetic frames for tests, no camera needed). `fmt` is MJPG (decoded by
+    `decoder`: nvjpegdec on Jetson, jpegdec in software) or YUY2.
+    """
+    sink = "videoconvert ! video/x-raw,format=BGR ! appsink drop=true max-buffers=1 sync=false"
+    if str(source).startswith("videotestsrc"):
+        return f"{source} is-live=true ! {_caps('video/x-raw', width, height, fps)} ! {sink}"
+
+    src = f"v4l2src device={_device_path(source)} io-mode=2"
+    if fmt.upper() in ("MJPG", "MJPEG"):
+        return f"{src} ! {_caps('image/jpeg', width, height, fps)} ! {decoder} ! {sink}"
+    if fmt.upper() == "YUY2":
+        return f"{src} ! {_caps('video/x-raw,format=YUY2', width, height, fps)} ! {sink}"
+    raise ValueError(f"Unsupported capture format {fmt!r}")
+
+
+def has_gstreamer() -> bool:
+    """True if this OpenCV build can open GStreamer pipelines."""
+    for line in cv2.getBuildInformation().splitlines():
+        if line.strip().startswith("GStreamer:"):
+            return "YES" in line
+    return False
+
+
+def _attempts(source, backend: str, fmt: str, width, height, fps):
+    """(label, VideoCapture args, needs property negotiation) in fallback order."""
+    if str(source).startswith("videotestsrc"):
+        return [("gstreamer/test", (gst_pipeline(source, width=width, height=height, fps=fps),
+                                    cv2.CAP_GSTREAMER), False)]
+    is_device = isinstance(source, int) or str(source).isdigit() or str(source).startswith("/dev/")
+    if not is_device:                      # file or URL → FFmpeg
+        return [("file", (str(source),), False)]
+
+    attempts = []
+    if backend in ("auto", "gstreamer") and has_gstreamer():
+        for label, fmt_, dec in (("gstreamer/nvjpegdec", "MJPG", "nvjpegdec"),
+                                 ("gstreamer/jpegdec", "MJPG", "jpegdec"),
+                                 ("gstreamer/yuy2", "YUY2", "")):
+            if fmt.upper() == "YUY2" and fmt_ == "MJPG":
+                continue
+            pipe = gst_pipeline(source, fmt=fmt_, decoder=dec, width=width, height=height, fps=fps)
+            attempts.append((label, (pipe, cv2.CAP_GSTREAMER), False))
+    index = int(source) if str(source).isdigit() else _device_path(source)
+    if backend in ("auto", "v4l2"):
+        attempts.append(("v4l2", (index, cv2.CAP_V4L2), True))
+    if backend in ("auto", "default"):
+        attempts.append(("default", (index,), True))
+    return attempts
+
+
+def open_capture(source, *, width: int | None = None, height: int | None = None,
+                 fps: float | None = None, backend: str | None = None,
+                 fmt: str | None = None,
+                 logger: logging.Logger | None = None) -> tuple[cv2.VideoCapture, CaptureInfo]:
+    """
+    Open `source` and negotiate its format once.
+
+    `source` is a device (index or /dev/videoN), a video file / URL, or a
+    "videotestsrc …" element. Devices try, in order: an explicit GStreamer
+    pipeline (MJPEG with hardware then software decode, then YUY2), V4L2 with
+    the requested FOURCC and a one-frame buffer, and OpenCV's default backend.
+    `backend` (auto | gstreamer | v4l2 | default) and `fmt` (MJPG | YUY2)
+    default to EARTAG_CAPTURE_BACKEND / EARTAG_CAPTURE_FORMAT.
+    """
+    logger  = logger or logging.getLogger(__name__)
+    backend = (backend or CAPTURE_BACKEND).lower()
+    fmt     = fmt or CAPTURE_FORMAT
+    for label, args, set_props in _attempts(source, backend, fmt, width, height, fps):
+        cap = cv2.VideoCapture(*args)
+        if not cap.isOpened():
+            logger.debug(f"{source}: {label} backend failed to open")
+            cap.release()
+            continue
+        if set_props:
+            fourcc = "MJPG" if fmt.upper() in ("MJPG", "MJPEG") else fmt.upper()
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)          # newest frame, not a queue
+            info = negotiate(cap, source, width=width, height=height, fps=fps,
+                             backend=label, logger=logger)
+        else:
+            info = negotiate(cap, source, backend=label, logger=logger)
+        return cap, info
+    raise IOError(f"Cannot open {source} (backend={backend}, format={fmt})")
+
+
+def read_timed(cap: cv2.VideoCapture):
+    """
+    `cap.read()` split into grab (wait for / dequeue the next frame) and
+    retrieve (decode + convert to BGR; a copy only on GStreamer, see
+    CaptureInfo.decode_stage); returns (ret, frame, grab_s, decode_s, ts),
+    `ts` being the wall-clock time the frame was grabbed.
+    """
+    t0 = time.perf_counter()
+    if not cap.grab():
+        return False, None, time.perf_counter() - t0, 0.0, time.time()
+    ts = time.time()
+    t1 = time.perf_counter()
+    ret, frame = cap.retrieve()
+    return ret, frame, t1 - t0, time.perf_counter() - t1, ts
+
+
+class FrameScaler:
+    """
+    Dual-resolution frame path: detection sees an INTER_AREA downscaled copy
+    written into one reused buffer, while crops are still cut from the full
+    frame. `scale` is the detection size as a fraction of the capture
+    (1.0 = detect on the full frame, no copy).
+    """
+
+    def __init__(self, scale: float = 1.0):
+        if not 0.0 < scale <= 1.0:
+            raise ValueError(f"detect scale must be in (0, 1], got {scale}")
+        self.scale = scale
+        self._buf = None
+
+    def __call__(self, frame):
+        """The frame detection should run on (the reused buffer when scaling)."""
+        if self.scale == 1.0:
+            return frame
+        h, w = frame.shape[:2]
+        size = (max(1, round(w * self.scale)), max(1, round(h * self.scale)))
+        if self._buf is not None and self._buf.shape != (size[1], size[0], *frame.shape[2:]):
+            self._buf = None         # capture size changed; reallocate once
+        self._buf = cv2.resize(frame, size, dst=self._buf, interpolation=cv2.INTER_AREA)
+        return self._buf
+
+    def to_full(self, dets, width: int, height: int) -> list[tuple[int, int, int, int, float]]:
+        """Map (x0, y0, x1, y1, conf) boxes from the detection frame back to full resolution."""
+        if self.scale == 1.0:
+            return dets
+        inv = 1.0 / self.scale
+        return [
+            (
+                max(0, int(x0 * inv)), max(0, int(y0 * inv)),
+                min(width, int(round(x1 * inv))), min(height, int(round(y1 * inv))),
+                conf,
+            )
+            for (x0, y0, x1, y1, conf) in dets
+        ]
@@ -6,52 +6,14 @@ from typing import Sequence, Union
 import shutil
 from ultralytics import YOLO
 import torch
-from colorama import Fore, Style, init
 from datetime import datetime, timezone
 from serial import SerialException, SerialTimeoutException
 import json
 import logging
 from logging import Logger
 
-init(autoreset=True)
-
-from colorama import Fore, Style
-import logging
-
-class ColorFormatter(logging.Formatter):
-    def format(self, record):
-        level_color = {
-            "DEBUG": Fore.BLUE,
-            "INFO": Fore.GREEN,
-            "WARNING": Fore.YELLOW,
-            "ERROR": Fore.RED,
-            "CRITICAL": Fore.RED + Style.BRIGHT,
-        }.get(record.levelname, "")
-
-        fmt = (
-            f"{Fore.WHITE}[%(asctime)s]{Style.RESET_ALL} "
-            f"{level_color}[%(levelname)s]{Style.RESET_ALL} "
-            f"{Fore.YELLOW}[%(processName)s]{Style.RESET_ALL} "
-            f"{Fore.CYAN}%(filename)s{Style.RESET_ALL} "
-            f"- %(message)s"
-        )
-        formatter = logging.Formatter(fmt, datefmt="%Y-%m-%d %H:%M:%S")
-        return formatter.format(record)
-
-def get_logger(name: str = __name__, level: int = logging.INFO) -> logging.Logger:
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
-    logger.propagate = False
-
-    # clear any old handlers so you don’t double-log
-    if logger.hasHandlers():
-        logger.handlers.clear()
-
-    handler = logging.StreamHandler()
-    handler.setFormatter(ColorFormatter())
-    logger.addHandler(handler)
-
-    return logger
+# re-exported: the pipelines import get_logger from here
+from eartag_jetson.common.log_utils import ColorFormatter, get_logger  # noqa: F401
 
 
 def find_project_root(
@@ -74,7 +36,7 @@ def find_project_root(
         cur = cur.parent
     raise FileNotFoundError(f"No project root found (checked for {marker_files})")
 
-def export_yolo_to_engine(model, engine_path, logger=None):
+def export_yolo_to_engine(model, engine_path, logger=None, *, precision="fp32", calib_data=None):
     """
     Export a YOLO model to a TensorRT engine, but only if a GPU is available.
     On CPU‐only machines, it will warn and skip the engine export.
@@ -83,6 +45,9 @@ def export_yolo_to_engine(model, engine_path, logger=None):
         model (YOLO): an ultralytics YOLO model instance
         engine_path (str): path where the .engine file should live
         logger (logging.Logger, optional): your logger
+        precision (str): "fp32", "fp16" or "int8"
+        calib_data (str, optional): dataset YAML of calibration frames, required
+            for "int8" (see pipeline/quantize.py)
     """
     if logger is None:
         logger = logging.getLogger(__name__)
@@ -91,22 +56,43 @@ def export_yolo_to_engine(model, engine_path, logger=None):
         logger.warning("No GPU detected; skipping TensorRT engine export.")
         return
 
-    if not os.path.exists(engine_path):
-        logger.info("Exporting model to TensorRT engine…")
-        export_path = model.export(format="engine", device="0")  # returns a string path
+    if precision == "fp32":
+        kwargs = {}
+    elif precision == "fp16":
+        kwargs = {"half": True}
+    elif precision == "int8":
+        if not calib_data:
+            raise ValueError("INT8 export needs calibration data (see pipeline/quantize.py)")
+        kwargs = {"int8": True, "data": calib_data}
+    else:
+        raise ValueError(f"Unknown precision {precision!r}")
+
+    if os.path.exists(engine_path):
+        logger.info(f"Engine already exists at '{engine_path}', skipping export.")
+        return
+
+    # ultralytics always writes <stem>.engine next to the weights: move an
+    # existing fp32 engine aside so an fp16 build can't overwrite it
+    default_path = str(Path(model.ckpt_path).with_suffix(".engine"))
+    parked = None
+    if default_path != engine_path and os.path.exists(default_path):
+        parked = default_path + ".keep"
+        shutil.move(default_path, parked)
+
+    try:
+        logger.info(f"Exporting model to TensorRT engine ({precision})…")
+        export_path = model.export(format="engine", device="0", **kwargs)  # returns a string path
         if export_path and export_path != engine_path:
             shutil.move(export_path, engine_path)
             logger.info(f"Moved exported engine to '{engine_path}'")
         else:
             logger.info(f"Engine already at expected path: {engine_path}")
-    else:
-        logger.info(f"Engine already exists at '{engine_path}', skipping export.")
+    finally:
+        if parked:
+            shutil.move(parked, default_path)
 
-def send_over_esp(ser, password: str, ble_code: str, tags_lr: list[str], end_ts: float, logger: Logger):
-    """
-    Build and transmit the JSON payload over an open serial port.
-    Only the top 4 ear‑tags (by count) are included.
-    """
+def esp_payload(password: str, ble_code: str, tags_lr: list[str], end_ts: float) -> dict:
+    """The JSON payload the ESP32 expects for one session."""
     ear_tag_str = ", ".join(tags_lr)            # preserve caller’s order
 
     # ISO‑8601 timestamp in UTC (milliseconds precision)
@@ -115,19 +101,27 @@ def send_over_esp(ser, password: str, ble_code: str, tags_lr: list[str], end_ts:
         .isoformat(timespec="milliseconds")
         .replace("+00:00", "Z")
     )
-
-    SERIAL_PORT    = "/dev/ttyACM0"
-    BAUD_RATE      = 115200
-    payload = {
+    return {
         "password": password,
         "ble_code": ble_code,
         "time": iso_time,
         "ear_tag": ear_tag_str,
     }
 
+
+def write_payload(ser, payload: dict, logger: Logger):
+    """Write one payload line to the serial port; serial errors propagate."""
+    ser.write((json.dumps(payload) + "\n").encode("utf-8"))
+    ser.flush()
+    logger.info(f"Sent to ESP32 ({payload['ble_code']}): {payload}")
+
+
+def send_over_esp(ser, password: str, ble_code: str, tags_lr: list[str], end_ts: float, logger: Logger):
+    """
+    Build and transmit the JSON payload over an open serial port.
+    Only the top 4 ear‑tags (by count) are included.
+    """
     try:
-        ser.write((json.dumps(payload) + "\n").encode("utf-8"))
-        ser.flush()
-        logger.info(f"Sent to ESP32 ({ble_code}): {payload}")
+        write_payload(ser, esp_payload(password, ble_code, tags_lr, end_ts), logger)
     except (SerialTimeoutException, SerialException) as e:
         logger.error(f"Serial write error: {e}")
\ No newline at end of file
@@ -0,0 +1,143 @@
+# common/log_utils.py
+"""
+Logging for the pipelines.
+
+* `ColorFormatter` builds its per-level formatters once, not per record.
+* `FrameLogSampler` rate-limits per-frame INFO lines to one frame per
+  interval, checked before the log call.
+* `setup_queue_logging` starts a `QueueListener` in the parent process: the
+  single writer for the console and an optional rotating log file. Spawned
+  camera processes hand it the queue via `get_logger(..., queue=q)`, so
+  workers only pay for a queue put.
+"""
+import os
+import time
+import logging
+import multiprocessing
+import logging.handlers
+from colorama import Fore, Style, init
+
+init(autoreset=True)
+
+LOG_FILE_BYTES   = 10 * 1024 * 1024
+LOG_FILE_BACKUPS = 5
+
+
+class ColorFormatter(logging.Formatter):
+    LEVEL_COLORS = {
+        "DEBUG": Fore.BLUE,
+        "INFO": Fore.GREEN,
+        "WARNING": Fore.YELLOW,
+        "ERROR": Fore.RED,
+        "CRITICAL": Fore.RED + Style.BRIGHT,
+    }
+
+    def __init__(self):
+        super().__init__()
+        self._formatters = {
+            level: self._build(color) for level, color in self.LEVEL_COLORS.items()
+        }
+        self._default = self._build("")
+
+    @staticmethod
+    def _build(level_color: str) -> logging.Formatter:
+        fmt = (
+            f"{Fore.WHITE}[%(asctime)s]{Style.RESET_ALL} "
+            f"{level_color}[%(levelname)s]{Style.RESET_ALL} "
+            f"{Fore.YELLOW}[%(processName)s]{Style.RESET_ALL} "
+            f"{Fore.CYAN}%(filename)s{Style.RESET_ALL} "
+            f"- %(message)s"
+        )
+        return logging.Formatter(fmt, datefmt="%Y-%m-%d %H:%M:%S")
+
+    def format(self, record):
+        return self._formatters.get(record.levelname, self._default).format(record)
+
+
+PLAIN_FORMATTER = logging.Formatter(
+    "[%(asctime)s] [%(levelname)s] [%(processName)s] %(filename)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+
+class FrameLogSampler:
+    """
+    Decide once per frame whether that frame's per-frame lines get logged:
+    at most one frame every `interval` seconds (env EARTAG_FRAME_LOG_INTERVAL,
+    default 1 s; 0 logs every frame). Checking before the call keeps skipped
+    frames from even building a LogRecord.
+    """
+
+    def __init__(self, interval: float | None = None):
+        if interval is None:
+            interval = float(os.environ.get("EARTAG_FRAME_LOG_INTERVAL", "1.0"))
+        self.interval = interval
+        self.skipped  = 0
+        self._next    = 0.0
+
+    def __call__(self) -> bool:
+        if self.interval <= 0:
+            return True
+        now = time.monotonic()
+        if now < self._next:
+            self.skipped += 1
+            return False
+        self._next = now + self.interval
+        return True
+
+    def take_skipped(self) -> int:
+        """Frames skipped since the last logged one (resets the count)."""
+        n, self.skipped = self.skipped, 0
+        return n
+
+
+def get_logger(
+    name: str = __name__,
+    level: int = logging.INFO,
+    *,
+    queue=None,
+) -> logging.Logger:
+    """
+    Console logger with colors. With `queue`, records go to the parent's
+    `QueueListener` instead (see `setup_queue_logging`).
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    logger.propagate = False
+
+    # clear any old handlers so you don’t double-log
+    if logger.hasHandlers():
+        logger.handlers.clear()
+
+    if queue is not None:
+        handler = logging.handlers.QueueHandler(queue)
+    else:
+        handler = logging.StreamHandler()
+        handler.setFormatter(ColorFormatter())
+    logger.addHandler(handler)
+
+    return logger
+
+
+def setup_queue_logging(ctx=None, log_file: str | None = None):
+    """
+    Create the shared log queue and start the single writer in this process.
+    Returns (queue, listener); pass the queue to each worker's `get_logger`
+    and call `listener.stop()` on shutdown to flush.
+    """
+    queue = (ctx or multiprocessing).Queue(-1)
+
+    console = logging.StreamHandler()
+    console.setFormatter(ColorFormatter())
+    handlers = [console]
+    if log_file:
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        rotating = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_FILE_BYTES, backupCount=LOG_FILE_BACKUPS
+        )
+        rotating.setFormatter(PLAIN_FORMATTER)
+        handlers.append(rotating)
+
+    listener = logging.handlers.QueueListener(queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return queue, listener
@@ -0,0 +1,220 @@
+# common/metrics.py
+"""
+Lightweight hot-path instrumentation.
+
+Every camera process owns one `Metrics`: stage timers (monotonic
+`perf_counter`, kept in fixed-size ring buffers), counters and gauges. A
+`MetricsDumper` thread writes a JSON snapshot per process every few seconds,
+and the parent process serves all snapshots as Prometheus text from
+`serve_metrics`, so nothing on the hot path does I/O.
+
+    curl http://127.0.0.1:9108/metrics
+"""
+import os
+import json
+import time
+import threading
+from array import array
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_DIR  = os.environ.get("EARTAG_METRICS_DIR", "/tmp/eartag_metrics")
+METRICS_PORT = int(os.environ.get("EARTAG_METRICS_PORT", "9108"))
+
+STAGES = ("capture", "capture+decode", "decode", "retrieve", "yolo", "crop", "ocr", "aggregate", "serial")
+
+
+class RingHistogram:
+    """Last `size` observations in a preallocated ring, plus running sum/count."""
+
+    __slots__ = ("_buf", "_size", "_idx", "count", "total")
+
+    def __init__(self, size: int = 512):
+        self._buf   = array("d", bytes(8 * size))
+        self._size  = size
+        self._idx   = 0
+        self.count  = 0
+        self.total  = 0.0
+
+    def observe(self, value: float):
+        self._buf[self._idx] = value
+        self._idx = (self._idx + 1) % self._size
+        self.count += 1
+        self.total += value
+
+    @property
+    def last(self) -> float:
+        return self._buf[(self._idx - 1) % self._size] if self.count else 0.0
+
+    def values(self) -> list[float]:
+        """The observations still in the ring (oldest first once it wrapped)."""
+        n = min(self.count, self._size)
+        if self.count <= self._size:
+            return list(self._buf[:n])
+        return list(self._buf[self._idx:]) + list(self._buf[:self._idx])
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)) -> dict[str, float]:
+        vals = sorted(self._buf[:min(self.count, self._size)])
+        if not vals:
+            return {str(q): 0.0 for q in qs}
+        return {str(q): vals[min(len(vals) - 1, int(q * len(vals)))] for q in qs}
+
+
+class Metrics:
+    """Per-process timers, counters and gauges for one camera."""
+
+    def __init__(self, camera: str = "default", window: int = 512):
+        self.camera   = camera
+        self.window   = window
+        self.hists: dict[str, RingHistogram] = {}
+        self.counters: dict[str, float] = {}
+        self.gauges: dict[str, float]   = {}
+        self._frame_ts: deque[float] = deque(maxlen=64)   # frame timestamps → fps
+        self._lock = threading.Lock()
+
+    # ─── hot path ────────────────────────────────────────────────────────────
+    def observe(self, stage: str, ms: float):
+        with self._lock:
+            hist = self.hists.get(stage)
+            if hist is None:
+                hist = self.hists[stage] = RingHistogram(self.window)
+            hist.observe(ms)
+
+    def observe_since(self, stage: str, t0: float) -> float:
+        """Record the time since `t0` (a `time.perf_counter()` value); returns now."""
+        now = time.perf_counter()
+        self.observe(stage, (now - t0) * 1000.0)
+        return now
+
+    def inc(self, name: str, n: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def mark_frame(self):
+        with self._lock:
+            self._frame_ts.append(time.perf_counter())
+            self.counters["frames"] = self.counters.get("frames", 0) + 1
+
+    # ─── read side ───────────────────────────────────────────────────────────
+    def fps(self) -> float:
+        with self._lock:
+            ts = list(self._frame_ts)
+        if len(ts) < 2 or ts[-1] <= ts[0]:
+            return 0.0
+        return (len(ts) - 1) / (ts[-1] - ts[0])
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {
+                s: {"count": h.count, "sum": h.total, "quantiles": h.quantiles()}
+                for s, h in self.hists.items()
+            }
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        frames = counters.get("frames", 0)
+        gauges["fps"] = self.fps()
+        gauges["ocr_calls_per_frame"] = counters.get("ocr_calls", 0) / frames if frames else 0.0
+        return {
+            "camera": self.camera,
+            "pid": os.getpid(),
+            "time": time.time(),
+            "stages": stages,
+            "counters": counters,
+            "gauges": gauges,
+        }
+
+
+class MetricsDumper(threading.Thread):
+    """Daemon thread that periodically writes `metrics.snapshot()` as JSON."""
+
+    def __init__(self, metrics: Metrics, directory: str = METRICS_DIR, interval: float = 5.0):
+        super().__init__(name=f"metrics-{metrics.camera}", daemon=True)
+        self.metrics   = metrics
+        self.path      = os.path.join(directory, f"{metrics.camera}.json")
+        self.interval  = interval
+        self._stop_evt = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+
+    def dump(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.metrics.snapshot(), f)
+        os.replace(tmp, self.path)           # readers never see half a file
+
+    def run(self):
+        while not self._stop_evt.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        self._stop_evt.set()
+        self.dump()
+
+
+def load_snapshots(directory: str = METRICS_DIR) -> list[dict]:
+    snaps = []
+    if not os.path.isdir(directory):
+        return snaps
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snaps.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snaps
+
+
+def render_prometheus(snaps: list[dict]) -> str:
+    """Render snapshots in the Prometheus text exposition format."""
+    lines = [
+        "# TYPE eartag_stage_latency_ms summary",
+    ]
+    for snap in snaps:
+        cam = snap["camera"]
+        for stage, h in snap["stages"].items():
+            lbl = f'camera="{cam}",stage="{stage}"'
+            for q, v in h["quantiles"].items():
+                lines.append(f'eartag_stage_latency_ms{{{lbl},quantile="{q}"}} {v:.3f}')
+            lines.append(f"eartag_stage_latency_ms_sum{{{lbl}}} {h['sum']:.3f}")
+            lines.append(f"eartag_stage_latency_ms_count{{{lbl}}} {h['count']}")
+    for kind, key, suffix in (("counter", "counters", "_total"), ("gauge", "gauges", "")):
+        names = sorted({n for s in snaps for n in s[key]})
+        for n in names:
+            metric = f"eartag_{n}{suffix}"
+            lines.append(f"# TYPE {metric} {kind}")
+            for snap in snaps:
+                if n in snap[key]:
+                    lines.append(f'{metric}{{camera="{snap["camera"]}"}} {snap[key][n]}')
+    return "\n".join(lines) + "\n"
+
+
+def serve_metrics(directory: str = METRICS_DIR, port: int = METRICS_PORT,
+                  host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            snaps = load_snapshots(directory)
+            if self.path.startswith("/metrics.json"):
+                body, ctype = json.dumps(snaps).encode(), "application/json"
+            elif self.path.startswith("/metrics"):
+                body, ctype = render_prometheus(snaps).encode(), "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
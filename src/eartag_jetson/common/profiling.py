@@ -0,0 +1,275 @@
+# common/profiling.py
+"""
+On-demand profiling of a single camera worker.
+
+A worker starts a capture for `EARTAG_PROFILE_SECONDS` (default 30) either at
+startup, when its camera id is listed in `EARTAG_PROFILE` ("all" or comma
+separated ids), or whenever it receives SIGUSR1:
+
+    EARTAG_PROFILE=MM2502V0007FMT python3 multi_stream_pipeline.py
+    kill -USR1 <pid of proc-MM2502V0007FMT>
+
+The capture samples the stack of every thread of the process
+(`sys._current_frames()`, `EARTAG_PROFILE_HZ` times a second), so the OCR
+pool and the pipelined stage threads are seen as well as the camera loop.
+Samples whose innermost frame is a wait (queue, lock, event, select) count
+as idle. Only the signalled process pays for profiling. The capture ends
+on a timer in the sampler thread, so a worker stuck inside a frame still
+gets its dump. Each capture is
+dumped as `<camera>_<timestamp>.stacks` (one "thread;outer;…;inner count"
+line per stack, the folded format flame graph tools read) plus a `.json`
+with the per-stage wall times (from the worker's `Metrics`) over the same
+window. Merge the dumps with:
+
+    python3 -m eartag_jetson.common.profiling report /tmp/eartag_profiles
+"""
+import os
+import re
+import sys
+import json
+import time
+import glob
+import signal
+import argparse
+import logging
+import threading
+from collections import Counter, defaultdict
+
+PROFILE_DIR     = os.environ.get("EARTAG_PROFILE_DIR", "/tmp/eartag_profiles")
+PROFILE_SECONDS = float(os.environ.get("EARTAG_PROFILE_SECONDS", "30"))
+PROFILE_HZ      = float(os.environ.get("EARTAG_PROFILE_HZ", "100"))
+# innermost frames in these files are a thread waiting, not working
+# (thread.py: an idle pool thread blocks in C inside concurrent.futures' _worker)
+IDLE_FILES      = ("threading.py", "queue.py", "selectors.py", "connection.py", "thread.py")
+
+
+def _profile_requested(camera: str) -> bool:
+    wanted = os.environ.get("EARTAG_PROFILE", "")
+    ids = {w.strip() for w in wanted.split(",") if w.strip()}
+    return "all" in ids or camera in ids
+
+
+class StackSampler:
+    """
+    Counts the folded stack of every other thread, sampled at `hz`. With
+    `seconds` it stops by itself and calls `on_done(self)` from its thread.
+    """
+
+    def __init__(self, hz: float = PROFILE_HZ, *, seconds: float | None = None,
+                 on_done=None):
+        self.interval = 1.0 / hz
+        self.seconds  = seconds
+        self.on_done  = on_done
+        self.stacks: Counter = Counter()
+        self.samples  = 0
+        self._stop    = threading.Event()
+        self._thread  = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        end = time.monotonic() + self.seconds if self.seconds else float("inf")
+        while not self._stop.wait(self.interval):
+            if time.monotonic() >= end:
+                break
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                funcs = []
+                while frame is not None:
+                    code = frame.f_code
+                    funcs.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                funcs.reverse()
+                self.stacks[";".join([names.get(tid, str(tid))] + funcs)] += 1
+            self.samples += 1
+        if self.on_done is not None and not self._stop.is_set():
+            self.on_done(self)
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+
+
+class WorkerProfiler:
+    """
+    Per-process stack-sampling capture. `tick()` once per frame starts a
+    requested capture and counts frames; the sampler ends it and writes the
+    dump after `seconds`, whether or not frames keep coming.
+    """
+
+    def __init__(
+        self,
+        camera: str,
+        *,
+        metrics=None,
+        seconds: float = PROFILE_SECONDS,
+        directory: str = PROFILE_DIR,
+        logger: logging.Logger | None = None,
+    ):
+        self.camera     = camera
+        self.metrics    = metrics
+        self.seconds    = seconds
+        self.directory  = directory
+        self.logger     = logger or logging.getLogger(__name__)
+        self._requested = _profile_requested(camera)
+        self._prof: StackSampler | None = None
+        self._started   = 0.0
+        self._frames    = 0
+        self._stages0: dict = {}
+
+        # handlers can only be installed from the main thread
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, self._on_signal)
+
+    def _on_signal(self, signum, frame):
+        # just flag it; the capture starts on the next frame
+        self._requested = True
+
+    def tick(self):
+        """Call once per processed frame; a no-op unless a capture is due or running."""
+        if self._prof is None:
+            if self._requested:
+                self._start()
+            return
+        self._frames += 1
+
+    def _stage_totals(self) -> dict:
+        if self.metrics is None:
+            return {}
+        return {
+            s: (h["count"], h["sum"]) for s, h in self.metrics.snapshot()["stages"].items()
+        }
+
+    def _start(self):
+        self._requested = False
+        self._frames    = 0
+        self._stages0   = self._stage_totals()
+        self._started   = time.monotonic()
+        self._prof = StackSampler(seconds=self.seconds, on_done=self._finish)
+        self._prof.start()
+        self.logger.info(f"Profiling {self.camera} for {self.seconds:.0f}s")
+
+    def _finish(self, prof: StackSampler):
+        """Runs on the sampler thread once the capture window is over."""
+        wall = time.monotonic() - self._started
+
+        stages = {}
+        for s, (count, total) in self._stage_totals().items():
+            c0, t0 = self._stages0.get(s, (0, 0.0))
+            if count > c0:
+                stages[s] = {
+                    "calls": count - c0,
+                    "total_ms": total - t0,
+                    "mean_ms": (total - t0) / (count - c0),
+                }
+
+        os.makedirs(self.directory, exist_ok=True)
+        stem = os.path.join(
+            self.directory, f"{self.camera}_{time.strftime('%Y%m%dT%H%M%S')}"
+        )
+        prof.dump(stem + ".stacks")
+        with open(stem + ".json", "w") as f:
+            json.dump({
+                "camera": self.camera,
+                "pid": os.getpid(),
+                "wall_s": wall,
+                "frames": self._frames,
+                "fps": self._frames / wall if wall else 0.0,
+                "samples": prof.samples,
+                "stages": stages,
+            }, f, indent=2)
+        self._prof = None
+        self.logger.info(f"Profile written to {stem}.stacks")
+
+
+# ─── report CLI ──────────────────────────────────────────────────────────────
+def _thread_group(name: str) -> str:
+    """"stage-ocr-1" / "ocr_3" → "stage-ocr" / "ocr": pool threads merged."""
+    return re.sub(r"[-_]\d+$", "", name)
+
+
+def load_stacks(path: str) -> Counter:
+    stacks = Counter()
+    with open(path) as f:
+        for line in f:
+            stack, _, n = line.rstrip("\n").rpartition(" ")
+            stacks[stack] += int(n)
+    return stacks
+
+
+def _idle(func: str) -> bool:
+    return func.rsplit("(", 1)[-1].split(":")[0] in IDLE_FILES
+
+
+def report(directory: str, top: int = 30, camera: str | None = None, out=sys.stdout):
+    pattern = f"{camera}_*" if camera else "*"
+    dumps = sorted(glob.glob(os.path.join(directory, pattern + ".stacks")))
+    if not dumps:
+        print(f"No profiles in {directory}", file=out)
+        return
+
+    print(f"{'camera':<20}{'window':>9}{'frames':>8}{'fps':>8}  stage mean ms", file=out)
+    for dump in dumps:
+        meta_path = dump[:-len(".stacks")] + ".json"
+        if not os.path.exists(meta_path):
+            continue
+        with open(meta_path) as f:
+            meta = json.load(f)
+        stages = "  ".join(f"{s}={v['mean_ms']:.1f}" for s, v in meta["stages"].items())
+        print(f"{meta['camera']:<20}{meta['wall_s']:>8.1f}s{meta['frames']:>8}"
+              f"{meta['fps']:>8.2f}  {stages}", file=out)
+
+    threads = defaultdict(lambda: [0, 0])       # group → [samples, busy samples]
+    total, own = Counter(), Counter()
+    busy = 0
+    for dump in dumps:
+        for stack, n in load_stacks(dump).items():
+            thread, *funcs = stack.split(";")
+            group = threads[_thread_group(thread)]
+            group[0] += n
+            if not funcs or _idle(funcs[-1]):
+                continue
+            group[1] += n
+            busy += n
+            own[funcs[-1]] += n
+            for func in set(funcs):
+                total[func] += n
+
+    print(f"\nThreads of {len(dumps)} capture(s) (busy = not waiting):", file=out)
+    print(f"{'thread':<28}{'samples':>9}{'busy':>7}", file=out)
+    for name, (n, b) in sorted(threads.items(), key=lambda kv: -kv[1][1]):
+        print(f"{name:<28}{n:>9}{b / n:>7.0%}", file=out)
+
+    if not busy:
+        return
+    print(f"\nTop functions over {busy} busy samples, all threads:", file=out)
+    print(f"{'total':>7}{'self':>7}  function", file=out)
+    for func, n in total.most_common(top):
+        print(f"{n / busy:>7.1%}{own[func] / busy:>7.1%}  {func}", file=out)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Camera worker profiling tools")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rp = sub.add_parser("report", help="merge profile dumps into one report")
+    rp.add_argument("directory", nargs="?", default=PROFILE_DIR)
+    rp.add_argument("--top", type=int, default=30, help="functions to show")
+    rp.add_argument("--camera", help="only merge dumps from this camera")
+    args = ap.parse_args()
+
+    if args.cmd == "report":
+        report(args.directory, args.top, args.camera)
+
+
+if __name__ == "__main__":
+    main()
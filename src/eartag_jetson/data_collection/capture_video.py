@@ -1,6 +1,7 @@
 import os
 import cv2
 from eartag_jetson.common.common_utils import find_project_root
+from eartag_jetson.data_collection.recorder import SessionRecorder
 
 
 # Define paths
@@ -8,12 +9,9 @@ BASE_DIR   = find_project_root()
 video_dir  = os.path.join(BASE_DIR, "data_collection", "saved_videos")
 os.makedirs(video_dir, exist_ok=True)
 
-# Auto-increment video filename
+# Auto-increment session prefix
 i = 1
-while True:
-    output_path = os.path.join(video_dir, f"video{i}.avi")
-    if not os.path.exists(output_path):
-        break
+while any(f.startswith(f"video{i}_") for f in os.listdir(video_dir)):
     i += 1
 
 # Start video capture
@@ -27,9 +25,9 @@ actual_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 fps           = int(cap.get(cv2.CAP_PROP_FPS)) or 20
 print(f"[INFO] Camera resolution: {actual_width}x{actual_height}, FPS: {fps}")
 
-# Define video writer
-fourcc = cv2.VideoWriter_fourcc(*'XVID')
-out = cv2.VideoWriter(output_path, fourcc, fps, (actual_width, actual_height))
+# Encoding runs on the recorder's writer thread (MJPG, 5 min segments),
+# so this loop only reads, queues and displays
+recorder = SessionRecorder(video_dir, fps=fps, prefix=f"video{i}")
 
 # Get screen resolution (for display only)
 screen_w, screen_h = 1920, 1080
@@ -40,13 +38,13 @@ while True:
         print("Failed to grab frame")
         break
 
-    # Write raw frame to video file
-    out.write(frame)
+    # Queue raw frame for the writer thread
+    recorder.submit(frame)
 
     # Resize for display
     h, w = frame.shape[:2]
     scale = min(1.0, screen_w / w, screen_h / h)
-    display_frame = cv2.resize(frame, (int(w * scale), int(h * scale)))
+    display_frame = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
 
     # Display
     cv2.imshow("Raw Camera Feed", display_frame)
@@ -57,6 +55,6 @@ while True:
 
 # Clean up
 cap.release()
-out.release()
+recorder.close()
 cv2.destroyAllWindows()
-print(f"[INFO] Video saved to: {output_path}")
+print(f"[INFO] Video saved to: {video_dir} ({recorder.written} frames, {recorder.dropped} dropped)")
@@ -0,0 +1,229 @@
+# data_collection/recorder.py
+"""
+Session recorder that can run inside a production pipeline.
+
+Frames are handed to a bounded queue and encoded on a background writer
+thread, so the capture/detection loop never waits on the encoder (a full
+queue drops the frame and counts it). The queue is bounded by frames and by
+bytes: at 4608×2592 a BGR frame is ~36 MB, so QUEUE_BYTES holds about three. Output is split into segments that
+rotate by duration or size, each with a JSONL sidecar holding one line per
+frame:
+
+    {"seq": 12, "ts": 1718000000.12, "frame": 12,
+     "boxes": [[x0, y0, x1, y1, conf], …], "texts": [["1234", 0.97] | null, …]}
+
+`read_sidecar` iterates those lines so detections can be replayed later
+without re-running YOLO.
+"""
+import os
+import json
+import time
+import queue
+import logging
+import threading
+import cv2
+
+# intra-only MJPG is far cheaper per frame on the CPU than XVID
+DEFAULT_FOURCC   = "MJPG"
+SEGMENT_SECONDS  = 300
+SEGMENT_BYTES    = 2 * 1024 ** 3
+QUEUE_SIZE       = 32
+QUEUE_BYTES      = 128 * 1024 ** 2     # frames waiting for the encoder, at most
+SIZE_CHECK_EVERY = 30          # frames between segment size checks
+
+# Jetson hardware H.264 encoder; {path} is filled per segment
+JETSON_H264_PIPELINE = (
+    "appsrc ! video/x-raw,format=BGR ! videoconvert ! video/x-raw,format=BGRx ! "
+    "nvvidconv ! video/x-raw(memory:NVMM),format=NV12 ! "
+    "nvv4l2h264enc bitrate=20000000 ! h264parse ! matroskamux ! filesink location={path}"
+)
+
+
+class SessionRecorder:
+    def __init__(
+        self,
+        out_dir: str,
+        *,
+        fps: float = 10.0,
+        fourcc: str = DEFAULT_FOURCC,
+        gst_pipeline: str | None = None,
+        segment_seconds: float = SEGMENT_SECONDS,
+        segment_bytes: int = SEGMENT_BYTES,
+        queue_size: int = QUEUE_SIZE,
+        queue_bytes: int = QUEUE_BYTES,
+        prefix: str = "session",
+        logger: logging.Logger | None = None,
+        metrics=None,
+    ):
+        """
+        `gst_pipeline` (e.g. JETSON_H264_PIPELINE) switches the writer to a
+        GStreamer encoder; otherwise `fourcc` is used with an .avi container.
+        """
+        self.out_dir         = out_dir
+        self.fps             = fps
+        self.fourcc          = fourcc
+        self.gst_pipeline    = gst_pipeline
+        self.segment_seconds = segment_seconds
+        self.segment_bytes   = segment_bytes
+        self.prefix          = prefix
+        self.logger          = logger or logging.getLogger(__name__)
+        self.metrics         = metrics
+
+        self.dropped  = 0
+        self.written  = 0
+        self.failed   = False             # writer thread died; frames are refused
+        self._seq     = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.queue_bytes    = queue_bytes
+        self._queued_bytes  = 0           # frames queued or being written
+        self._bytes_lock    = threading.Lock()
+        self._writer  = None
+        self._sidecar = None
+        self._segment_path  = None
+        self._segment_start = 0.0
+        self._segment_frame = 0
+        self._segment_idx   = 0
+
+        os.makedirs(out_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name=f"recorder-{prefix}", daemon=True)
+        self._thread.start()
+
+    # ─── producer side (hot path) ────────────────────────────────────────────
+    def submit(self, frame, boxes=None, texts=None, ts: float | None = None) -> bool:
+        """Queue a frame and its detections; returns False if it was dropped."""
+        seq = self._seq
+        self._seq += 1
+        if self.failed:
+            return self._drop()
+        with self._bytes_lock:
+            fits = self._queued_bytes == 0 or self._queued_bytes + frame.nbytes <= self.queue_bytes
+            if fits:
+                self._queued_bytes += frame.nbytes
+        try:
+            if not fits:
+                raise queue.Full
+            self._queue.put_nowait((seq, ts or time.time(), frame, boxes, texts))
+        except queue.Full:
+            if fits:
+                self._release(frame.nbytes)
+            return self._drop()
+        if self.metrics is not None:
+            self.metrics.set_gauge("recorder_queue_depth", self._queue.qsize())
+        return True
+
+    def _drop(self) -> bool:
+        self.dropped += 1
+        if self.metrics is not None:
+            self.metrics.inc("recorder_dropped_frames")
+        return False
+
+    def _release(self, nbytes: int):
+        with self._bytes_lock:
+            self._queued_bytes -= nbytes
+
+    def close(self, timeout: float = 10.0):
+        """Flush the queue and finish the current segment."""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass                     # writer thread is gone; nothing to flush
+        self._thread.join(timeout)
+        self.logger.info(
+            f"Recorder closed: {self.written} frames written, {self.dropped} dropped"
+        )
+
+    # ─── writer thread ───────────────────────────────────────────────────────
+    def _open_segment(self, width: int, height: int):
+        self._close_segment()
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        ext = ".mkv" if self.gst_pipeline else ".avi"
+        base = os.path.join(self.out_dir, f"{self.prefix}_{stamp}_{self._segment_idx:03d}")
+        self._segment_path = base + ext
+        if self.gst_pipeline:
+            self._writer = cv2.VideoWriter(
+                self.gst_pipeline.format(path=self._segment_path),
+                cv2.CAP_GSTREAMER, 0, self.fps, (width, height),
+            )
+        else:
+            self._writer = cv2.VideoWriter(
+                self._segment_path, cv2.VideoWriter_fourcc(*self.fourcc),
+                self.fps, (width, height),
+            )
+        if not self._writer.isOpened():
+            raise IOError(f"Cannot open video writer for {self._segment_path}")
+        self._sidecar = open(base + ".jsonl", "w")
+        self._segment_start = time.monotonic()
+        self._segment_frame = 0
+        self._segment_idx  += 1
+        self.logger.info(f"Recording segment {self._segment_path}")
+
+    def _close_segment(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+        if self._sidecar is not None:
+            self._sidecar.close()
+            self._sidecar = None
+
+    def _segment_full(self) -> bool:
+        if time.monotonic() - self._segment_start >= self.segment_seconds:
+            return True
+        if self._segment_frame % SIZE_CHECK_EVERY == 0:
+            try:
+                return os.path.getsize(self._segment_path) >= self.segment_bytes
+            except OSError:
+                return False
+        return False
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                try:
+                    self._write(*item)
+                finally:
+                    self._release(item[2].nbytes)
+        except Exception as e:
+            self.failed = True
+            self.logger.error(f"Recorder stopped, no more frames are recorded: {e}", exc_info=True)
+            self._discard_queued()
+        finally:
+            self._close_segment()
+
+    def _write(self, seq, ts, frame, boxes, texts):
+        h, w = frame.shape[:2]
+        if self._writer is None or self._segment_full():
+            self._open_segment(w, h)
+
+        self._writer.write(frame)
+        self._sidecar.write(json.dumps({
+            "seq": seq,
+            "ts": ts,
+            "frame": self._segment_frame,
+            "boxes": [list(b) for b in boxes] if boxes is not None else [],
+            "texts": [list(t) if t is not None else None for t in texts]
+                     if texts is not None else [],
+        }) + "\n")
+        self._segment_frame += 1
+        self.written += 1
+
+    def _discard_queued(self):
+        """Free what was queued before the writer died (counted as dropped)."""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                self._release(item[2].nbytes)
+                self._drop()
+
+
+def read_sidecar(path: str):
+    """Yield the per-frame records of a segment's .jsonl sidecar, in order."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
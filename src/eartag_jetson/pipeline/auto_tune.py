@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# pipeline/auto_tune.py
+"""
+Grid / random search over the stall settings using recorded sessions.
+
+Input is a manifest of sessions with known ground truth, each pointing at a
+detection cache built with OCR reads (see detection_cache.py):
+
+    [{"camera": "MM2502V0003FMT", "cache": "video6.detcache",
+      "tags": ["3013", "2784", "2321", "3010"]}, …]
+
+Each candidate config replays every session the way the multi-camera
+detector runs it: wait until a frame has ≥ min_detections boxes, aggregate
+until boxes stay below end_threshold_ratio × peak for end_timeout seconds,
+then summarize. Candidates are scored with the tag-ordering accuracy on a
+multiprocessing pool, and the best config per camera (plus the best overall
+as "default") is written in the stall_config.json format.
+
+    python3 auto_tune.py --sessions sessions.json --out stall_config.json \
+        --edge-margin 250:700:50 --close-thresh 150,200,250,300 --random 500
+"""
+import json
+import random
+import argparse
+import itertools
+from multiprocessing import Pool
+from dataclasses import replace
+from eartag_jetson.common.log_utils import get_logger
+from eartag_jetson.pipeline.detection_cache import DetectionCache
+from eartag_jetson.pipeline.roster import HerdRoster
+from eartag_jetson.pipeline.stall_config import StallConfig, save_stall_configs
+from eartag_jetson.pipeline.summary import new_agg, fold_reads, build_summary, ordering_accuracy
+
+# per-worker session data and herd roster, filled by _init_worker
+_SESSIONS: list[dict] = []
+_ROSTER: HerdRoster | None = None
+
+
+def _precompute(cache: DetectionCache) -> list[tuple[int, list, list]]:
+    """(box count, boxes, OCR reads) for every cached frame."""
+    if not cache.has_reads:
+        raise ValueError(f"{cache.path} has no OCR reads; rebuild it with --reads")
+    return [
+        (cache.frame_box_count(i), cache.frame_dets(i), cache.frame_reads(i))
+        for i in range(len(cache))
+    ]
+
+
+def _init_worker(sessions: list[dict], fps: float | None, roster: str | None = None):
+    global _SESSIONS, _ROSTER
+    _ROSTER = HerdRoster.from_file(roster) if roster else None
+    _SESSIONS = []
+    for s in sessions:
+        cache = DetectionCache(s["cache"])
+        _SESSIONS.append({
+            "camera": s["camera"],
+            "tags": s["tags"],
+            "width": cache.width,
+            "fps": fps or cache.fps,
+            "frames": _precompute(cache),
+        })
+
+
+def simulate_session(frames, cfg: StallConfig, *, fps: float, width: int,
+                     roster: HerdRoster | None = None) -> list[str]:
+    """Replay one session's frames under `cfg`; returns the tags left to right."""
+    start = next((i for i, (n, _, _) in enumerate(frames) if n >= cfg.min_detections), None)
+    if start is None:
+        return []
+
+    agg = new_agg(tracked=cfg.track, settle_p=cfg.settle_p) if cfg.track else new_agg()
+    peak, end_start = 0, None
+    for i in range(start + 1, len(frames)):
+        boxes, dets, reads = frames[i]
+        fold_reads(dets, reads, agg, roster=roster)
+        peak = max(peak, boxes)
+        if peak >= cfg.min_detections:
+            if boxes < peak * cfg.end_threshold_ratio:
+                if end_start is None:
+                    end_start = i
+            else:
+                end_start = None
+            if end_start is not None and (i - end_start) / fps >= cfg.end_timeout:
+                break
+
+    return build_summary(
+        agg,
+        frame_width=width,
+        edge_margin=cfg.edge_margin,
+        close_thresh=cfg.close_thresh,
+        top_n=cfg.top_n,
+    )
+
+
+def score(params: dict) -> tuple[dict, dict[str, float]]:
+    """Mean ordering accuracy of one candidate, per camera."""
+    cfg = replace(StallConfig(), **params)
+    per_cam: dict[str, list[float]] = {}
+    for s in _SESSIONS:
+        tags = simulate_session(s["frames"], cfg, fps=s["fps"], width=s["width"], roster=_ROSTER)
+        per_cam.setdefault(s["camera"], []).append(ordering_accuracy(tags, s["tags"]))
+    return params, {cam: sum(v) / len(v) for cam, v in per_cam.items()}
+
+
+def parse_values(spec: str, kind=float) -> list:
+    """'300,400,500' or 'start:stop:step' (stop inclusive)."""
+    if ":" in spec:
+        start, stop, step = (kind(x) for x in spec.split(":"))
+        vals, v = [], start
+        while v <= stop + 1e-9:
+            vals.append(kind(round(v, 6)))
+            v += step
+        return vals
+    return [kind(x) for x in spec.split(",")]
+
+
+def candidates(space: dict[str, list], n_random: int | None, seed: int = 0):
+    names = list(space)
+    if n_random is None:
+        for combo in itertools.product(*(space[n] for n in names)):
+            yield dict(zip(names, combo))
+        return
+    rng = random.Random(seed)
+    for _ in range(n_random):
+        yield {n: rng.choice(space[n]) for n in names}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Auto-tune stall settings on recorded sessions")
+    ap.add_argument("--sessions", required=True, help="session manifest (JSON list)")
+    ap.add_argument("--out", required=True, help="stall config file to write")
+    ap.add_argument("--edge-margin", default="250:700:50")
+    ap.add_argument("--close-thresh", default="150:350:50")
+    ap.add_argument("--top-n", default="4")
+    ap.add_argument("--min-detections", default="4:9:1")
+    ap.add_argument("--end-threshold-ratio", default="0.3,0.4,0.5")
+    ap.add_argument("--end-timeout", default="4.0")
+    ap.add_argument("--random", type=int, help="sample N random candidates instead of the full grid")
+    ap.add_argument("--fps", type=float, help="processing fps for end_timeout (default: cache fps)")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--roster", help="herd roster file (accept only these tag IDs)")
+    args = ap.parse_args()
+
+    logger = get_logger("auto_tune")
+    with open(args.sessions) as f:
+        sessions = json.load(f)
+
+    space = {
+        "edge_margin":         parse_values(args.edge_margin, int),
+        "close_thresh":        parse_values(args.close_thresh, int),
+        "top_n":               parse_values(args.top_n, int),
+        "min_detections":      parse_values(args.min_detections, int),
+        "end_threshold_ratio": parse_values(args.end_threshold_ratio, float),
+        "end_timeout":         parse_values(args.end_timeout, float),
+    }
+    cands = list(candidates(space, args.random))
+    logger.info(f"Scoring {len(cands)} candidates on {len(sessions)} sessions")
+
+    best: dict[str, tuple[float, dict]] = {}
+    best_overall = (-1.0, None)
+    with Pool(args.workers, initializer=_init_worker, initargs=(sessions, args.fps, args.roster)) as pool:
+        for params, per_cam in pool.imap(score, cands, chunksize=16):
+            if not per_cam:
+                continue                          # no session could be scored
+            for cam, acc in per_cam.items():
+                if acc > best.get(cam, (-1.0, None))[0]:
+                    best[cam] = (acc, params)
+            overall = sum(per_cam.values()) / len(per_cam)
+            if overall > best_overall[0]:
+                best_overall = (overall, params)
+
+    if best_overall[1] is None:
+        raise SystemExit(f"No candidate could be scored on {args.sessions}; nothing written")
+    for cam, (acc, params) in sorted(best.items()):
+        logger.info(f"{cam}: accuracy {acc:.3f} with {params}")
+    logger.info(f"overall: accuracy {best_overall[0]:.3f} with {best_overall[1]}")
+
+    # only the tuned keys: everything else keeps resolving as usual
+    save_stall_configs(
+        args.out,
+        {cam: params for cam, (_, params) in best.items()},
+        default=best_overall[1],
+    )
+    logger.info(f"Config written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
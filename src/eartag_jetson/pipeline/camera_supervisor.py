@@ -0,0 +1,264 @@
+# pipeline/camera_supervisor.py
+"""
+Camera hot-plug supervisor for multi_stream_pipeline.
+
+Cameras are identified by their physical USB port (the link name under
+/dev/v4l/by-path), not by /dev/videoN order, so a camera keeps its BLE
+code/password when it is unplugged, re-enumerated or plugged back in a
+different order. The mapping comes from `EARTAG_CAMERAS` (JSON):
+
+    {
+      "platform-3610000.usb-usb-0:2.1:1.0-video-index0":
+          {"ble_code": "MM2502V0003FMT", "password": "o8vTaJ"},
+      …
+    }
+
+Without that file the ports present at startup are sorted and paired with
+the pipeline's BLE_CODES/PASSWORDS lists, which is stable across reboots as
+long as the cameras stay in the same ports.
+
+The supervisor polls the by-path directory (cheap, and needs no inotify
+dependency); when a port disappears its worker is stopped, when it comes back
+a worker is started again and the worker records the time from the device
+reappearing to processing frames as its "reconnect" stage.
+
+Workers also publish a `Heartbeat` (shared memory, written once per frame:
+time of the last frame, frame count, last YOLO/OCR time). A worker that
+stops beating for `EARTAG_STALL_DEADLINE` seconds (e.g. PaddleOCR deadlocked
+in C++) is killed and restarted like a crashed one, with exponential backoff
+so a worker that keeps failing does not spin.
+"""
+import os
+import glob
+import json
+import time
+import logging
+from dataclasses import dataclass, field
+from eartag_jetson.common.metrics import Metrics, MetricsDumper
+
+BY_PATH_GLOB  = "/dev/v4l/by-path/*-video-index0"
+CAMERAS_FILE  = os.environ.get("EARTAG_CAMERAS")
+POLL_INTERVAL = 1.0            # s between by-path scans
+RESTART_DELAY = 5.0            # s before the first restart of a failed worker…
+MAX_BACKOFF   = 300.0          # …doubling per consecutive failure up to this
+BACKOFF_RESET = 600.0          # s of healthy running that forgets past failures
+STALL_DEADLINE  = float(os.environ.get("EARTAG_STALL_DEADLINE", "60"))   # s without a frame
+STARTUP_TIMEOUT = float(os.environ.get("EARTAG_STARTUP_TIMEOUT", "300")) # s to the first frame
+
+
+class Heartbeat:
+    """
+    Worker → supervisor liveness in a shared array (no lock: one writer,
+    aligned doubles). Slots: last beat (wall time), frames, last YOLO ms,
+    last OCR ms.
+    """
+
+    def __init__(self, ctx):
+        self._arr = ctx.Array("d", 4, lock=False)
+
+    def beat(self, metrics: Metrics | None = None):
+        arr = self._arr
+        arr[0] = time.time()
+        if metrics is not None:
+            arr[1] = metrics.counters.get("frames", 0)
+            for i, stage in ((2, "yolo"), (3, "ocr")):
+                hist = metrics.hists.get(stage)
+                if hist is not None:
+                    arr[i] = hist.last
+
+    def reset(self):
+        self._arr[0] = 0.0
+
+    @property
+    def last(self) -> float:
+        return self._arr[0]
+
+    def describe(self) -> str:
+        return f"{int(self._arr[1])} frames, last yolo {self._arr[2]:.0f} ms, last ocr {self._arr[3]:.0f} ms"
+
+
+def scan_ports(pattern: str = BY_PATH_GLOB) -> dict[str, str]:
+    """{by-path port name: /dev/videoN} for every capture node present now."""
+    ports = {}
+    for link in glob.glob(pattern):
+        dev = os.path.realpath(link)
+        if dev.startswith("/dev/video"):
+            ports[os.path.basename(link)] = dev
+    return ports
+
+
+def load_assignments(ble_codes: list[str], passwords: list[str],
+                     path: str | None = CAMERAS_FILE,
+                     pattern: str = BY_PATH_GLOB) -> dict[str, tuple[str, str]]:
+    """{by-path port name: (ble_code, password)} (see module docstring)."""
+    if path:
+        with open(path) as f:
+            data = json.load(f)
+        return {port: (c["ble_code"], c["password"]) for port, c in data.items()}
+    ports = sorted(scan_ports(pattern))
+    if not ports:
+        raise RuntimeError("No cameras found via by-path detection")
+    return dict(zip(ports, zip(ble_codes, passwords)))
+
+
+@dataclass
+class CameraSlot:
+    port: str
+    ble_code: str
+    password: str
+    process: object = None                 # multiprocessing.Process
+    device: str | None = None
+    lost_at: float | None = None           # when the device disappeared
+    exited_at: float | None = None         # when the worker last exited
+    started_at: float = 0.0                # when the current worker was started
+    restarts: int = field(default=0)
+    failures: int = 0                      # consecutive crashes/stalls (for backoff)
+    started: bool = False                  # a worker has run for this port before
+    heartbeat: Heartbeat | None = None
+
+
+class CameraSupervisor:
+    """
+    Starts one worker per assigned port and keeps it matched to the hardware.
+
+    `start_worker(device, ble_code, password, reconnect_since, heartbeat)`
+    must return a started `multiprocessing.Process`; `reconnect_since` is the
+    wall-clock time the device came back (None on first start) and the worker
+    calls `heartbeat.beat()` for every processed frame.
+    """
+
+    def __init__(self, assignments: dict[str, tuple[str, str]], start_worker, *,
+                 ctx, pattern: str = BY_PATH_GLOB, poll_interval: float = POLL_INTERVAL,
+                 restart_delay: float = RESTART_DELAY, max_backoff: float = MAX_BACKOFF,
+                 stall_deadline: float = STALL_DEADLINE,
+                 startup_timeout: float = STARTUP_TIMEOUT,
+                 logger: logging.Logger | None = None):
+        self.slots = {
+            port: CameraSlot(port, code, pw, heartbeat=Heartbeat(ctx))
+            for port, (code, pw) in assignments.items()
+        }
+        self.start_worker    = start_worker
+        self.pattern         = pattern
+        self.poll_interval   = poll_interval
+        self.restart_delay   = restart_delay
+        self.max_backoff     = max_backoff
+        self.stall_deadline  = stall_deadline
+        self.startup_timeout = startup_timeout
+        self.logger          = logger or logging.getLogger(__name__)
+        self.metrics       = Metrics(camera="supervisor")
+        self._dumper       = MetricsDumper(self.metrics)
+        self._stopping     = False
+
+    def _start(self, slot: CameraSlot, device: str, reconnect_since: float | None):
+        slot.device     = device
+        slot.started    = True
+        slot.started_at = time.time()
+        slot.heartbeat.reset()
+        slot.process = self.start_worker(
+            device, slot.ble_code, slot.password, reconnect_since, slot.heartbeat
+        )
+        self.logger.info(f"[{slot.ble_code}] Worker pid {slot.process.pid} on {device} ({slot.port})")
+
+    def _stop(self, slot: CameraSlot, timeout: float = 10.0):
+        proc, slot.process = slot.process, None
+        if proc is None:
+            return
+        if proc.is_alive():
+            proc.terminate()
+        proc.join(timeout)
+        if proc.is_alive():
+            self.logger.warning(f"[{slot.ble_code}] Worker ignored SIGTERM; killing")
+            proc.kill()
+            proc.join()
+
+    def _stalled(self, slot: CameraSlot, now: float) -> str | None:
+        """Why a live worker counts as hung, or None if it is healthy."""
+        last = slot.heartbeat.last
+        if last < slot.started_at:
+            if now - slot.started_at > self.startup_timeout:
+                return f"no frame {now - slot.started_at:.0f}s after start"
+            return None
+        if now - last > self.stall_deadline:
+            return f"no frame for {now - last:.0f}s ({slot.heartbeat.describe()})"
+        return None
+
+    def _backoff(self, slot: CameraSlot) -> float:
+        return min(self.max_backoff, self.restart_delay * 2 ** max(0, slot.failures - 1))
+
+    def _failed(self, slot: CameraSlot, now: float, reason: str):
+        """Record a crash/stall; the restart happens after the backoff delay."""
+        if now - slot.started_at > BACKOFF_RESET:
+            slot.failures = 0                      # it ran fine for a long while
+        slot.failures += 1
+        slot.exited_at = now
+        self.logger.warning(
+            f"[{slot.ble_code}] Worker {reason}; restart in {self._backoff(slot):.0f}s "
+            f"(failure {slot.failures})"
+        )
+
+    def poll(self):
+        """One supervision pass: react to unplugged, returned, exited and hung workers."""
+        present = scan_ports(self.pattern)
+        now = time.time()
+        for slot in self.slots.values():
+            device = present.get(slot.port)
+            alive  = slot.process is not None and slot.process.is_alive()
+
+            if device is None:
+                if slot.lost_at is None:
+                    slot.lost_at = now
+                    if slot.started:
+                        self.metrics.inc("camera_disconnects")
+                        self.logger.warning(f"[{slot.ble_code}] Camera unplugged from {slot.port}")
+                        self._stop(slot)
+                    else:
+                        self.logger.warning(f"[{slot.ble_code}] No camera on {slot.port} yet")
+                continue
+
+            if not slot.started:
+                slot.lost_at = None
+                self._start(slot, device, None)
+            elif slot.lost_at is not None:
+                self.logger.info(
+                    f"[{slot.ble_code}] Camera back on {device} after {now - slot.lost_at:.1f}s"
+                )
+                self.metrics.observe("camera_offline", (now - slot.lost_at) * 1000.0)
+                self._stop(slot)
+                slot.lost_at = slot.exited_at = None
+                slot.restarts += 1
+                self.metrics.inc("worker_restarts")
+                self._start(slot, device, now)
+            elif slot.exited_at is not None:
+                if now - slot.exited_at >= self._backoff(slot):
+                    slot.exited_at = None
+                    slot.restarts += 1
+                    self.metrics.inc("worker_restarts")
+                    self._start(slot, device, now)
+            elif not alive:
+                # worker exited while its camera is still there (stream error, crash)
+                self._failed(slot, now, f"exited with code {slot.process.exitcode}")
+                slot.process = None
+            else:
+                reason = self._stalled(slot, now)
+                if reason is not None:
+                    self.metrics.inc("worker_stalls")
+                    self._stop(slot)
+                    self._failed(slot, now, f"stalled: {reason}")
+        self.metrics.set_gauge("cameras_online", sum(p in present for p in self.slots))
+
+    def run(self):
+        """Supervise until stop() or Ctrl-C, then stop every worker."""
+        self._dumper.start()
+        try:
+            while not self._stopping:
+                self.poll()
+                time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            self.logger.info("Ctrl-C received; stopping workers")
+        finally:
+            for slot in self.slots.values():
+                self._stop(slot)
+            self._dumper.stop()
+
+    def stop(self):
+        self._stopping = True
@@ -0,0 +1,95 @@
+# pipeline/cpu_plan.py
+"""
+CPU topology planner: share the cores between the camera workers instead of
+letting every library in every worker size its pools to the whole machine.
+
+Without a plan each camera process starts an OCR pool of cpu_count() - 1
+threads, and torch, OpenCV and Paddle each start one thread per core as
+well – with 2–4 cameras the Orin runs several times more busy threads than
+it has cores. `plan_cpus` gives the parent process (supervisor, log
+listener, metrics endpoint) `reserved` cores and splits the rest into
+contiguous blocks, one per camera worker (and one for the inference server
+when it runs). `apply_plan`, called first thing in the worker, then:
+
+    pins the process to its block (sched_setaffinity)
+    sets torch.set_num_threads, cv2.setNumThreads and OMP_NUM_THREADS
+    exports EARTAG_CPU_THREADS, read by model_cache (Paddle `cpu_threads`)
+    and recognizer.py (onnxruntime intra-op threads)
+
+and the detector's OCR pool is sized to the block. With fewer cores than
+workers the blocks share cores and nothing is pinned.
+
+multi_stream_pipeline.py plans at startup unless `EARTAG_CPU_PLAN=0`;
+compare the two with benchmark/cpu_plan_benchmark.py.
+"""
+import os
+import logging
+from dataclasses import dataclass
+
+RESERVED = 1                    # cores left to the parent process
+
+
+@dataclass(frozen=True)
+class CpuPlan:
+    name: str
+    cores: tuple[int, ...]      # CPUs to pin to (empty: not pinned)
+    threads: int                # intra-op threads for torch / OpenCV / Paddle / onnxruntime
+    ocr_workers: int            # recognizer pool size
+
+
+def available_cpus() -> list[int]:
+    """CPUs this process may run on (respects cgroup / taskset limits)."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:                      # not Linux
+        return list(range(os.cpu_count() or 1))
+
+
+def plan_cpus(names: list[str], *, cpus: list[int] | None = None,
+              reserved: int = RESERVED) -> dict[str, CpuPlan]:
+    """One CpuPlan per worker name, in order, over `cpus` (default: available_cpus())."""
+    cpus = list(cpus if cpus is not None else available_cpus())
+    n = len(names)
+    if n == 0:
+        return {}
+    if len(cpus) - reserved >= n:
+        cpus = cpus[reserved:]
+    if len(cpus) < n:
+        # more workers than cores: no pinning, one thread each
+        return {name: CpuPlan(name, (), 1, 1) for name in names}
+    plans, start = {}, 0
+    for i, name in enumerate(names):
+        size = len(cpus) // n + (1 if i < len(cpus) % n else 0)
+        block = tuple(cpus[start:start + size])
+        start += size
+        plans[name] = CpuPlan(name, block, len(block), len(block))
+    return plans
+
+
+def cpu_threads() -> int | None:
+    """Intra-op threads of this worker's plan, or None without one."""
+    value = os.environ.get("EARTAG_CPU_THREADS")
+    return int(value) if value else None
+
+
+def apply_plan(plan: CpuPlan, logger: logging.Logger | None = None):
+    """Pin this process and size the library thread pools (call before loading models)."""
+    logger = logger or logging.getLogger(__name__)
+    os.environ["EARTAG_CPU_THREADS"] = str(plan.threads)
+    os.environ["OMP_NUM_THREADS"] = str(plan.threads)
+    if plan.cores:
+        try:
+            os.sched_setaffinity(0, plan.cores)
+        except (AttributeError, OSError) as e:
+            logger.warning(f"[{plan.name}] CPU affinity not set: {e}")
+    import cv2
+    cv2.setNumThreads(plan.threads)
+    try:
+        import torch
+        torch.set_num_threads(plan.threads)
+    except ImportError:
+        pass
+    logger.info(
+        f"[{plan.name}] CPU plan: cores {list(plan.cores) or 'shared'}, "
+        f"{plan.threads} threads, OCR pool {plan.ocr_workers}"
+    )
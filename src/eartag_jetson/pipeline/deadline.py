@@ -0,0 +1,140 @@
+# pipeline/deadline.py
+"""
+Deadline-aware degradation: keep a camera worker's per-frame cost within a
+budget by doing less work per frame while it is falling behind.
+
+Every frame reports its cost in ms (start of YOLO to end of aggregation, so
+pipelined frames include their queueing; a frame dropped on purpose costs 0).
+After each window of frames:
+
+    mean cost > budget                              → degrade one step
+    mean cost × saving of the newest step
+        < headroom × budget                         → undo that step
+
+The saving of a step (mean cost before / after it) is measured in the first
+window after it is taken, so a step is only undone once the frames would
+still fit the budget without it – the level does not flap between two steps.
+
+Steps are taken in `order` (stall config `degrade_order`):
+
+    settled   tracks settle sooner (posterior DEGRADED_SETTLE_P after
+              DEGRADED_MIN_READS reads), so more boxes skip OCR
+    imgsz     YOLO predicts at DEGRADED_IMGSZ instead of IMGSZ (dropped for
+              models with a fixed input size, e.g. static TensorRT engines)
+    skip      only every other frame is processed
+
+The level is the `degrade_level` gauge, each step a `degrade_<step>` gauge
+(1 while active), frame cost the `frame` histogram and dropped frames the
+`frames_skipped` counter.
+"""
+import logging
+import threading
+from eartag_jetson.common.metrics import Metrics
+
+IMGSZ = 640                    # Ultralytics default; the pipelines predict at this size
+STEPS = ("settled", "imgsz", "skip")
+WINDOW             = 30        # frames per decision
+HEADROOM           = 0.8       # undo a step only below this share of the budget
+DEGRADED_SETTLE_P  = 0.99
+DEGRADED_MIN_READS = 2
+DEGRADED_IMGSZ     = 480       # multiple of the YOLO stride (32)
+
+
+def parse_order(spec: str) -> tuple[str, ...]:
+    """"settled,imgsz,skip" → ("settled", "imgsz", "skip"); unknown steps raise."""
+    order = tuple(s.strip() for s in spec.split(",") if s.strip())
+    unknown = [s for s in order if s not in STEPS]
+    if unknown or len(set(order)) != len(order):
+        raise ValueError(f"degrade_order must list steps of {STEPS} at most once, got {spec!r}")
+    return order
+
+
+class DeadlineScheduler:
+    def __init__(self, budget_ms: float, *, order: tuple[str, ...] = STEPS, window: int = WINDOW,
+                 headroom: float = HEADROOM, metrics: Metrics | None = None,
+                 logger: logging.Logger | None = None):
+        if budget_ms <= 0:
+            raise ValueError("frame budget must be positive")
+        self.budget_ms = budget_ms
+        self.order     = tuple(order)
+        self.window    = window
+        self.headroom  = headroom
+        self.metrics   = metrics
+        self.logger    = logger or logging.getLogger(__name__)
+        self.level     = 0
+        self.saving    = [1.0] * len(self.order)   # cost before / after each step
+        self.disabled: set[str] = set()
+        self._costs: list[float] = []
+        self._before   = None                      # mean cost before the newest step
+        self._tick     = 0
+        self._lock     = threading.Lock()
+        self.publish()
+
+    # ─── what the detector asks per frame ────────────────────────────────────
+    def active(self, step: str) -> bool:
+        return step in self.order[:self.level] and step not in self.disabled
+
+    def process_frame(self) -> bool:
+        """False for the frames the `skip` step drops (every other one)."""
+        if not self.active("skip"):
+            return True
+        self._tick ^= 1
+        return bool(self._tick)
+
+    def imgsz(self) -> int:
+        return DEGRADED_IMGSZ if self.active("imgsz") else IMGSZ
+
+    def settle(self, settle_p: float, min_reads: int) -> tuple[float, int]:
+        """The tracker's settle thresholds at the current level."""
+        if self.active("settled"):
+            return min(settle_p, DEGRADED_SETTLE_P), min(min_reads, DEGRADED_MIN_READS)
+        return settle_p, min_reads
+
+    def disable(self, step: str, reason: str):
+        """Leave out a step this worker cannot take; the next window moves past it."""
+        if step not in self.disabled:
+            self.logger.warning(f"Degradation step {step!r} unavailable: {reason}")
+            self.disabled.add(step)
+            self.publish()
+
+    # ─── feedback ────────────────────────────────────────────────────────────
+    def skipped(self):
+        if self.metrics is not None:
+            self.metrics.inc("frames_skipped")
+        self.observe(0.0)
+
+    def observe(self, cost_ms: float):
+        with self._lock:
+            self._costs.append(cost_ms)
+            if len(self._costs) < self.window:
+                return
+            mean = sum(self._costs) / len(self._costs)
+            self._costs.clear()
+            if self._before is not None:
+                self.saving[self.level - 1] = max(1.0, self._before / mean) if mean > 0 else 1.0
+                self._before = None
+
+            if mean > self.budget_ms and self.level < len(self.order):
+                self._before = mean
+                self.level += 1
+                self.logger.info(
+                    f"Frame cost {mean:.0f} ms over the {self.budget_ms:.0f} ms budget: "
+                    f"degrading to level {self.level} ({self.order[self.level - 1]})"
+                )
+            elif self.level and mean * self.saving[self.level - 1] < self.headroom * self.budget_ms:
+                step = self.order[self.level - 1]
+                self.level -= 1
+                self.logger.info(
+                    f"Frame cost {mean:.0f} ms leaves headroom: recovering {step} "
+                    f"(level {self.level})"
+                )
+            else:
+                return
+        self.publish()
+
+    def publish(self):
+        if self.metrics is None:
+            return
+        self.metrics.set_gauge("degrade_level", self.level)
+        for step in self.order:
+            self.metrics.set_gauge(f"degrade_{step}", int(self.active(step)))
@@ -0,0 +1,298 @@
+# pipeline/detection_cache.py
+"""
+Detection cache: YOLO output of a whole video, stored once and replayed.
+
+A cache is a directory of plain .npy arrays, opened with mmap so replaying a
+long session touches only the frames it reads:
+
+    meta.json         video, frame count, capture size, what is stored
+    offsets.npy       int64 (frames + 1)   – box range of frame i
+    boxes.npy         float32 (N, 5)       – x0, y0, x1, y1, conf
+    texts.npy         <U16 (N,)            – OCR text per box (optional)
+    confs.npy         float32 (N,)         – OCR confidence, -1 = no read
+    crops.u8          raw uint8            – RGB crops back to back (optional)
+    crop_offsets.npy  int64 (N + 1)        – byte range of crop j
+    crop_shapes.npy   int32 (N, 3)
+
+With reads cached, summary sweeps (EDGE_MARGIN, CLOSE_THRESH, TOP_N) need no
+model at all; with crops cached, OCR settings can be re-tried without YOLO.
+
+    python3 -m eartag_jetson.pipeline.detection_cache build video6.avi --crops --reads
+    python3 -m eartag_jetson.pipeline.detection_cache from-sidecar session_*.jsonl --out s.detcache
+    python3 -m eartag_jetson.pipeline.detection_cache replay video6.detcache --edge-margin 350
+"""
+import os
+import json
+import argparse
+import numpy as np
+from eartag_jetson.common.capture import open_capture
+from eartag_jetson.pipeline.roster import HerdRoster
+from eartag_jetson.pipeline.summary import (
+    EDGE_MARGIN, CLOSE_THRESH, TOP_N, new_agg, fold_reads, build_summary
+)
+
+TEXT_DTYPE = "<U16"
+
+
+class DetectionCacheWriter:
+    """Accumulates per-frame boxes (and optionally reads/crops) and writes a cache."""
+
+    def __init__(self, path: str, *, with_crops: bool = False, with_reads: bool = False):
+        self.path       = path
+        self.with_crops = with_crops
+        self.with_reads = with_reads
+        self._boxes: list[tuple] = []
+        self._offsets   = [0]
+        self._texts: list[str] = []
+        self._confs: list[float] = []
+        self._crop_offsets = [0]
+        self._crop_shapes: list[tuple] = []
+        os.makedirs(path, exist_ok=True)
+        self._crop_file = open(os.path.join(path, "crops.u8"), "wb") if with_crops else None
+
+    def add_frame(self, dets, reads=None, crops=None):
+        self._boxes.extend(tuple(d[:5]) for d in dets)
+        self._offsets.append(len(self._boxes))
+        if self.with_reads:
+            reads = reads if reads is not None else [None] * len(dets)
+            for read in reads:
+                self._texts.append(read[0] if read is not None else "")
+                self._confs.append(float(read[1]) if read is not None else -1.0)
+        if self.with_crops:
+            for crop in crops:
+                crop = np.ascontiguousarray(crop, dtype=np.uint8)
+                if crop.ndim == 2:
+                    crop = crop[:, :, None]
+                self._crop_file.write(crop.tobytes())
+                self._crop_offsets.append(self._crop_offsets[-1] + crop.nbytes)
+                self._crop_shapes.append(crop.shape)
+
+    def close(self, *, video: str = "", width: int = 0, height: int = 0, fps: float = 0.0):
+        np.save(os.path.join(self.path, "offsets.npy"), np.asarray(self._offsets, dtype=np.int64))
+        np.save(os.path.join(self.path, "boxes.npy"),
+                np.asarray(self._boxes, dtype=np.float32).reshape(-1, 5))
+        if self.with_reads:
+            np.save(os.path.join(self.path, "texts.npy"), np.asarray(self._texts, dtype=TEXT_DTYPE))
+            np.save(os.path.join(self.path, "confs.npy"), np.asarray(self._confs, dtype=np.float32))
+        if self.with_crops:
+            self._crop_file.close()
+            np.save(os.path.join(self.path, "crop_offsets.npy"),
+                    np.asarray(self._crop_offsets, dtype=np.int64))
+            np.save(os.path.join(self.path, "crop_shapes.npy"),
+                    np.asarray(self._crop_shapes, dtype=np.int32).reshape(-1, 3))
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({
+                "video": video,
+                "frames": len(self._offsets) - 1,
+                "boxes": len(self._boxes),
+                "width": width,
+                "height": height,
+                "fps": fps,
+                "has_reads": self.with_reads,
+                "has_crops": self.with_crops,
+            }, f, indent=2)
+
+
+class DetectionCache:
+    """Read side: memory-mapped access to one cached video."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+        self.offsets   = load("offsets.npy")
+        self.boxes     = load("boxes.npy")
+        self.has_reads = self.meta["has_reads"]
+        self.has_crops = self.meta["has_crops"]
+        if self.has_reads:
+            self.texts = load("texts.npy")
+            self.confs = load("confs.npy")
+        if self.has_crops:
+            self.crop_offsets = load("crop_offsets.npy")
+            self.crop_shapes  = load("crop_shapes.npy")
+            size = int(self.crop_offsets[-1])
+            self.crop_bytes = (
+                np.memmap(os.path.join(path, "crops.u8"), dtype=np.uint8, mode="r")
+                if size else np.zeros(0, dtype=np.uint8)
+            )
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def width(self) -> int:
+        if not self.meta.get("width"):
+            raise ValueError(f"{self.path} does not record its capture width")
+        return self.meta["width"]
+
+    @property
+    def fps(self) -> float:
+        return self.meta.get("fps") or 10.0
+
+    def _range(self, idx: int) -> range:
+        return range(int(self.offsets[idx]), int(self.offsets[idx + 1]))
+
+    def frame_dets(self, idx: int) -> list[tuple[int, int, int, int, float]]:
+        return [
+            (int(b[0]), int(b[1]), int(b[2]), int(b[3]), float(b[4]))
+            for b in self.boxes[self.offsets[idx]:self.offsets[idx + 1]]
+        ]
+
+    def frame_box_count(self, idx: int) -> int:
+        return int(self.offsets[idx + 1] - self.offsets[idx])
+
+    def frame_reads(self, idx: int) -> list[tuple[str, float] | None]:
+        return [
+            (str(self.texts[j]), float(self.confs[j])) if self.confs[j] >= 0 else None
+            for j in self._range(idx)
+        ]
+
+    def frame_crops(self, idx: int) -> list[np.ndarray]:
+        if not self.has_crops:
+            raise ValueError(f"{self.path} was built without crops")
+        crops = []
+        for j in self._range(idx):
+            a, b = int(self.crop_offsets[j]), int(self.crop_offsets[j + 1])
+            crop = self.crop_bytes[a:b].reshape(tuple(self.crop_shapes[j]))
+            crops.append(crop[:, :, 0] if crop.shape[2] == 1 else crop)
+        return crops
+
+
+# ─── building ────────────────────────────────────────────────────────────────
+def build_from_video(detector, video: str, out: str, *, with_crops=False, with_reads=False,
+                     logger=None) -> str:
+    """Run YOLO (and OCR, if `with_reads`) once over `video` and cache the result."""
+    cap, info = open_capture(video, logger=logger)
+    writer = DetectionCacheWriter(out, with_crops=with_crops, with_reads=with_reads)
+    frames = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            dets = detector.detect(frame)
+            crops = detector.crop(frame, dets) if (with_crops or with_reads) else None
+            reads = detector.read_crops(crops) if with_reads else None
+            writer.add_frame(dets, reads, crops)
+            frames += 1
+            if logger and frames % 100 == 0:
+                logger.info(f"Cached {frames} frames of {video}")
+    finally:
+        cap.release()
+    writer.close(video=video, width=info.width, height=info.height, fps=info.fps)
+    return out
+
+
+def build_from_sidecars(sidecars: list[str], out: str, *, width: int, height: int = 0) -> str:
+    """Convert recorder .jsonl sidecars (boxes + OCR texts) into a cache."""
+    from eartag_jetson.data_collection.recorder import read_sidecar
+    writer = DetectionCacheWriter(out, with_reads=True)
+    for path in sidecars:
+        for rec in read_sidecar(path):
+            reads = rec["texts"] or [None] * len(rec["boxes"])
+            writer.add_frame(rec["boxes"], [tuple(r) if r else None for r in reads])
+    writer.close(video=",".join(sidecars), width=width, height=height)
+    return out
+
+
+# ─── replay ──────────────────────────────────────────────────────────────────
+def replay_agg(cache: DetectionCache, *, detector=None, reocr: bool = False,
+               start: int = 0, stop: int | None = None, tracked: bool = False, roster=None):
+    """
+    Rebuild the session aggregate from the cache. Without a detector the cached
+    reads are folded directly (no models needed); with one, frames go through
+    `detector.replay_and_aggregate`, which can re-OCR the cached crops.
+    """
+    agg = new_agg(tracked=tracked)
+    stop = len(cache) if stop is None else stop
+    for idx in range(start, stop):
+        if detector is not None:
+            detector.replay_and_aggregate(cache, idx, agg, reocr=reocr)
+        else:
+            fold_reads(cache.frame_dets(idx), cache.frame_reads(idx), agg, roster=roster)
+    return agg
+
+
+def replay_summary(cache: DetectionCache, *, edge_margin=EDGE_MARGIN, close_thresh=CLOSE_THRESH,
+                   top_n=TOP_N, agg=None, **kw) -> list[str]:
+    """Left-to-right tags of the cached session under the given summary settings."""
+    agg = agg if agg is not None else replay_agg(cache, **kw)
+    return build_summary(
+        agg,
+        frame_width=cache.width,
+        edge_margin=edge_margin,
+        close_thresh=close_thresh,
+        top_n=top_n,
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build or replay YOLO detection caches")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    bp = sub.add_parser("build", help="run YOLO over a video and cache the boxes")
+    bp.add_argument("video")
+    bp.add_argument("--out", help="cache directory (default: <video>.detcache)")
+    bp.add_argument("--crops", action="store_true", help="also store the RGB crops")
+    bp.add_argument("--reads", action="store_true", help="also store OCR reads")
+    bp.add_argument("--weights", help="YOLO .pt weights (default: resources/seg_model.pt)")
+
+    sp = sub.add_parser("from-sidecar", help="convert recorder sidecars into a cache")
+    sp.add_argument("sidecars", nargs="+")
+    sp.add_argument("--out", required=True)
+    sp.add_argument("--width", type=int, required=True, help="capture width of the recording")
+
+    rp = sub.add_parser("replay", help="print the session summary from a cache")
+    rp.add_argument("cache")
+    rp.add_argument("--edge-margin", type=int, default=EDGE_MARGIN)
+    rp.add_argument("--close-thresh", type=int, default=CLOSE_THRESH)
+    rp.add_argument("--top-n", type=int, default=TOP_N)
+    rp.add_argument("--reocr", action="store_true", help="re-run OCR on cached crops")
+    rp.add_argument("--track", action="store_true", help="aggregate per tracked tag")
+    rp.add_argument("--roster", help="herd roster file (accept only these tag IDs)")
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        from eartag_jetson.common.common_utils import get_logger
+        from eartag_jetson.pipeline.multi_detector import StallMultiDetector
+        logger = get_logger("detection_cache")
+        detector = StallMultiDetector(
+            caps={}, api_endpoint="", min_detections=0, streak_threshold=0,
+            logger=logger, weights=args.weights,
+        )
+        try:
+            out = args.out or os.path.splitext(args.video)[0] + ".detcache"
+            build_from_video(detector, args.video, out, with_crops=args.crops,
+                             with_reads=args.reads, logger=logger)
+        finally:
+            detector.shutdown()
+        print(f"[INFO] Cache written to {out}")
+
+    elif args.cmd == "from-sidecar":
+        build_from_sidecars(args.sidecars, args.out, width=args.width)
+        print(f"[INFO] Cache written to {args.out}")
+
+    elif args.cmd == "replay":
+        cache = DetectionCache(args.cache)
+        roster = HerdRoster.from_file(args.roster) if args.roster else None
+        detector = None
+        if args.reocr or not cache.has_reads:
+            from eartag_jetson.pipeline.multi_detector import StallMultiDetector
+            detector = StallMultiDetector(
+                caps={}, api_endpoint="", min_detections=0, streak_threshold=0, roster=roster
+            )
+        try:
+            tags = replay_summary(
+                cache, edge_margin=args.edge_margin, close_thresh=args.close_thresh,
+                top_n=args.top_n, detector=detector, reocr=args.reocr, tracked=args.track,
+                roster=roster,
+            )
+        finally:
+            if detector is not None:
+                detector.shutdown()
+        print(tags)
+
+
+if __name__ == "__main__":
+    main()
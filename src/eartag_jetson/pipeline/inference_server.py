@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# pipeline/inference_server.py
+"""
+Optional local inference service shared by all camera workers.
+
+Instead of every camera process holding its own YOLO and PaddleOCR, one
+server process owns the models. Workers connect over a Unix socket
+(multiprocessing.connection) and hand over frames through a per-worker
+shared-memory buffer, so a 12 MP frame is never pickled. Requests arriving
+from all workers within `window_ms` of the first one (up to `max_batch`)
+are run as one batch: YOLO on the frames, then the PaddleOCR angle
+classifier + recognizer on the crops.
+
+    detector = StallMultiDetector(..., inference=InferenceClient())
+
+OCR batches go straight to the recognizer (recognizer.py): the crops are
+already tight YOLO boxes, so the text-detection pass that `ocr.ocr()` runs
+inside every crop is skipped.
+
+Metrics (camera "inference"): queue wait and batch time per model as
+stages, `<model>_batches` / `<model>_items` counters and the batch fill
+(items per batch / max_batch) as a gauge.
+"""
+import os
+import time
+import queue
+import logging
+import argparse
+import threading
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from eartag_jetson.common.log_utils import get_logger
+from eartag_jetson.common.metrics import Metrics, MetricsDumper
+from eartag_jetson.pipeline.recognizer import publish_counts
+
+SOCKET_PATH = os.environ.get("EARTAG_INFERENCE_SOCKET", "/tmp/eartag_inference.sock")
+WINDOW_MS   = float(os.environ.get("EARTAG_INFERENCE_WINDOW_MS", "10"))
+MAX_BATCH   = int(os.environ.get("EARTAG_INFERENCE_MAX_BATCH", "4"))
+
+
+def yolo_dets(result) -> list[tuple[int, int, int, int, float]]:
+    """(x0, y0, x1, y1, conf) of one Ultralytics result, sorted left to right."""
+    return sorted(
+        [
+            (
+                *map(int, box.xyxy[0][:2].tolist()),
+                *map(int, box.xyxy[0][2:].tolist()),
+                float(box.conf[0])
+            )
+            for box in result.boxes
+        ],
+        key=lambda x: x[0]
+    )
+
+
+class _Request:
+    __slots__ = ("payload", "arrived", "done", "result")
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.arrived = time.perf_counter()
+        self.done    = threading.Event()
+        self.result  = None
+
+
+class _Batcher(threading.Thread):
+    """Collects requests for one model into batches and runs them."""
+
+    def __init__(self, name: str, run_batch, *, window_ms: float, max_batch: int,
+                 metrics: Metrics, logger: logging.Logger):
+        super().__init__(name=f"batch-{name}", daemon=True)
+        self.kind      = name
+        self.run_batch = run_batch
+        self.window    = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.metrics   = metrics
+        self.logger    = logger
+        self.queue: queue.Queue[_Request] = queue.Queue()
+
+    def submit(self, payload):
+        req = _Request(payload)
+        self.queue.put(req)
+        req.done.wait()
+        if isinstance(req.result, Exception):
+            raise req.result
+        return req.result
+
+    def run(self):
+        m = self.metrics
+        while True:
+            batch = [self.queue.get()]
+            deadline = batch[0].arrived + self.window
+            while len(batch) < self.max_batch:
+                left = deadline - time.perf_counter()
+                if left <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=left))
+                except queue.Empty:
+                    break
+
+            t0 = time.perf_counter()
+            for req in batch:
+                m.observe(f"{self.kind}_queue", (t0 - req.arrived) * 1000.0)
+            try:
+                results = self.run_batch([req.payload for req in batch])
+            except Exception as e:
+                self.logger.error(f"{self.kind} batch failed: {e}", exc_info=True)
+                results = [e] * len(batch)
+            m.observe_since(f"{self.kind}_batch", t0)
+            m.inc(f"{self.kind}_batches")
+            m.inc(f"{self.kind}_items", len(batch))
+            m.set_gauge(f"{self.kind}_batch_fill", len(batch) / self.max_batch)
+            for req, res in zip(batch, results):
+                req.result = res
+                req.done.set()
+
+
+class InferenceServer:
+    def __init__(self, address: str = SOCKET_PATH, *, window_ms: float = WINDOW_MS,
+                 max_batch: int = MAX_BATCH, weights: str | None = None,
+                 logger: logging.Logger | None = None):
+        from eartag_jetson.pipeline.model_cache import load_models
+        from eartag_jetson.pipeline.recognizer import RECOGNIZER, load_recognizer
+        self.address   = address
+        self.logger    = logger or get_logger("inference")
+        self.model, self.ocr = load_models(weights, self.logger, ocr=RECOGNIZER == "paddle")
+        # crops are tight boxes: no text detection, one recognizer batch
+        self.recognizer = load_recognizer(ocr=self.ocr, detect_text=False, logger=self.logger)
+        self.yolo_batch = max_batch          # drops to 1 if the engine has a fixed batch
+        self.metrics   = Metrics(camera="inference")
+        self.yolo = _Batcher("yolo", self._run_yolo, window_ms=window_ms, max_batch=max_batch,
+                             metrics=self.metrics, logger=self.logger)
+        self.rec  = _Batcher("ocr", self._run_ocr, window_ms=window_ms, max_batch=max_batch,
+                             metrics=self.metrics, logger=self.logger)
+
+    # ─── model calls (batcher threads) ───────────────────────────────────────
+    def _run_yolo(self, frames: list[np.ndarray]) -> list:
+        if self.yolo_batch > 1 and len(frames) > 1:
+            try:
+                return [yolo_dets(r) for r in self.model(frames, verbose=False)]
+            except Exception as e:
+                # TensorRT engines exported with a static batch of 1 reject lists
+                self.logger.warning(f"Batched YOLO failed ({e}); running frames one by one")
+                self.yolo_batch = 1
+        return [yolo_dets(self.model(f, verbose=False)[0]) for f in frames]
+
+    def _run_ocr(self, crop_lists: list[list[np.ndarray]]) -> list:
+        flat = [c for crops in crop_lists for c in crops]
+        reads = self.recognizer.read(flat)
+        publish_counts(self.recognizer, self.metrics)
+        out, i = [], 0
+        for crops in crop_lists:
+            out.append(reads[i:i + len(crops)])
+            i += len(crops)
+        return out
+
+    # ─── connections ─────────────────────────────────────────────────────────
+    def _serve_client(self, conn):
+        shms: dict[str, SharedMemory] = {}
+        try:
+            while True:
+                try:
+                    msg = conn.recv()
+                except EOFError:
+                    break
+                op = msg[0]
+                try:
+                    if op == "detect":
+                        _, name, shape, dtype = msg
+                        shm = shms.get(name)
+                        if shm is None:
+                            # the client owns (and unlinks) the segment: keep
+                            # our resource tracker from unlinking it as well
+                            shm = shms[name] = SharedMemory(name=name)
+                            resource_tracker.unregister(shm._name, "shared_memory")
+                        frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+                        dets = self.yolo.submit(frame)
+                        del frame                  # no view may outlive shm.close()
+                        conn.send(("ok", dets))
+                    elif op == "ocr":
+                        conn.send(("ok", self.rec.submit(msg[1])))
+                    elif op == "release":
+                        shm = shms.pop(msg[1], None)
+                        if shm is not None:
+                            shm.close()
+                        conn.send(("ok", None))
+                    else:
+                        conn.send(("error", f"unknown op {op!r}"))
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+        finally:
+            for shm in shms.values():
+                shm.close()
+            conn.close()
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        dumper = MetricsDumper(self.metrics)
+        dumper.start()
+        self.yolo.start()
+        self.rec.start()
+        with Listener(self.address, family="AF_UNIX") as listener:
+            self.logger.info(
+                f"Inference server on {self.address} "
+                f"(window {self.yolo.window * 1000:.0f} ms, max batch {self.yolo.max_batch})"
+            )
+            try:
+                while True:
+                    conn = listener.accept()
+                    threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+            finally:
+                dumper.stop()
+
+
+def serve(address: str = SOCKET_PATH, window_ms: float = WINDOW_MS, max_batch: int = MAX_BATCH,
+          weights: str | None = None, log_queue=None, cpu_plan=None):
+    """Process entry point (see multi_stream_pipeline, EARTAG_INFERENCE=1)."""
+    logger = get_logger("inference", queue=log_queue)
+    if cpu_plan is not None:
+        from eartag_jetson.pipeline.cpu_plan import apply_plan
+        apply_plan(cpu_plan, logger)
+    try:
+        InferenceServer(address, window_ms=window_ms, max_batch=max_batch,
+                        weights=weights, logger=logger).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+class InferenceClient:
+    """
+    A camera worker's handle on the server. Frames are copied into one
+    shared-memory buffer owned by this client (grown if the frame size
+    changes); crops are small and go over the socket. The buffer is named
+    after the camera, so a restarted worker unlinks the one a killed
+    predecessor left in /dev/shm instead of leaking it. Detection and OCR use
+    separate connections, so a pipelined worker (stage_executor.py) can have
+    one frame in YOLO while the previous one is in OCR; calls are safe from
+    several threads.
+    """
+
+    def __init__(self, address: str = SOCKET_PATH, *, name: str | None = None,
+                 connect_timeout: float = 300.0, logger: logging.Logger | None = None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.shm_name = f"eartag_{name or os.getpid()}"
+        deadline = time.monotonic() + connect_timeout
+        while True:
+            try:
+                self.conn = Client(address, family="AF_UNIX")
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)                  # server still loading its models
+        self.ocr_conn = Client(address, family="AF_UNIX")
+        self.logger.info(f"Connected to inference server at {address}")
+        self._shm: SharedMemory | None = None
+        self._locks = {self.conn: threading.Lock(), self.ocr_conn: threading.Lock()}
+
+    def _call(self, conn, *msg):
+        with self._locks[conn]:
+            conn.send(msg)
+            status, value = conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Inference server: {value}")
+        return value
+
+    def detect(self, frame: np.ndarray) -> list[tuple[int, int, int, int, float]]:
+        with self._locks[self.conn]:             # one frame in the buffer at a time
+            if self._shm is None or self._shm.size < frame.nbytes:
+                if self._shm is not None:
+                    self.conn.send(("release", self._shm.name))
+                    self.conn.recv()
+                    self._shm.close()
+                    self._shm.unlink()
+                self._shm = self._create_shm(frame.nbytes)
+            np.ndarray(frame.shape, dtype=frame.dtype, buffer=self._shm.buf)[...] = frame
+            self.conn.send(("detect", self._shm.name, frame.shape, frame.dtype.str))
+            status, value = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Inference server: {value}")
+        return value
+
+    def _create_shm(self, size: int) -> SharedMemory:
+        try:
+            stale = SharedMemory(name=self.shm_name)
+        except FileNotFoundError:
+            pass
+        else:
+            self.logger.info(f"Removing stale frame buffer /dev/shm/{self.shm_name}")
+            stale.close()
+            stale.unlink()
+        return SharedMemory(name=self.shm_name, create=True, size=size)
+
+    def read(self, crops: list[np.ndarray]) -> list[tuple[str, float] | None]:
+        return self._call(self.ocr_conn, "ocr", [np.ascontiguousarray(c) for c in crops])
+
+    def close(self):
+        self.conn.close()
+        self.ocr_conn.close()
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Batched YOLO/PaddleOCR service for camera workers")
+    ap.add_argument("--socket", default=SOCKET_PATH)
+    ap.add_argument("--window-ms", type=float, default=WINDOW_MS)
+    ap.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    ap.add_argument("--weights", help="YOLO .pt weights (default: resources/seg_model.pt)")
+    args = ap.parse_args()
+    serve(args.socket, args.window_ms, args.max_batch, args.weights)
+
+
+if __name__ == "__main__":
+    main()
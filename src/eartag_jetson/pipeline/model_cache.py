@@ -0,0 +1,133 @@
+# pipeline/model_cache.py
+"""
+YOLO + PaddleOCR loaded once per process (or once per zygote).
+
+The pipelines build a new detector for every milking session; before this
+cache every session re-read the YOLO weights and rebuilt the PaddleOCR
+predictors. `load_models` keeps one (model, ocr) pair per weights file.
+
+`preload()` fills the cache in the forkserver zygote (see zygote.py) so
+forked camera workers share the weight pages copy-on-write instead of each
+holding a private copy. Only CPU-resident state is preloaded: a CUDA context
+must not exist before fork, so TensorRT engines are opened lazily by the
+worker (Ultralytics builds the backend on first predict) and PaddleOCR is
+only preloaded when Paddle runs on the CPU.
+
+`EARTAG_PRECISION` (fp32, fp16 or int8) picks the YOLO backend:
+seg_model.engine for fp32, seg_model.<precision>.engine otherwise. FP16
+engines are exported on first use like the fp32 one; INT8 needs calibration
+frames, so it is built offline by quantize.py. Missing INT8 engines fall
+back to the fp32 engine, then to seg_model.int8.onnx (the CPU build).
+"""
+import os
+import gc
+import logging
+from ultralytics import YOLO
+from paddleocr import PaddleOCR
+from eartag_jetson.common.common_utils import find_project_root, export_yolo_to_engine
+from eartag_jetson.pipeline.cpu_plan import cpu_threads
+from eartag_jetson.pipeline.recognizer import RECOGNIZER
+
+PRECISION = os.environ.get("EARTAG_PRECISION", "fp32")
+PRECISIONS = ("fp32", "fp16", "int8")
+
+_MODELS: dict[str, tuple] = {}       # weights path → (yolo, ocr)
+
+
+def default_weights() -> str:
+    return os.path.join(find_project_root(), "src", "eartag_jetson", "resources", "seg_model.pt")
+
+
+def engine_path(pt: str, precision: str = "fp32") -> str:
+    stem = os.path.splitext(pt)[0]
+    return f"{stem}.engine" if precision == "fp32" else f"{stem}.{precision}.engine"
+
+
+def onnx_int8_path(pt: str) -> str:
+    return os.path.splitext(pt)[0] + ".int8.onnx"
+
+
+def _backends(pt: str, precision: str) -> list[str]:
+    """Model files to try for `precision`, best first."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"EARTAG_PRECISION must be one of {PRECISIONS}, got {precision!r}")
+    paths = [engine_path(pt, precision)]
+    if precision != "fp32":
+        paths.append(engine_path(pt))
+    if precision == "int8":
+        paths.append(onnx_int8_path(pt))
+    return paths
+
+
+def _load_yolo(pt: str, logger: logging.Logger, export: bool, precision: str = PRECISION):
+    logger.info("Loading YOLO…")
+    model_pt = YOLO(pt, task="detect")
+    # INT8 needs calibration frames: quantize.py builds that engine offline
+    if export and precision != "int8":
+        export_yolo_to_engine(model_pt, engine_path(pt, precision), logger, precision=precision)
+    for path in _backends(pt, precision):
+        if os.path.exists(path):
+            logger.info(f"YOLO backend: {os.path.basename(path)}")
+            return YOLO(path, task="detect")
+    if precision != "fp32":
+        logger.warning(f"No {precision} YOLO model next to {pt}; running the .pt weights")
+    # CPU-only hosts never get an engine; keep running on the .pt weights
+    return model_pt
+
+
+def load_ocr(logger: logging.Logger | None = None, *, threads: int | None = None):
+    logger = logger or logging.getLogger(__name__)
+    logging.getLogger("ppocr").setLevel(logging.ERROR)
+    logger.info("Init PaddleOCR…")
+    # sized to this worker's share of the cores (cpu_plan.py); Paddle's default otherwise
+    threads = threads or cpu_threads()
+    return PaddleOCR(
+        use_angle_cls=True,
+        lang="en",
+        ocr_version="PP-OCRv4",
+        use_space_char=True,
+        drop=0.9,
+        **({"cpu_threads": threads} if threads else {}),
+    )
+
+
+def load_models(weights: str | None = None, logger: logging.Logger | None = None, *,
+                ocr: bool = True):
+    """
+    (yolo, ocr) for `weights`, loaded on first use and reused afterwards.
+    `ocr=False` (digit recognizer, see recognizer.py) skips PaddleOCR: ocr is None.
+    """
+    logger = logger or logging.getLogger(__name__)
+    pt = weights or default_weights()
+    cached = _MODELS.get(pt)
+    if cached is None or (ocr and cached[1] is None):
+        model = cached[0] if cached else _load_yolo(pt, logger, export=True)
+        cached = _MODELS[pt] = (model, load_ocr(logger) if ocr else None)
+    else:
+        logger.info("Reusing loaded YOLO/PaddleOCR")
+    return cached
+
+
+def _paddle_on_cpu() -> bool:
+    import paddle
+    return not paddle.device.is_compiled_with_cuda() or os.environ.get("CUDA_VISIBLE_DEVICES") == ""
+
+
+def preload(weights: str | None = None, logger: logging.Logger | None = None):
+    """
+    Load what can safely be shared across fork, then freeze the GC so
+    collections in the workers don't write to (and un-share) those pages.
+    """
+    logger = logger or logging.getLogger(__name__)
+    pt = weights or default_weights()
+    model = _load_yolo(pt, logger, export=False)      # no GPU work before fork
+    if RECOGNIZER != "paddle":
+        ocr = None
+    elif _paddle_on_cpu():
+        ocr = load_ocr(logger)
+    else:
+        ocr = None
+        logger.info("Paddle uses the GPU; PaddleOCR will load in each worker")
+    _MODELS[pt] = (model, ocr)
+    gc.collect()
+    gc.freeze()
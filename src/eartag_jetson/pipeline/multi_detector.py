@@ -1,14 +1,34 @@
 # pipeline/stall_mult.py
 
-import os, glob, cv2, logging, re, time, multiprocessing
+import os, glob, cv2, logging, time, multiprocessing
 from collections import defaultdict
-from ultralytics import YOLO
 import threading
-from paddleocr import PaddleOCR
-from concurrent.futures import ThreadPoolExecutor
-from eartag_jetson.common.common_utils import (
-    find_project_root, export_yolo_to_engine, get_logger
-)
+from eartag_jetson.common.common_utils import get_logger
+from eartag_jetson.common.log_utils import FrameLogSampler
+from eartag_jetson.common.metrics import Metrics
+from eartag_jetson.common.profiling import WorkerProfiler
+from eartag_jetson.common.capture import CaptureInfo, FrameScaler, negotiate, open_capture, read_timed
+from eartag_jetson.data_collection.recorder import SessionRecorder
+from eartag_jetson.pipeline.deadline import IMGSZ, STEPS, DeadlineScheduler
+from eartag_jetson.pipeline.inference_server import InferenceClient, yolo_dets
+from eartag_jetson.pipeline.model_cache import load_models
+from eartag_jetson.pipeline.ocr_concurrency import ADAPT, ConcurrencyController
+from eartag_jetson.pipeline.recognizer import COARSE_HEIGHT, RECOGNIZER, load_recognizer, publish_counts
+from eartag_jetson.pipeline.roster import HerdRoster
+from eartag_jetson.pipeline.session_store import SessionStore
+from eartag_jetson.pipeline.stage_executor import Stage, StageExecutor
+from eartag_jetson.pipeline.summary import fold_reads, new_agg
+from eartag_jetson.pipeline.tracker import MIN_READS
+
+class _FrameJob:
+    """One frame on its way through the stages."""
+    __slots__ = ("frame", "ts", "t0", "dets", "log", "tracks", "todo", "crops", "reads")
+
+    def __init__(self, frame, ts: float | None = None):
+        self.frame = frame
+        self.ts    = ts or time.time()    # capture time (read_timed)
+        self.t0    = time.perf_counter()
+
 
 class StallMultiDetector:
     def __init__(
@@ -16,70 +36,126 @@ class StallMultiDetector:
         *,
         sources: list[str] | None = None,
         caps: dict[int, cv2.VideoCapture] | None = None,
+        capture_info: CaptureInfo | None = None,
         api_endpoint: str,
         min_detections: int,
         streak_threshold: int,
         logger: logging.Logger | None = None,
+        weights: str | None = None,
+        metrics: Metrics | None = None,
+        profiler: WorkerProfiler | None = None,
+        heartbeat=None,
+        recorder: SessionRecorder | None = None,
+        end_threshold_ratio: float = 0.4,
+        end_timeout: float = 4.0,
+        detect_scale: float = 1.0,
+        inference: InferenceClient | None = None,
+        track: bool = True,
+        settle_p: float = 0.999,
+        roster: HerdRoster | None = None,
+        stage_workers: dict[str, int] | None = None,
+        pipeline_depth: int = 2,
+        coarse_height: int = COARSE_HEIGHT,
+        frame_budget_ms: float = 0.0,
+        degrade_order: tuple[str, ...] = STEPS,
+        ocr_workers: int | None = None,
+        store: SessionStore | None = None,
+        reconnect_since: float | None = None,
     ):
         self.logger         = logger or get_logger("multi_cam_detector")
+        self.frame_log      = FrameLogSampler()
+        self._log_frame     = False
         self.api_endpoint   = api_endpoint
         self.min_detections = min_detections
         self.streak_threshold = streak_threshold
+        self.end_threshold_ratio = end_threshold_ratio
+        self.end_timeout    = end_timeout
+        self.weights        = weights
+        self.metrics        = metrics or Metrics()
+        self.profiler       = profiler
+        self.heartbeat      = heartbeat       # camera_supervisor.Heartbeat, if supervised
+        # camera back (or worker restarted) at this time: the first frame read
+        # is observed as the `reconnect` stage
+        self.reconnect_since = reconnect_since
+        self.recorder       = recorder
+        # YOLO runs on a downscaled copy; crops still come from the full frame
+        self.scaler         = FrameScaler(detect_scale)
+        # models live in the shared inference server instead of this process
+        self.inference      = inference
+        self.track          = track           # aggregate per tracked tag, not per OCR string
+        self.settle_p       = settle_p        # tracked tags this sure are not OCR'd again
+        self.roster         = roster          # accept herd IDs only (roster.py)
+        # checkpoint the running session's aggregate (session_store.py)
+        self.store          = store
+        self._session_id    = None
+        # overlap the stages of consecutive frames (None: one frame at a time)
+        self.stage_workers  = stage_workers
+        self.pipeline_depth = pipeline_depth
+        # do less per frame while frames cost more than the budget (deadline.py)
+        self.deadline       = None
+        if frame_budget_ms > 0:
+            self.deadline = DeadlineScheduler(frame_budget_ms, order=degrade_order,
+                                              metrics=self.metrics, logger=self.logger)
+            if inference is not None:
+                self.deadline.disable("imgsz", "YOLO runs in the inference server")
 
         # ─── load models ─────────────────────────────────────────────────────
-        self.model, self.ocr = self._init_models()
-        # ─── OCR lock ─────────────────────────────────────────────────────────
-        # ensure only one thread ever calls into PaddleOCR at a time
-        self.ocr_lock = threading.Lock()
+        self.model, self.ocr = (None, None) if inference is not None else self._init_models()
+        self.yolo_lock = threading.Lock()
         # ─── dynamic OCR thread‐pool ─────────────────────────────────────────
+        # ocr_workers comes from the worker's CPU plan (cpu_plan.py) when set
         cpu_total = multiprocessing.cpu_count()
         reserved  = 1
-        workers   = max(1, cpu_total - reserved)
-        self.logger.info(f"Starting OCR pool: {workers}/{cpu_total} cores")
-        self.ocr_executor = ThreadPoolExecutor(max_workers=workers)
+        workers   = ocr_workers or max(1, cpu_total - reserved)
+        self.ocr_workers = workers
+        # ─── recognizer (PaddleOCR on the pool, or the digit model) ──────────
+        self.recognizer = None
+        if inference is None:
+            self.recognizer = load_recognizer(ocr=self.ocr, workers=workers,
+                                              coarse_height=coarse_height, logger=self.logger)
+            if self.recognizer.name == "paddle":
+                self.logger.info(f"Starting OCR pool: up to {self.recognizer.max_workers} "
+                                 f"PaddleOCR instances, {workers}/{cpu_total} cores")
+        # ─── instances actually used, tuned from measured throughput ─────────
+        self.ocr_control = None
+        max_workers = getattr(self.recognizer, "max_workers", 1)
+        if self.recognizer is not None and ADAPT and max_workers > 1:
+            self.ocr_control = ConcurrencyController(max_workers, metrics=self.metrics, logger=self.logger)
+            self.recognizer.set_workers(self.ocr_control.workers)
 
         # ─── set up captures ─────────────────────────────────────────────────
+        self.capture_infos: dict[int, CaptureInfo] = {}
+        self.stream_ended   = False
+        # pre-opened captures belong to the caller and outlive this detector
+        self._owns_caps     = caps is None
         if caps is not None:
             self.caps = caps
             self.logger.info(f"Using {len(caps)} pre-opened captures")
+            if capture_info is not None:
+                self.capture_infos[0] = capture_info
+            else:
+                for i, cap in caps.items():
+                    self.capture_infos[i] = negotiate(cap, i, logger=self.logger)
         else:
             assert sources, "Must give sources or caps"
             self.caps = self._init_captures(sources)
+        self.capture_infos = {
+            i: info.with_detect_scale(detect_scale) for i, info in self.capture_infos.items()
+        }
+
+    @property
+    def capture_info(self) -> CaptureInfo | None:
+        """Negotiated metadata of the first camera (the one a worker process owns)."""
+        return self.capture_infos.get(0)
 
     def _init_models(self):
-        base = find_project_root()
-        res  = os.path.join(base, "src", "eartag_jetson", "resources")
-        pt   = os.path.join(res, "seg_model.pt")
-        eng  = os.path.join(res, "seg_model.engine")
-
-        logging.getLogger("ppocr").setLevel(logging.ERROR)
-        self.logger.info("Loading YOLO…")
-        model_pt = YOLO(pt, task="detect")
-        export_yolo_to_engine(model_pt, eng, self.logger)
-        model = YOLO(eng, task="detect")
-
-        self.logger.info("Init PaddleOCR…")
-        ocr = PaddleOCR(
-            use_angle_cls=True,
-            lang="en",
-            ocr_version="PP-OCRv4",
-            use_space_char=True,
-            drop=0.9,
-        )
-        return model, ocr
-        
-    def _safe_ocr(self, crop):
-        """Wrap self.ocr.ocr with a lock to prevent concurrent C++ calls."""
-        with self.ocr_lock:
-            return self.ocr.ocr(crop)
+        # loaded once per process (or preloaded in the zygote), not per session
+        return load_models(self.weights, self.logger, ocr=RECOGNIZER == "paddle")
 
     def _init_captures(self, sources):
         caps = {}
         for i, src in enumerate(sources):
-            src_obj = int(src) if isinstance(src, str) and src.isdigit() else src
-            cap = cv2.VideoCapture(src_obj)
-            if not cap.isOpened():
-                raise IOError(f"Cannot open {src}")
+            cap, self.capture_infos[i] = open_capture(src, logger=self.logger)
             caps[i] = cap
             self.logger.info(f"Camera {i} → {src}")
         return caps
@@ -93,57 +169,215 @@ class StallMultiDetector:
         devs = [os.path.realpath(lnk) for lnk in links if os.path.realpath(lnk).startswith("/dev/video")]
         return sorted(set(devs), key=lambda d: int(d.split("video")[-1]))
         
-    def detect_and_aggregate(self, frame, agg):
-        res = self.model(frame)
-        dets = sorted(
-            [
-                (
-                    *map(int, box.xyxy[0][:2].tolist()),
-                    *map(int, box.xyxy[0][2:].tolist()),
-                    float(box.conf[0])
-                )
-                for box in res[0].boxes
-            ],
-            key=lambda x: x[0]
-        )
-        self.logger.info(f"YOLO → {len(dets)} boxes")
-
-        tasks = []
-        for (x0, y0, x1, y1, conf) in dets:
-            crop = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
-            fut  = self.ocr_executor.submit(self._safe_ocr, crop)
-            tasks.append((x0, y0, x1, y1, fut))
-
-        valid = 0
-        for idx, (x0, y0, x1, y1, fut) in enumerate(tasks):
-            out = fut.result()
-            if not out or not out[0]:
-                continue
-
-            text, confidence = out[0][0][1]
-
-            self.logger.debug(f"OCR on box {idx}: '{text}' ({confidence:.2f})")
-            if re.fullmatch(r"\d{4}", text):
-                valid += 1
-                entry = agg[text]
-                entry["count"]  += 1
-                entry["x_list"].append(x0)
-                self.logger.info(f"Accepted tag {text} at x={x0}")
+    # ─── per-frame stages ────────────────────────────────────────────────────
+    def detect(self, frame) -> list[tuple[int, int, int, int, float]]:
+        """
+        Run YOLO on a frame; returns full-resolution (x0, y0, x1, y1, conf)
+        sorted left to right. With detect_scale < 1 the model sees the
+        downscaled buffer and the boxes are mapped back.
+        """
+        # one YOLO call at a time (the scaler buffer and the model are shared)
+        with self.yolo_lock:
+            small = self.scaler(frame)
+            if self.inference is not None:
+                dets = self.inference.detect(small)
+            elif self.deadline is None:
+                dets = yolo_dets(self.model(small)[0])
+            else:
+                dets = yolo_dets(self._predict_sized(small))
+        return self.scaler.to_full(dets, frame.shape[1], frame.shape[0])
+
+    def _predict_sized(self, small):
+        # imgsz is always passed: Ultralytics keeps the last one for later calls
+        imgsz = self.deadline.imgsz()
+        try:
+            return self.model(small, imgsz=imgsz)[0]
+        except Exception as e:
+            if imgsz == IMGSZ:
+                raise
+            # fixed-shape models (static TensorRT engines) reject other sizes
+            self.deadline.disable("imgsz", str(e))
+            return self.model(small, imgsz=IMGSZ)[0]
+
+    @staticmethod
+    def crop(frame, dets) -> list:
+        """Cut the RGB crop of every detection out of the BGR frame."""
+        return [
+            cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+            for (x0, y0, x1, y1, _) in dets
+        ]
+
+    def read_crops(self, crops) -> list[tuple[str, float] | None]:
+        """OCR every crop with the recognizer; returns (text, confidence) or None per crop."""
+        if self.inference is not None:
+            return self.inference.read(crops)
+        t0 = time.perf_counter()
+        reads = self.recognizer.read(crops)
+        if self.ocr_control is not None:
+            n = self.ocr_control.record(len(crops), time.perf_counter() - t0)
+            if n is not None:
+                self.recognizer.set_workers(n)
+        self.metrics.set_gauge("ocr_queue_depth", getattr(self.recognizer, "queue_depth", 0))
+        publish_counts(self.recognizer, self.metrics)
+        return reads
+
+    def pending(self, dets, agg):
+        """
+        (tracks, indices of the boxes that still need OCR). With a tracked
+        `agg` the boxes are assigned to tracks first and settled tracks are
+        skipped; otherwise every box is read and tracks is None.
+        """
+        if not hasattr(agg, "assign"):
+            return None, range(len(dets))
+        if self.deadline is not None:
+            agg.settle_p, agg.min_reads = self.deadline.settle(self.settle_p, MIN_READS)
+        tracks = agg.assign(dets)
+        return tracks, [i for i, track in enumerate(tracks) if not track.settled]
+
+    @staticmethod
+    def scatter(reads, todo, n) -> list:
+        """Reads of the `todo` boxes back at their box index (None elsewhere)."""
+        if len(reads) == n:
+            return reads
+        full = [None] * n
+        for i, read in zip(todo, reads):
+            full[i] = read
+        return full
+
+    def aggregate(self, dets, reads, agg, tracks=None) -> int:
+        """Fold the OCR reads of one frame into `agg`; returns the accepted count."""
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for idx, read in enumerate(reads):
+                if read is not None:
+                    self.logger.debug("OCR on box %d: '%s' (%.2f)", idx, *read)
 
+        accepted = fold_reads(dets, reads, agg, tracks, self.roster)
+        if self.roster is not None:
+            for name, n in self.roster.take_counts().items():
+                self.metrics.inc(name, n)
+        if self._log_frame:
+            for text, x0 in accepted:
+                self.logger.info("Accepted tag %s at x=%d", text, x0)
+        return len(accepted)
+
+    # ─── the stages of one frame ─────────────────────────────────────────────
+    # run back to back by detect_and_aggregate, or overlapped across frames by
+    # a StageExecutor (crop and aggregate touch session state: ordered stages)
+    def _stage_yolo(self, job: "_FrameJob") -> "_FrameJob":
+        t0 = time.perf_counter()
+        job.dets = self.detect(job.frame)
+        self.metrics.observe_since("yolo", t0)
+        return job
+
+    def _stage_crop(self, job: "_FrameJob", agg) -> "_FrameJob":
+        t0 = time.perf_counter()
+        # per-frame lines are written for at most one frame per interval
+        job.log = self.frame_log()
+        if job.log:
+            self.logger.info(
+                "YOLO → %d boxes (%d frames not logged)", len(job.dets), self.frame_log.take_skipped()
+            )
+        job.tracks, job.todo = self.pending(job.dets, agg)
+        job.crops = self.crop(job.frame, [job.dets[i] for i in job.todo])
+        self.metrics.observe_since("crop", t0)
+        return job
+
+    def _stage_ocr(self, job: "_FrameJob") -> "_FrameJob":
+        t0 = time.perf_counter()
+        job.reads = self.scatter(self.read_crops(job.crops), job.todo, len(job.dets))
+        self.metrics.observe_since("ocr", t0)
+        return job
+
+    def _stage_aggregate(self, job: "_FrameJob", agg) -> tuple[int, int]:
+        m  = self.metrics
+        t0 = time.perf_counter()
+        self._log_frame = job.log
+        valid = self.aggregate(job.dets, job.reads, agg, job.tracks)
+        t1 = m.observe_since("aggregate", t0)
+        cost_ms = (t1 - job.t0) * 1000.0
+        m.observe("frame", cost_ms)
+        if self.deadline is not None:
+            self.deadline.observe(cost_ms)
+        if self.recorder is not None:
+            self.recorder.submit(job.frame, job.dets, job.reads, ts=job.ts)
+        if self.store is not None and self._session_id is not None:
+            self.store.checkpoint(self._session_id, agg)
+
+        m.mark_frame()
+        m.inc("ocr_calls", len(job.crops))
+        m.inc("ocr_skipped", len(job.dets) - len(job.crops))
+        m.inc("accepted_reads", valid)
+        if self.profiler is not None:
+            self.profiler.tick()
+        if self.heartbeat is not None:
+            self.heartbeat.beat(m)
+        return len(job.dets), valid
+
+    def detect_and_aggregate(self, frame, agg, ts: float | None = None):
+        job = self._stage_yolo(_FrameJob(frame, ts))
+        job = self._stage_ocr(self._stage_crop(job, agg))
+        return self._stage_aggregate(job, agg)
+
+    def stage_executor(self, agg) -> StageExecutor:
+        """
+        The per-frame stages as a StageExecutor: submit (frame, capture ts)
+        pairs, get (boxes, accepted) per frame back in order, folded into `agg`.
+        """
+        workers = self.stage_workers or {}
+        return StageExecutor([
+            Stage("yolo", lambda item: self._stage_yolo(_FrameJob(*item)),
+                  workers=workers.get("yolo", 1)),
+            Stage("crop", lambda job: self._stage_crop(job, agg), ordered=True),
+            Stage("ocr", self._stage_ocr, workers=workers.get("ocr", 1)),
+            Stage("aggregate", lambda job: self._stage_aggregate(job, agg), ordered=True),
+        ], depth=self.pipeline_depth, metrics=self.metrics)
+
+    def replay_and_aggregate(self, cache, idx, agg, *, reocr: bool = False):
+        """
+        `detect_and_aggregate` for frame `idx` of a DetectionCache: boxes come
+        from the cache instead of YOLO, and OCR reads too unless `reocr` (or the
+        cache has none), in which case the cached crops are OCR'd again.
+        """
+        dets = cache.frame_dets(idx)
+        if cache.has_reads and not reocr:
+            reads = cache.frame_reads(idx)
+        else:
+            crops = cache.frame_crops(idx)
+            reads = self.read_crops(crops)
+            self.metrics.inc("ocr_calls", len(crops))
+        valid = self.aggregate(dets, reads, agg)
         return len(dets), valid
 
+    def read_frame(self, cid: int):
+        """
+        `cap.read()` of camera `cid` timed as capture (grab) and decode
+        (retrieve); on GStreamer "capture+decode" and "retrieve", see CaptureInfo;
+        failed reads count as dropped frames. Returns (ret, frame, capture ts).
+        """
+        ret, frame, grab_s, decode_s, ts = read_timed(self.caps[cid])
+        info = self.capture_infos.get(cid)
+        self.metrics.observe(info.grab_stage if info else "capture", grab_s * 1000.0)
+        self.metrics.observe(info.decode_stage if info else "decode", decode_s * 1000.0)
+        if not ret:
+            self.metrics.inc("dropped_frames")
+        elif self.reconnect_since is not None:
+            self.metrics.observe("reconnect", (ts - self.reconnect_since) * 1000.0)
+            self.reconnect_since = None
+        return ret, frame, ts
 
     def wait_for_milking(self) -> bool:
         self.logger.info("Waiting for milking…")
         while True:
-            for cid, cap in self.caps.items():
-                ret, frame = cap.read()
+            for cid in self.caps:
+                ret, frame, ts = self.read_frame(cid)
                 if not ret:
                     self.logger.warning(f"Stream {cid} ended")
+                    self.stream_ended = True
                     return False
                 boxes, valid = self.detect_and_aggregate(
                     frame,
-                    defaultdict(lambda: {"count":0,"x_list":[]})
+                    defaultdict(lambda: {"count":0,"x_list":[]}),
+                    ts,
                 )
                 if boxes >= self.min_detections:
                     self.logger.info(f"Milking on cam {cid}")
@@ -151,36 +385,67 @@ class StallMultiDetector:
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 return False
 
-    def run_milking_session(self):
+    def _session_over(self, boxes: int) -> bool:
+        """End rule: boxes stay below end_threshold_ratio × peak for end_timeout s."""
+        self._peak = max(self._peak, boxes)
+        if self._peak >= self.min_detections:
+            if boxes < self._peak * self.end_threshold_ratio and self._end_start is None:
+                self._end_start = time.time()
+            elif boxes >= self._peak * self.end_threshold_ratio:
+                self._end_start = None
+            if self._end_start and (time.time() - self._end_start) >= self.end_timeout:
+                self.logger.info("Session ended")
+                return True
+        return False
+
+    def run_milking_session(self, session_id: str | None = None):
+        """
+        Aggregate frames until the session ends; with a `session_id` from the
+        store the aggregate is checkpointed there as it grows.
+        """
         self.logger.info("Running session…")
-        agg = defaultdict(lambda: {"count":0,"x_list":[]})
-        peak, end_start = 0, None
-        while True:
-            # here we just pick one cap (you can extend to multi-cap)
-            ret, frame = next(iter(self.caps.values())).read()
-            if not ret:
-                self.logger.info("End of stream")
-                break
-            boxes, valid = self.detect_and_aggregate(frame, agg)
-            peak = max(peak, boxes)
-
-            if peak >= self.min_detections:
-                if boxes < peak * 0.4 and end_start is None:
-                    end_start = time.time()
-                elif boxes >= peak * 0.4:
-                    end_start = None
-                if end_start and (time.time() - end_start) >= 4.0:
-                    self.logger.info("Session ended")
+        agg = new_agg(tracked=self.track, settle_p=self.settle_p) if self.track else new_agg()
+        self._peak, self._end_start = 0, None
+        self._session_id = session_id
+        # pipelined: frame t+1 is in YOLO while frame t is in OCR; the end rule
+        # sees results a few frames late
+        ex = self.stage_executor(agg).start() if self.stage_workers is not None else None
+        try:
+            while True:
+                # here we just pick one cap (you can extend to multi-cap)
+                ret, frame, ts = self.read_frame(next(iter(self.caps)))
+                if not ret:
+                    self.logger.info("End of stream")
+                    self.stream_ended = True
+                    break
+                if self.deadline is not None and not self.deadline.process_frame():
+                    self.deadline.skipped()
+                    results = ex.poll() if ex is not None else []
+                elif ex is None:
+                    results = [self.detect_and_aggregate(frame, agg, ts)]
+                else:
+                    ex.submit((frame, ts))
+                    results = ex.poll()
+                if any(self._session_over(boxes) for boxes, _ in results):
                     break
 
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                return {}, None
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    return {}, None
+        finally:
+            if ex is not None:
+                ex.close()
+                self.logger.info("Stage utilization: " + ", ".join(
+                    f"{name} {util:.0%}" for name, util in ex.utilization().items()
+                ))
+            self._session_id = None
 
-        return agg, end_start
+        return agg, self._end_start
 
     def shutdown(self):
-        self.ocr_executor.shutdown(wait=True)
-        for cap in self.caps.values():
-            cap.release()
+        if self.recognizer is not None:
+            self.recognizer.close()
+        if self._owns_caps:
+            for cap in self.caps.values():
+                cap.release()
         cv2.destroyAllWindows()
         self.logger.info("Shutdown complete.")
@@ -2,15 +2,31 @@
 import os
 os.environ['GLOG_minloglevel'] = '2'
 
-import cv2
+import sys
 import time
+import signal
 import logging
 import serial
 from serial import SerialException
-import numpy as np
 from multiprocessing import get_context
-from eartag_jetson.common.common_utils import get_logger, send_over_esp
+from eartag_jetson.common.capture import open_capture
+from eartag_jetson.common.common_utils import esp_payload, get_logger
+from eartag_jetson.common.log_utils import setup_queue_logging
+from eartag_jetson.common.metrics import Metrics, MetricsDumper, serve_metrics
+from eartag_jetson.common.profiling import WorkerProfiler
+from eartag_jetson.data_collection.recorder import SessionRecorder
+from eartag_jetson.pipeline.camera_supervisor import CameraSupervisor, load_assignments
+from eartag_jetson.pipeline.cpu_plan import apply_plan, plan_cpus
+from eartag_jetson.pipeline.deadline import parse_order
+from eartag_jetson.pipeline.inference_server import InferenceClient, serve as serve_inference
 from eartag_jetson.pipeline.multi_detector import StallMultiDetector
+from eartag_jetson.pipeline.roster import load_roster
+from eartag_jetson.pipeline.session_store import (
+    UPLOAD_URL, DeliveryWorker, SessionStore, http_sender, serial_sender,
+)
+from eartag_jetson.pipeline.stage_executor import parse_stage_workers
+from eartag_jetson.pipeline.stall_config import load_stall_config
+from eartag_jetson.pipeline.summary import build_summary
 
 # ─── CONSTANTS ────────────────────────────────────────────────────────────────
 BLE_CODES      = ["MM2502V0003FMT", "MM2502V0007FMT"]
@@ -18,104 +34,187 @@ PASSWORDS      = ["o8vTaJ",      "TBoWQU"]
 SERIAL_PORT    = "/dev/ttyACM0"
 BAUD_RATE      = 115200
 
-FRAME_WIDTH    = 4608         # fallback if cap.get() returns 0
+# defaults; per-camera values come from stall_config.json (see stall_config.py)
+# pixel values are at 4608 px wide and scaled to the negotiated capture width
 EDGE_MARGIN    = 500          # px to ignore at each side
 CLOSE_THRESH   = 250          # px for collapsing near-duplicates
 TOP_N          = 4            # max number of stalls to keep
 MIN_DETECTIONS = 7            # start session when ≥7 tags visible
 STREAK_THRESH  = 50           # ctor requires it (unused for video)
+LOG_FILE       = os.environ.get("EARTAG_LOG_FILE")   # rotating log file, off by default
+RECORD_DIR     = os.environ.get("EARTAG_RECORD_DIR") # record frames + detections, off by default
+# spawn: every worker imports torch/paddle itself. forkserver: one zygote
+# imports them once and forks warm workers, so restarts take seconds; with
+# EARTAG_PRELOAD_MODELS=1 the zygote also loads the weights, shared by all
+LAUNCH_MODE    = os.environ.get("EARTAG_LAUNCH", "spawn")
+PRELOAD_MODELS = os.environ.get("EARTAG_PRELOAD_MODELS") == "1"
+# one batched YOLO/OCR server for all cameras instead of models per worker
+USE_INFERENCE  = os.environ.get("EARTAG_INFERENCE") == "1"
+# overlap YOLO and OCR of consecutive frames ("1", or workers: "yolo=1,ocr=2")
+STAGE_WORKERS  = parse_stage_workers(os.environ.get("EARTAG_PIPELINE"))
+# pin each worker to its own cores and size its thread pools to them
+CPU_PLAN       = os.environ.get("EARTAG_CPU_PLAN", "1") != "0"
 
-def process_stream(cam_dev: str, password: str, ble_code: str):
-    logger = get_logger(f"proc-{ble_code}")
+def process_stream(cam_dev: str, password: str, ble_code: str, log_queue=None,
+                   reconnect_since: float | None = None, heartbeat=None, cpu_plan=None):
+    logger = get_logger(f"proc-{ble_code}", queue=log_queue)
+    # the supervisor restarts workers with SIGTERM: unwind through the
+    # `finally` below so the inference client unlinks its frame buffer
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if cpu_plan is not None:
+        apply_plan(cpu_plan, logger)             # before any model or pool starts
     logger.info(f"[{ble_code}] Opening camera: {cam_dev}")
+    cfg = load_stall_config(
+        ble_code,
+        edge_margin=EDGE_MARGIN,
+        close_thresh=CLOSE_THRESH,
+        top_n=TOP_N,
+        min_detections=MIN_DETECTIONS,
+        streak_threshold=STREAK_THRESH,
+    )
+    logger.info(f"[{ble_code}] Stall config: {cfg}")
 
-    cap = cv2.VideoCapture(cam_dev)
-    if not cap.isOpened():
-        logger.error(f"[{ble_code}] Cannot open camera {cam_dev}")
+    try:
+        cap, info = open_capture(cam_dev, logger=logger)
+    except IOError as e:
+        logger.error(f"[{ble_code}] {e}")
         return
     logger.info(f"[{ble_code}] Camera stream opened")
 
+    metrics = Metrics(camera=ble_code)
+    dumper  = MetricsDumper(metrics)
+    dumper.start()
+    # EARTAG_PROFILE=<ble_code> or `kill -USR1 <pid>` profiles just this worker
+    profiler = WorkerProfiler(ble_code, metrics=metrics, logger=logger)
+    recorder = None
+    if RECORD_DIR:
+        recorder = SessionRecorder(
+            os.path.join(RECORD_DIR, ble_code),
+            fps=info.fps or 10,
+            prefix=ble_code,
+            logger=logger,
+            metrics=metrics,
+        )
+
     try:
         ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
         time.sleep(2)
         logger.info(f"[{ble_code}] Serial port opened")
     except SerialException as e:
         logger.error(f"[{ble_code}] Serial error: {e}")
+        if recorder is not None:
+            recorder.close()
+        dumper.stop()
         cap.release()
         return
 
+    # results go through the session store's outbox: kept on disk until the
+    # ESP32 (and the upload endpoint, if set) took them, retried otherwise
+    def make_payload(tags_lr, end_ts):
+        return esp_payload(password, ble_code, tags_lr, end_ts or time.time())
+
+    store = SessionStore(ble_code, metrics=metrics, logger=logger)
+    store.recover(make_payload)                  # sessions a crash left open
+    senders = {"serial": serial_sender(ser, logger)}
+    if UPLOAD_URL:
+        senders["upload"] = http_sender(UPLOAD_URL)
+    delivery = DeliveryWorker(store, senders, metrics=metrics, logger=logger).start()
+
+    inference = InferenceClient(name=ble_code, logger=logger) if USE_INFERENCE else None
+    roster = load_roster()
+    if roster is not None:
+        logger.info(f"[{ble_code}] Herd roster: {len(roster)} tags")
     try:
         while True:
             detector = StallMultiDetector(
                 caps={0: cap},
+                capture_info=info,
                 api_endpoint="",
-                min_detections=MIN_DETECTIONS,
-                streak_threshold=STREAK_THRESH,
-                logger=logger
+                min_detections=cfg.min_detections,
+                streak_threshold=cfg.streak_threshold,
+                end_threshold_ratio=cfg.end_threshold_ratio,
+                end_timeout=cfg.end_timeout,
+                detect_scale=cfg.detect_scale,
+                track=cfg.track,
+                settle_p=cfg.settle_p,
+                frame_budget_ms=cfg.frame_budget_ms,
+                degrade_order=parse_order(cfg.degrade_order),
+                roster=roster,
+                stage_workers=STAGE_WORKERS,
+                logger=logger,
+                metrics=metrics,
+                profiler=profiler,
+                recorder=recorder,
+                heartbeat=heartbeat,
+                inference=inference,
+                ocr_workers=cpu_plan.ocr_workers if cpu_plan is not None else None,
+                store=store,
+                reconnect_since=reconnect_since,
             )
+            reconnect_since = None             # observed by the detector's first frame
+            if heartbeat is not None:
+                heartbeat.beat(metrics)        # model load done; not hung
 
             logger.info(f"[{ble_code}] Waiting for milking to start…")
-            if not detector.wait_for_milking():
+            milking = detector.wait_for_milking()
+            if detector.stream_ended:
+                # camera gone; exit so the supervisor restarts us when it's back
+                logger.error(f"[{ble_code}] Camera stream lost; worker exiting")
+                detector.shutdown()
+                break
+            if not milking:
                 logger.warning(f"[{ble_code}] No milking detected; retry in 5s")
                 detector.shutdown()
                 time.sleep(5)
                 continue
 
             logger.info(f"[{ble_code}] Milking detected → running session")
+            session_id = store.open_session(
+                frame_width=info.width,
+                edge_margin=cfg.edge_margin,
+                close_thresh=cfg.close_thresh,
+                top_n=cfg.top_n,
+            )
             try:
-                agg, end_ts = detector.run_milking_session()
+                agg, end_ts = detector.run_milking_session(session_id)
             except Exception as e:
                 logger.error(f"[{ble_code}] Session error: {e}", exc_info=True)
                 detector.shutdown()
+                store.recover(make_payload)    # deliver what was checkpointed
                 time.sleep(5)
                 continue
             detector.shutdown()
 
             # build & filter summary
-            summary = [
-                {'text': t,
-                 'frequency': d['count'],
-                 'median_x': float(np.median(d['x_list']))}
-                for t, d in agg.items()
-            ]
-
-            fw = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or FRAME_WIDTH
-            summary = [
-                e for e in summary
-                if EDGE_MARGIN <= e['median_x'] <= fw - EDGE_MARGIN
-            ]
-            if not summary:
+            tags_lr = build_summary(
+                agg,
+                frame_width=info.width,
+                edge_margin=cfg.edge_margin,
+                close_thresh=cfg.close_thresh,
+                top_n=cfg.top_n,
+            )
+            if not tags_lr:
                 logger.info(f"[{ble_code}] No valid detections; next session")
+                store.close_session(session_id, agg, end_ts, None)
                 continue
 
-            # merge near duplicates
-            summary.sort(key=lambda e: e['median_x'])
-            deduped, cluster = [], [summary[0]]
-            for e in summary[1:]:
-                if abs(e['median_x'] - cluster[-1]['median_x']) <= CLOSE_THRESH:
-                    cluster.append(e)
-                else:
-                    deduped.append(max(cluster, key=lambda x: (x['frequency'], -x['median_x'])))
-                    cluster = [e]
-            deduped.append(max(cluster, key=lambda x: (x['frequency'], -x['median_x'])))
-
-            # top-N
-            top_items = sorted(deduped, key=lambda e: e['frequency'], reverse=True)[:TOP_N]
-            top_items.sort(key=lambda e: e['median_x'])
-            tags_lr = [e['text'] for e in top_items]
-
-            # send over UART
-            try:
-                send_over_esp(ser, password, ble_code, tags_lr, end_ts, logger)
-                logger.info(f"[{ble_code}] Sent tags: {tags_lr}")
-            except Exception as e:
-                logger.error(f"[{ble_code}] Serial write error: {e}")
+            # queued for the delivery worker (serial, upload)
+            store.close_session(session_id, agg, end_ts, make_payload(tags_lr, end_ts))
+            logger.info(f"[{ble_code}] Queued tags: {tags_lr}")
+            metrics.inc("sessions")
 
             time.sleep(2)
 
     except KeyboardInterrupt:
         logger.info(f"[{ble_code}] Ctrl-C received; exiting loop")
     finally:
+        store.close()                            # commits everything queued
+        delivery.stop()
+        dumper.stop()
+        if recorder is not None:
+            recorder.close()
+        if inference is not None:
+            inference.close()
         if ser.is_open:
             ser.close()
             logger.info(f"[{ble_code}] Serial port closed")
@@ -124,27 +223,62 @@ def process_stream(cam_dev: str, password: str, ble_code: str):
 
 
 def main():
-    # auto-detect all /dev/video* devices
-    cams = StallMultiDetector.auto_detect_cameras()
-    # match lengths to avoid zip dropping
-    n = min(len(cams), len(PASSWORDS), len(BLE_CODES))
-    cams, pws, codes = cams[:n], PASSWORDS[:n], BLE_CODES[:n]
-
-    ctx = get_context('spawn')
-    procs = []
-    for cam_dev, pw, code in zip(cams, pws, codes):
+    logger = logging.getLogger(__name__)
+    # BLE code/password follow the physical USB port, not /dev/videoN order
+    assignments = load_assignments(BLE_CODES, PASSWORDS)
+    for port, (code, _) in sorted(assignments.items()):
+        logger.info(f"{code} ← {port}")
+
+    # per-camera snapshots are served from here as Prometheus text
+    try:
+        serve_metrics()
+    except OSError as e:
+        logger.warning(f"Metrics endpoint disabled: {e}")
+
+    # split the cores between the camera workers (and the inference server)
+    plans = {}
+    if CPU_PLAN:
+        names = [code for code, _ in assignments.values()] + (["inference"] if USE_INFERENCE else [])
+        plans = plan_cpus(names)
+        # the forkserver zygote inherits this, so preloaded PaddleOCR matches the workers
+        os.environ["EARTAG_CPU_THREADS"] = str(min(p.threads for p in plans.values()))
+
+    ctx = get_context(LAUNCH_MODE)
+    if LAUNCH_MODE == "forkserver":
+        preload = ["__main__"]
+        if PRELOAD_MODELS:
+            preload.append("eartag_jetson.pipeline.zygote")
+        ctx.set_forkserver_preload(preload)
+    # one writer for every camera process: console + optional rotating file
+    log_queue, log_listener = setup_queue_logging(ctx, LOG_FILE)
+    server = None
+    if USE_INFERENCE:
+        server = ctx.Process(target=serve_inference,
+                             kwargs={"log_queue": log_queue, "cpu_plan": plans.get("inference")},
+                             name="inference", daemon=True)
+        server.start()
+
+    def start_worker(cam_dev, code, pw, reconnect_since, heartbeat):
         p = ctx.Process(
             target=process_stream,
-            args=(cam_dev, pw, code),
+            args=(cam_dev, pw, code, log_queue, reconnect_since, heartbeat),
+            kwargs={"cpu_plan": plans.get(code)},
             name=f"proc-{code}"
         )
         p.start()
-        procs.append(p)
+        return p
 
-    for p in procs:
-        p.join()
+    # restarts workers when a camera is unplugged and comes back, dies or hangs
+    supervisor = CameraSupervisor(assignments, start_worker, ctx=ctx, logger=logger)
+    try:
+        supervisor.run()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+        log_listener.stop()
 
-    logging.getLogger(__name__).info("All streams finished.")
+    logger.info("All streams finished.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+# pipeline/ocr_concurrency.py
+"""
+Self-tuning OCR concurrency: how many PaddleOCR instances, each on its own
+pool thread, a frame's crops are spread over (PaddleRecognizer.set_workers),
+chosen from measured throughput instead of fixed at cpu_count() - 1.
+
+Every instance holds its own models and they share the worker's cores with
+YOLO and the other cameras, so more instances only help up to a point that
+depends on the box and the load. The controller measures every OCR batch
+and, after each window of WINDOW batches, computes
+
+    throughput   crops per second of OCR time
+    p95          95th percentile of the per-crop batch time (ms)
+
+and hill-climbs: it starts at the last count this process converged to (or
+one instance) and steps one at a time, towards fewer first. A step is kept
+when throughput stays within TOLERANCE of the best seen (for fewer) or beats
+it by TOLERANCE (for more), and p95 does not rise by more than TOLERANCE;
+otherwise it goes back and tries the other direction once. When both
+directions have been rejected the count has converged; it is probed again
+every REPROBE windows in case the load changed. Instances are loaded the
+first time a count asks for them (that batch waits for the load) and kept.
+
+Decisions are logged; the count is the `ocr_workers` gauge and the last
+window's figures are `ocr_crops_per_s` / `ocr_p95_ms_per_crop`.
+`EARTAG_OCR_ADAPT=0` uses a single instance.
+"""
+import os
+import logging
+import threading
+import numpy as np
+from eartag_jetson.common.metrics import Metrics
+
+ADAPT     = os.environ.get("EARTAG_OCR_ADAPT", "1") != "0"
+WINDOW    = 20                  # OCR batches (frames) per measurement
+TOLERANCE = 0.05
+REPROBE   = 30                  # windows between probes once converged
+
+_last_workers: int | None = None    # carried over to the next session's detector
+
+
+class ConcurrencyController:
+    def __init__(self, hi: int, *, lo: int = 1, start: int | None = None, window: int = WINDOW,
+                 tolerance: float = TOLERANCE, metrics: Metrics | None = None,
+                 logger: logging.Logger | None = None):
+        self.lo, self.hi = lo, max(lo, hi)
+        start = start if start is not None else (_last_workers or self.lo)
+        self.workers   = max(self.lo, min(self.hi, start))
+        self.window    = window
+        self.tolerance = tolerance
+        self.metrics   = metrics
+        self.logger    = logger or logging.getLogger(__name__)
+        self.step      = -1                 # fewer first: cheaper if it is a tie
+        self.base      = None               # (workers, throughput, p95) of the kept count
+        self.best      = 0.0                # best throughput seen since the last probe
+        self.reversed  = False
+        self.converged = False
+        self._idle     = 0
+        self._batches: list[tuple[int, float]] = []
+        self._lock     = threading.Lock()
+        self._publish()
+
+    def record(self, crops: int, seconds: float) -> int | None:
+        """Add one OCR batch; returns the new worker count when it changes."""
+        if crops == 0:
+            return None
+        with self._lock:
+            self._batches.append((crops, seconds))
+            if len(self._batches) < self.window:
+                return None
+            n = sum(c for c, _ in self._batches)
+            total = sum(s for _, s in self._batches)
+            tput = n / total if total > 0 else 0.0
+            p95 = float(np.percentile([s * 1000.0 / c for c, s in self._batches], 95))
+            self._batches.clear()
+            before = self.workers
+            self._decide(tput, p95)
+            if self.metrics is not None:
+                self.metrics.set_gauge("ocr_crops_per_s", tput)
+                self.metrics.set_gauge("ocr_p95_ms_per_crop", p95)
+            self._publish()
+            return self.workers if self.workers != before else None
+
+    # ─── hill climbing ───────────────────────────────────────────────────────
+    def _decide(self, tput: float, p95: float):
+        global _last_workers
+        if self.converged:
+            self._idle += 1
+            if self._idle < REPROBE:
+                return
+            self.logger.info(f"OCR workers: re-probing around {self.workers}")
+            self.converged, self.reversed, self._idle = False, False, 0
+            self.base, self.best = None, 0.0
+
+        if self.base is None:
+            self.base, self.best = (self.workers, tput, p95), tput
+            self._move()
+            return
+
+        w0, t0, p0 = self.base
+        if self.workers > w0:
+            good = tput > self.best * (1 + self.tolerance)
+        else:
+            good = tput >= self.best * (1 - self.tolerance)
+        good = good and p95 <= p0 * (1 + self.tolerance)
+        self.logger.info(
+            f"OCR workers {self.workers}: {tput:.1f} crops/s, p95 {p95:.1f} ms/crop "
+            f"(vs {w0}: {t0:.1f} crops/s, p95 {p0:.1f}) → {'keep' if good else 'back to ' + str(w0)}"
+        )
+        if good:
+            self.base, self.best = (self.workers, tput, p95), max(self.best, tput)
+            self._move()
+        else:
+            self.workers = w0
+            self._turn()
+        _last_workers = self.base[0]
+
+    def _move(self):
+        nxt = self.workers + self.step
+        if self.lo <= nxt <= self.hi:
+            self.workers = nxt
+        else:
+            self._turn()
+
+    def _turn(self):
+        if self.reversed:
+            self.converged = True
+            self.logger.info(f"OCR workers converged at {self.workers}")
+            return
+        self.reversed = True
+        self.step = -self.step
+        nxt = self.workers + self.step
+        if self.lo <= nxt <= self.hi:
+            self.workers = nxt
+        else:
+            self.converged = True
+            self.logger.info(f"OCR workers converged at {self.workers}")
+
+    def _publish(self):
+        if self.metrics is not None:
+            self.metrics.set_gauge("ocr_workers", self.workers)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# pipeline/quantize.py
+"""
+Reduced-precision YOLO builds for deployment (picked with EARTAG_PRECISION,
+see model_cache.py).
+
+    calib   sample calibration frames from saved_frames / saved_videos into
+            a dataset YAML (leave the held-out clip out with --exclude)
+    engine  TensorRT engine at fp16, or int8 calibrated on those frames
+    onnx    CPU build: ONNX export + onnxruntime static (calibrated) or
+            dynamic (weights only) INT8 quantization
+
+    python3 -m eartag_jetson.pipeline.quantize calib --out /tmp/calib --exclude video6_single.avi
+    python3 -m eartag_jetson.pipeline.quantize engine --precision int8 --calib /tmp/calib/calib.yaml
+    python3 -m eartag_jetson.pipeline.quantize onnx --calib /tmp/calib/calib.yaml
+
+Compare the builds against fp32 on a held-out clip with
+benchmark/precision_report.py before choosing one.
+"""
+import os
+import glob
+import random
+import argparse
+import cv2
+import numpy as np
+from eartag_jetson.common.common_utils import find_project_root, get_logger
+from eartag_jetson.pipeline.deadline import IMGSZ
+
+N_CALIB     = 300           # TensorRT recommends a few hundred calibration images
+VIDEO_EXTS  = (".avi", ".mp4", ".mkv")
+IMAGE_EXTS  = (".jpg", ".jpeg", ".png")
+
+
+def data_dirs() -> list[str]:
+    """saved_frames / saved_videos of capture_image.py / capture_video.py that exist."""
+    root = find_project_root()
+    bases = [
+        os.path.join(root, "data_collection"),
+        os.path.join(root, "src", "eartag_jetson", "data_collection"),
+    ]
+    return [
+        d for base in bases for d in (os.path.join(base, "saved_frames"), os.path.join(base, "saved_videos"))
+        if os.path.isdir(d)
+    ]
+
+
+def _sources(dirs, exclude) -> tuple[list[str], list[str]]:
+    images, videos = [], []
+    for d in dirs:
+        for path in sorted(glob.glob(os.path.join(d, "*"))):
+            if os.path.basename(path) in exclude:
+                continue
+            ext = os.path.splitext(path)[1].lower()
+            if ext in IMAGE_EXTS:
+                images.append(path)
+            elif ext in VIDEO_EXTS:
+                videos.append(path)
+    return images, videos
+
+
+def sample_calibration(out: str, *, dirs: list[str] | None = None, n: int = N_CALIB,
+                       exclude: tuple[str, ...] = (), names: dict | None = None,
+                       seed: int = 0, logger=None) -> str:
+    """
+    Write `n` frames (saved images plus frames spread evenly over the saved
+    videos) to <out>/images and a dataset YAML for Ultralytics' INT8
+    calibration; returns the YAML path.
+    """
+    logger = logger or get_logger("quantize")
+    rng = random.Random(seed)
+    images, videos = _sources(dirs or data_dirs(), set(exclude))
+    if not images and not videos:
+        raise FileNotFoundError("No saved frames or videos to calibrate on")
+
+    img_dir = os.path.join(out, "images")
+    os.makedirs(img_dir, exist_ok=True)
+    picked = rng.sample(images, min(len(images), n // 2 if videos else n))
+    for i, path in enumerate(picked):
+        frame = cv2.imread(path)
+        if frame is not None:
+            cv2.imwrite(os.path.join(img_dir, f"img_{i:05d}.jpg"), frame)
+
+    per_video = -(-(n - len(picked)) // len(videos)) if videos else 0
+    written = len(picked)
+    for vi, path in enumerate(videos):
+        cap = cv2.VideoCapture(path)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
+        wanted = set(np.linspace(0, max(0, total - 1), per_video, dtype=int).tolist()) if total else set()
+        idx = 0
+        while wanted and written < n:
+            if not cap.grab():
+                break
+            if idx in wanted:
+                ret, frame = cap.retrieve()
+                if ret:
+                    cv2.imwrite(os.path.join(img_dir, f"vid{vi:02d}_{idx:06d}.jpg"), frame)
+                    written += 1
+                wanted.discard(idx)
+            idx += 1
+        cap.release()
+
+    names = names or {0: "eartag"}
+    yaml_path = os.path.join(out, "calib.yaml")
+    with open(yaml_path, "w") as f:
+        # images without labels are fine: calibration only needs activations
+        f.write(f"path: {os.path.abspath(out)}\ntrain: images\nval: images\nnames:\n")
+        for k, v in sorted(names.items()):
+            f.write(f"  {k}: {v}\n")
+    logger.info(f"{written} calibration frames from {len(images)} images / {len(videos)} videos → {yaml_path}")
+    return yaml_path
+
+
+def _calib_images(calib_yaml: str) -> list[str]:
+    img_dir = os.path.join(os.path.dirname(os.path.abspath(calib_yaml)), "images")
+    return sorted(glob.glob(os.path.join(img_dir, "*.jpg")))
+
+
+def letterbox(frame, size: int = IMGSZ) -> np.ndarray:
+    """BGR frame → 1×3×size×size float32 RGB tensor, as Ultralytics feeds ONNX."""
+    h, w = frame.shape[:2]
+    r = min(size / h, size / w)
+    nh, nw = round(h * r), round(w * r)
+    out = np.full((size, size, 3), 114, np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    out[top:top + nh, left:left + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return np.ascontiguousarray(out[:, :, ::-1].transpose(2, 0, 1))[None].astype(np.float32) / 255.0
+
+
+def export_engine(weights: str, precision: str, calib_yaml: str | None = None, logger=None) -> str:
+    from ultralytics import YOLO
+    from eartag_jetson.common.common_utils import export_yolo_to_engine
+    from eartag_jetson.pipeline.model_cache import engine_path
+    logger = logger or get_logger("quantize")
+    eng = engine_path(weights, precision)
+    export_yolo_to_engine(YOLO(weights, task="detect"), eng, logger,
+                          precision=precision, calib_data=calib_yaml)
+    return eng
+
+
+def export_onnx_int8(weights: str, calib_yaml: str | None = None, *, method: str = "static",
+                     imgsz: int = IMGSZ, logger=None) -> str:
+    """FP32 ONNX export, then onnxruntime INT8 quantization → <stem>.int8.onnx."""
+    from ultralytics import YOLO
+    from onnxruntime import InferenceSession
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static,
+    )
+    from eartag_jetson.pipeline.model_cache import onnx_int8_path
+    logger = logger or get_logger("quantize")
+    fp32 = YOLO(weights, task="detect").export(format="onnx", imgsz=imgsz, dynamic=False, simplify=True)
+    out = onnx_int8_path(weights)
+
+    if method == "dynamic":
+        quantize_dynamic(fp32, out, weight_type=QuantType.QUInt8)
+    elif method == "static":
+        if not calib_yaml:
+            raise ValueError("static quantization needs --calib (see the calib command)")
+        paths = _calib_images(calib_yaml)
+        input_name = InferenceSession(fp32, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+        class Reader(CalibrationDataReader):
+            def __init__(self):
+                self._it = iter(paths)
+
+            def get_next(self):
+                for path in self._it:
+                    frame = cv2.imread(path)
+                    if frame is not None:
+                        return {input_name: letterbox(frame, imgsz)}
+                return None
+
+        quantize_static(
+            fp32, out, Reader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+        )
+    else:
+        raise ValueError(f"Unknown quantization method {method!r}")
+    logger.info(f"INT8 ONNX ({method}) written to {out}")
+    return out
+
+
+def main():
+    from eartag_jetson.pipeline.model_cache import default_weights
+    ap = argparse.ArgumentParser(description="FP16/INT8 YOLO builds and calibration data")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    cp = sub.add_parser("calib", help="sample calibration frames into a dataset YAML")
+    cp.add_argument("--out", required=True)
+    cp.add_argument("-n", type=int, default=N_CALIB)
+    cp.add_argument("--dir", action="append", help="frame/video directory (default: saved_frames, saved_videos)")
+    cp.add_argument("--exclude", action="append", default=[], help="file name to leave out (held-out clip)")
+
+    ep = sub.add_parser("engine", help="TensorRT engine at reduced precision")
+    ep.add_argument("--precision", choices=("fp16", "int8"), required=True)
+    ep.add_argument("--calib", help="calibration YAML (int8)")
+    ep.add_argument("--weights", help="YOLO .pt weights (default: resources/seg_model.pt)")
+
+    op = sub.add_parser("onnx", help="INT8 ONNX for CPU hosts")
+    op.add_argument("--method", choices=("static", "dynamic"), default="static")
+    op.add_argument("--calib", help="calibration YAML (static)")
+    op.add_argument("--imgsz", type=int, default=IMGSZ)
+    op.add_argument("--weights", help="YOLO .pt weights (default: resources/seg_model.pt)")
+    args = ap.parse_args()
+
+    if args.cmd == "calib":
+        path = sample_calibration(args.out, dirs=args.dir, n=args.n, exclude=tuple(args.exclude))
+    elif args.cmd == "engine":
+        path = export_engine(args.weights or default_weights(), args.precision, args.calib)
+    else:
+        path = export_onnx_int8(args.weights or default_weights(), args.calib,
+                                method=args.method, imgsz=args.imgsz)
+    print(f"[INFO] {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+# pipeline/recognizer.py
+"""
+Tag recognizers: turn RGB crops of YOLO boxes into (text, confidence) reads.
+
+    PaddleRecognizer   PP-OCRv4 (the original path). With `detect_text` each
+                       crop goes through `ocr.ocr()` (text detection, angle
+                       classifier, recognizer) on a small thread pool, one
+                       PaddleOCR instance per thread in use; without it the
+                       crops are batched straight into the angle classifier +
+                       recognizer (what the inference server does).
+    DigitRecognizer    a small digit-only CNN + CTC model in ONNX
+                       (train_digit_ocr.py): crops resized to a fixed 32×128
+                       grayscale input and run as one batch on onnxruntime.
+
+`EARTAG_RECOGNIZER` (paddle | digits) picks the backend for the detectors and
+the inference server; `EARTAG_DIGIT_MODEL` overrides resources/digit_ctc.onnx.
+Compare the two on labeled crops with benchmark/recognizer_benchmark.py.
+
+Coarse-to-fine (`EARTAG_OCR_COARSE=<px>`, either backend): TieredRecognizer
+reads every crop downscaled to that height first, as one batch, and re-reads
+at full resolution (a second batch) only the crops whose read is missing,
+below `EARTAG_OCR_ESCALATE_CONF` or not tag-shaped. Crops read and crops
+escalated are the `ocr_coarse` / `ocr_escalated` counters and their ratio the
+`ocr_escalation_rate` gauge.
+"""
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from eartag_jetson.pipeline.cpu_plan import cpu_threads
+
+RECOGNIZER  = os.environ.get("EARTAG_RECOGNIZER", "paddle")
+DIGIT_MODEL = os.environ.get(
+    "EARTAG_DIGIT_MODEL",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "resources", "digit_ctc.onnx"),
+)
+KINDS = ("paddle", "digits")
+COARSE_HEIGHT = int(os.environ.get("EARTAG_OCR_COARSE", "0"))       # px; 0 = full resolution only
+ESCALATE_CONF = float(os.environ.get("EARTAG_OCR_ESCALATE_CONF", "0.9"))
+# PaddleOCR instances per detector at most (each holds its own models, ~150 MB)
+OCR_INSTANCES = int(os.environ.get("EARTAG_OCR_INSTANCES", "4"))
+
+Read = tuple[str, float] | None
+
+
+class Recognizer:
+    """Interface: `read` a batch of RGB crops, one Read per crop."""
+
+    name = "base"
+
+    def read(self, crops: list[np.ndarray]) -> list[Read]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PaddleRecognizer(Recognizer):
+    name = "paddle"
+
+    def __init__(self, ocr, *, detect_text: bool = True, workers: int = 1, make_ocr=None):
+        self.ocr         = ocr
+        self.detect_text = detect_text
+        # calls into one PaddleOCR instance are serialized, so a thread only
+        # adds throughput with an instance of its own: `make_ocr()` loads
+        # more (up to `workers`) as set_workers asks for them
+        self.engines     = [(ocr, threading.Lock())]
+        self.make_ocr    = make_ocr
+        self.max_workers = workers if detect_text and make_ocr is not None else 1
+        self.workers     = 1
+        self._grow_lock  = threading.Lock()     # one set_workers loads at a time
+        self.executor    = (ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ocr")
+                            if detect_text else None)
+        self.queue_depth = 0
+
+    @property
+    def lock(self) -> threading.Lock:
+        return self.engines[0][1]
+
+    def set_workers(self, n: int) -> int:
+        """
+        Threads (and PaddleOCR instances) per batch; loads missing instances
+        first, so a concurrent `read` never sees a count without its engines.
+        """
+        n = max(1, min(n, self.max_workers))
+        with self._grow_lock:
+            while len(self.engines) < n:
+                self.engines.append((self.make_ocr(), threading.Lock()))
+            self.workers = n
+        return n
+
+    def _ocr_chunk(self, engine, crops) -> list[Read]:
+        ocr, lock = engine
+        reads = []
+        with lock:
+            for crop in crops:
+                out = ocr.ocr(crop)
+                reads.append(tuple(out[0][0][1]) if out and out[0] else None)
+        return reads
+
+    def read(self, crops):
+        if not crops:
+            return []
+        if not self.detect_text:
+            with self.lock:
+                rotated, _, _ = self.ocr.text_classifier(list(crops))   # upside-down crops
+                rec, _ = self.ocr.text_recognizer(rotated)
+            return [(text, float(conf)) if text else None for text, conf in rec]
+        engines = self.engines[:self.workers]
+        n = min(len(engines), len(crops))
+        self.queue_depth = max(0, len(crops) - n)
+        # n threads, each reading every n-th crop on its own instance
+        futs = [self.executor.submit(self._ocr_chunk, engines[i], crops[i::n]) for i in range(n)]
+        reads = [None] * len(crops)
+        for i, fut in enumerate(futs):
+            reads[i::n] = fut.result()
+        return reads
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+
+class DigitRecognizer(Recognizer):
+    name = "digits"
+    HEIGHT, WIDTH = 32, 128
+    BLANK = 0                   # CTC classes: blank, then "0"…"9"
+
+    def __init__(self, model_path: str = DIGIT_MODEL, *, threads: int = 0):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, opts, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0].name
+
+    @classmethod
+    def preprocess(cls, crops) -> np.ndarray:
+        """RGB crops → N×1×32×128 float32 in [-1, 1] (aspect kept, right-padded)."""
+        batch = np.zeros((len(crops), 1, cls.HEIGHT, cls.WIDTH), np.float32)
+        for i, crop in enumerate(crops):
+            if crop.size == 0:
+                continue
+            gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+            h, w = gray.shape
+            nw = max(1, min(cls.WIDTH, round(w * cls.HEIGHT / h)))
+            small = cv2.resize(gray, (nw, cls.HEIGHT), interpolation=cv2.INTER_AREA)
+            batch[i, 0, :, :nw] = small / 127.5 - 1.0
+        return batch
+
+    @classmethod
+    def decode(cls, logits: np.ndarray) -> list[Read]:
+        """Greedy CTC over N×T×11 scores; confidence = mean max probability of the kept steps."""
+        e = np.exp(logits - logits.max(axis=2, keepdims=True))
+        probs = e / e.sum(axis=2, keepdims=True)
+        best = probs.argmax(axis=2)
+        reads = []
+        for seq, p in zip(best, probs.max(axis=2)):
+            chars, confs, prev = [], [], cls.BLANK
+            for k, pk in zip(seq, p):
+                if k != cls.BLANK and k != prev:
+                    chars.append(str(k - 1))
+                    confs.append(pk)
+                prev = k
+            reads.append(("".join(chars), float(np.mean(confs))) if chars else None)
+        return reads
+
+    def read(self, crops):
+        if not crops:
+            return []
+        logits = self.session.run(None, {self.input: self.preprocess(crops)})[0]
+        return self.decode(logits)
+
+
+class TieredRecognizer(Recognizer):
+    """Coarse-to-fine reading on top of another recognizer (see module docstring)."""
+
+    def __init__(self, inner: Recognizer, *, height: int = COARSE_HEIGHT,
+                 min_conf: float = ESCALATE_CONF, accept=None):
+        from eartag_jetson.pipeline.summary import TAG_PATTERN
+        if height <= 0:
+            raise ValueError("coarse height must be positive")
+        self.inner    = inner
+        self.name     = inner.name
+        self.height   = height
+        self.min_conf = min_conf
+        self.accept   = accept or TAG_PATTERN.fullmatch
+        self.counts   = {"ocr_coarse": 0, "ocr_escalated": 0}
+
+    @property
+    def queue_depth(self) -> int:
+        return getattr(self.inner, "queue_depth", 0)
+
+    @property
+    def max_workers(self) -> int:
+        return getattr(self.inner, "max_workers", 1)
+
+    def set_workers(self, n: int) -> int:
+        return self.inner.set_workers(n)
+
+    def _good(self, read: Read) -> bool:
+        return read is not None and read[1] >= self.min_conf and bool(self.accept(read[0]))
+
+    def read(self, crops):
+        small, shrunk = [], []
+        for crop in crops:
+            h, w = crop.shape[:2]
+            if h > self.height:
+                nw = max(1, round(w * self.height / h))
+                crop = cv2.resize(crop, (nw, self.height), interpolation=cv2.INTER_AREA)
+            small.append(crop)
+            shrunk.append(h > self.height)
+        reads = self.inner.read(small)
+        # crops already at or below the coarse height have nothing finer to offer
+        redo = [i for i, read in enumerate(reads) if shrunk[i] and not self._good(read)]
+        if redo:
+            for i, read in zip(redo, self.inner.read([crops[i] for i in redo])):
+                if read is not None:
+                    reads[i] = read
+        self.counts["ocr_coarse"] += len(crops)
+        self.counts["ocr_escalated"] += len(redo)
+        return reads
+
+    def take_counts(self) -> dict[str, int]:
+        """Coarse/escalated counts since the last call (for Metrics counters)."""
+        counts = self.counts
+        self.counts = dict.fromkeys(counts, 0)
+        return counts
+
+    def close(self):
+        self.inner.close()
+
+
+def publish_counts(recognizer: Recognizer, metrics):
+    """Add a TieredRecognizer's counts to `metrics` and update the escalation rate."""
+    take = getattr(recognizer, "take_counts", None)
+    if take is None:
+        return
+    for name, n in take().items():
+        metrics.inc(name, n)
+    coarse = metrics.counters.get("ocr_coarse", 0)
+    if coarse:
+        metrics.set_gauge("ocr_escalation_rate", metrics.counters.get("ocr_escalated", 0) / coarse)
+
+
+def load_recognizer(kind: str = RECOGNIZER, *, ocr=None, detect_text: bool = True,
+                    workers: int = 1, coarse_height: int = COARSE_HEIGHT,
+                    logger: logging.Logger | None = None) -> Recognizer:
+    """
+    The `kind` recognizer; "paddle" wraps the already-loaded PaddleOCR `ocr`
+    and loads up to `workers` - 1 more instances (at most OCR_INSTANCES) when
+    asked for more threads, sharing the worker's CPU threads between them.
+    With `coarse_height` > 0 it reads coarse-to-fine (TieredRecognizer).
+    """
+    logger = logger or logging.getLogger(__name__)
+    if kind == "paddle":
+        if ocr is None:
+            raise ValueError("PaddleRecognizer needs a loaded PaddleOCR")
+        instances = max(1, min(workers, OCR_INSTANCES))
+        threads = max(1, (cpu_threads() or os.cpu_count() or 1) // instances)
+
+        def make_ocr():
+            from eartag_jetson.pipeline.model_cache import load_ocr
+            return load_ocr(logger, threads=threads)
+
+        rec = PaddleRecognizer(ocr, detect_text=detect_text, workers=instances, make_ocr=make_ocr)
+    elif kind == "digits":
+        logger.info(f"Digit recognizer: {os.path.basename(DIGIT_MODEL)}")
+        rec = DigitRecognizer(DIGIT_MODEL, threads=cpu_threads() or 0)
+    else:
+        raise ValueError(f"EARTAG_RECOGNIZER must be one of {KINDS}, got {kind!r}")
+    if coarse_height > 0:
+        logger.info(f"Coarse-to-fine OCR: {coarse_height}px first, full resolution below "
+                    f"{ESCALATE_CONF:.2f} confidence")
+        rec = TieredRecognizer(rec, height=coarse_height)
+    return rec
@@ -0,0 +1,100 @@
+# pipeline/roster.py
+"""
+Optional herd roster: the tag IDs that can actually walk into the parlour.
+
+Without a roster any 4-digit read is a tag, so a misread (one wrong digit,
+two digits swapped) becomes a phantom cow that only the CLOSE_THRESH merge
+or the tracker's voting can remove. With one, every read is checked against
+the herd before it is counted:
+
+    exact ID                                   → kept
+    one substitution / adjacent swap from
+    exactly one ID                             → snapped to that ID
+    anything else (incl. ambiguous neighbours) → rejected
+
+IDs are kept as sorted integer arrays (one per ID length, so "0123" and
+"123" stay distinct) and looked up with bisect: one search for an exact
+read, at most 9·L + L − 1 (39 for 4 digits) for the neighbours, so a herd
+of thousands costs microseconds per read and a few bytes per cow.
+
+The file has one ID per line (blank lines and `#` comments ignored); it is
+read from `EARTAG_ROSTER`, else resources/roster.txt if present.
+"""
+import os
+from array import array
+from bisect import bisect_left
+
+ROSTER_PATH = os.environ.get(
+    "EARTAG_ROSTER",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "resources", "roster.txt"),
+)
+
+
+def _neighbours(text: str):
+    """Every string one digit substitution or one adjacent swap away."""
+    for i, ch in enumerate(text):
+        for d in "0123456789":
+            if d != ch:
+                yield text[:i] + d + text[i + 1:]
+    for i in range(len(text) - 1):
+        if text[i] != text[i + 1]:
+            yield text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+
+class HerdRoster:
+    def __init__(self, ids):
+        by_len: dict[int, set[int]] = {}
+        for tag in ids:
+            tag = str(tag).strip()
+            if not tag.isdigit():
+                raise ValueError(f"Roster IDs must be digits, got {tag!r}")
+            by_len.setdefault(len(tag), set()).add(int(tag))
+        self._ids = {n: array("Q", sorted(v)) for n, v in by_len.items()}
+        self.counts = {"roster_hits": 0, "roster_snaps": 0, "roster_rejects": 0}
+
+    @classmethod
+    def from_file(cls, path: str) -> "HerdRoster":
+        with open(path) as f:
+            lines = (line.split("#", 1)[0].strip() for line in f)
+            return cls(line for line in lines if line)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._ids.values())
+
+    def __contains__(self, text: str) -> bool:
+        ids = self._ids.get(len(text))
+        if ids is None or not text.isdigit():
+            return False
+        n = int(text)
+        i = bisect_left(ids, n)
+        return i < len(ids) and ids[i] == n
+
+    def match(self, text: str) -> str | None:
+        """The roster ID `text` stands for, or None (see module docstring)."""
+        if text in self:
+            self.counts["roster_hits"] += 1
+            return text
+        found = None
+        if text.isdigit() and len(text) in self._ids:
+            for cand in _neighbours(text):
+                if cand in self:
+                    if found is not None and cand != found:
+                        found = None            # ambiguous: two IDs one edit away
+                        break
+                    found = cand
+        self.counts["roster_snaps" if found else "roster_rejects"] += 1
+        return found
+
+    def take_counts(self) -> dict[str, int]:
+        """Hit/snap/reject counts since the last call (for Metrics counters)."""
+        counts = self.counts
+        self.counts = dict.fromkeys(counts, 0)
+        return counts
+
+
+def load_roster(path: str | None = None) -> HerdRoster | None:
+    """The roster at `path` (default ROSTER_PATH), or None when there is none."""
+    path = path or ROSTER_PATH
+    if not path or not os.path.exists(path):
+        return None
+    return HerdRoster.from_file(path)
@@ -0,0 +1,396 @@
+# pipeline/session_store.py
+"""
+Durable local session store: milking sessions, their per-tag aggregates and
+the delivery of every result, in one SQLite database in WAL mode.
+
+Without it a session's result lived only in memory until send_over_esp ran:
+a failed serial write was logged and lost, and a crash mid-session lost the
+whole session.
+
+    sessions   one row per session: camera, start/end, the summary settings,
+               status open → closed | interrupted
+    tags       the session's entries (text, frequency, median_x): checkpointed
+               while it runs, final once it ends
+    outbox     one row per result and channel ("serial", plus "upload" when
+               EARTAG_UPLOAD_URL is set): payload, attempts, next retry,
+               delivered time and last error
+
+Writes never happen on the camera loop. `open_session` / `checkpoint` /
+`close_session` put a statement on a queue, and one writer thread commits
+everything queued in a single transaction. A failed commit is retried; a
+batch that keeps failing is committed statement by statement and only the
+failing statements are dropped (logged, `store_dropped`). `checkpoint` is a
+clock check on most frames: the aggregate is summarized at most every
+CHECKPOINT_S.
+
+`DeliveryWorker` drains the outbox on its own thread. A failed send is
+retried with exponential backoff (RETRY_BASE_S doubling up to RETRY_MAX_S).
+Rows of a channel this process has no sender for are left for a later run.
+
+At startup `recover()` closes the camera's sessions that a crash left open
+as interrupted, builds their result from the last checkpoint and queues it.
+Results that were never delivered stay in the outbox and go out first.
+
+The database is `EARTAG_SESSION_DB`, else data_collection/sessions.db.
+"""
+import os
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+import urllib.request
+from eartag_jetson.common.metrics import Metrics
+from eartag_jetson.pipeline.summary import build_summary, summarize_agg
+
+DB_PATH = os.environ.get(
+    "EARTAG_SESSION_DB",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data_collection", "sessions.db"),
+)
+UPLOAD_URL   = os.environ.get("EARTAG_UPLOAD_URL")
+CHECKPOINT_S = 2.0             # in-progress aggregate written at most this often
+FLUSH_S      = 0.5             # writer batches what arrives within this window
+RETRY_BASE_S = 1.0
+RETRY_MAX_S  = 300.0
+COMMIT_TRIES = 3               # a batch that fails this often is dropped
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id           TEXT PRIMARY KEY,
+    camera       TEXT NOT NULL,
+    started      REAL NOT NULL,
+    ended        REAL,
+    checkpoint   REAL,
+    frame_width  INTEGER NOT NULL,
+    edge_margin  INTEGER NOT NULL,
+    close_thresh INTEGER NOT NULL,
+    top_n        INTEGER NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'open'
+);
+CREATE TABLE IF NOT EXISTS tags (
+    session_id   TEXT NOT NULL,
+    text         TEXT NOT NULL,
+    frequency    REAL NOT NULL,
+    median_x     REAL NOT NULL,
+    PRIMARY KEY (session_id, text)
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id   TEXT NOT NULL,
+    camera       TEXT NOT NULL,
+    channel      TEXT NOT NULL,
+    payload      TEXT NOT NULL,
+    created      REAL NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    next_try     REAL NOT NULL,
+    delivered    REAL,
+    last_error   TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (camera, delivered, next_try);
+"""
+
+_CLOSE = object()
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")     # durable at every checkpoint in WAL mode
+    return conn
+
+
+def channels() -> list[str]:
+    return ["serial"] + (["upload"] if UPLOAD_URL else [])
+
+
+class SessionStore:
+    def __init__(self, camera: str, path: str = DB_PATH, *, metrics: Metrics | None = None,
+                 logger: logging.Logger | None = None):
+        self.camera  = camera
+        self.path    = path
+        self.metrics = metrics
+        self.logger  = logger or logging.getLogger(__name__)
+        self.outbox_changed = threading.Event()      # wakes the DeliveryWorker
+        self._queue: queue.Queue = queue.Queue()
+        self._next_checkpoint = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = _connect(path)
+        conn.executescript(SCHEMA)
+        conn.close()
+        self._thread = threading.Thread(target=self._run, name=f"store-{camera}", daemon=True)
+        self._thread.start()
+
+    # ─── producer side (camera loop) ─────────────────────────────────────────
+    def _put(self, sql: str, params=(), *, outbox: bool = False):
+        self._queue.put((sql, params, outbox))
+
+    def open_session(self, *, frame_width: int, edge_margin: int, close_thresh: int,
+                     top_n: int) -> str:
+        now = time.time()
+        session_id = f"{self.camera}-{int(now * 1000)}"
+        self._put(
+            "INSERT INTO sessions (id, camera, started, frame_width, edge_margin, close_thresh, top_n)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session_id, self.camera, now, frame_width, edge_margin, close_thresh, top_n),
+        )
+        self._next_checkpoint = time.monotonic() + CHECKPOINT_S
+        return session_id
+
+    def _write_tags(self, session_id: str, entries: list[dict]):
+        self._put("DELETE FROM tags WHERE session_id = ?", (session_id,))
+        self._put(
+            "INSERT INTO tags (session_id, text, frequency, median_x) VALUES (?, ?, ?, ?)",
+            [(session_id, e["text"], e["frequency"], e["median_x"]) for e in entries],
+        )
+
+    def checkpoint(self, session_id: str, agg):
+        """Save the in-progress aggregate, at most every CHECKPOINT_S (call per frame)."""
+        now = time.monotonic()
+        if now < self._next_checkpoint:
+            return
+        self._next_checkpoint = now + CHECKPOINT_S
+        self._write_tags(session_id, summarize_agg(agg))
+        self._put("UPDATE sessions SET checkpoint = ? WHERE id = ?", (time.time(), session_id))
+
+    def close_session(self, session_id: str, agg, end_ts: float | None, payload: dict | None,
+                      *, status: str = "closed"):
+        """Final entries, the session's end, and one outbox row per channel for `payload`."""
+        self._write_tags(session_id, summarize_agg(agg))
+        self._put("UPDATE sessions SET ended = ?, status = ? WHERE id = ?",
+                  (end_ts or time.time(), status, session_id))
+        if payload is not None:
+            now = time.time()
+            self._put(
+                "INSERT INTO outbox (session_id, camera, channel, payload, created, next_try)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [(session_id, self.camera, ch, json.dumps(payload), now, now) for ch in channels()],
+                outbox=True,
+            )
+
+    def flush(self, timeout: float = 10.0):
+        """Block until everything queued so far is committed."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout: float = 10.0):
+        self._queue.put(_CLOSE)
+        self._thread.join(timeout)
+
+    # ─── writer thread ───────────────────────────────────────────────────────
+    def _run(self):
+        conn = _connect(self.path)
+        try:
+            while True:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + FLUSH_S
+                while batch[-1] is not _CLOSE:
+                    try:
+                        batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                    except queue.Empty:
+                        break
+                self._commit_batch(conn, batch)
+                if batch[-1] is _CLOSE:
+                    break
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn, batch):
+        """
+        Commit `batch`, retried COMMIT_TRIES times; after that each statement
+        is committed on its own and only the ones that still fail are dropped.
+        """
+        try:
+            for attempt in range(1, COMMIT_TRIES + 1):
+                try:
+                    self._commit(conn, batch)
+                    return
+                except Exception as e:
+                    self.logger.warning(f"Session store commit failed ({e}); attempt {attempt}")
+                    if attempt < COMMIT_TRIES:
+                        time.sleep(FLUSH_S * attempt)
+            for item in batch:
+                if not isinstance(item, tuple):
+                    continue
+                try:
+                    self._commit(conn, [item])
+                except Exception as e:
+                    self.logger.error(f"Session store dropped {item[0].split()[0]}: {e}")
+                    if self.metrics is not None:
+                        self.metrics.inc("store_dropped")
+        finally:
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _commit(self, conn, batch):
+        t0 = time.perf_counter()
+        outbox = False
+        conn.execute("BEGIN")
+        try:
+            for item in batch:
+                if not isinstance(item, tuple):
+                    continue
+                sql, params, to_outbox = item
+                if isinstance(params, list):
+                    conn.executemany(sql, params)
+                else:
+                    conn.execute(sql, params)
+                outbox = outbox or to_outbox
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        if outbox:
+            self.outbox_changed.set()
+        if self.metrics is not None:
+            self.metrics.observe_since("store_commit", t0)
+
+    # ─── startup ─────────────────────────────────────────────────────────────
+    def recover(self, make_payload) -> int:
+        """
+        Close this camera's sessions left open (by a crash, or a session error)
+        as interrupted and queue the result of their last checkpoint;
+        `make_payload(tags_lr, end_ts)` builds the payload. Returns the count.
+        """
+        self.flush()
+        conn = _connect(self.path)
+        try:
+            rows = conn.execute(
+                "SELECT id, started, checkpoint, frame_width, edge_margin, close_thresh, top_n"
+                " FROM sessions WHERE camera = ? AND status = 'open'",
+                (self.camera,),
+            ).fetchall()
+            sessions = []
+            for sid, started, ckpt, width, edge, close, top_n in rows:
+                entries = [
+                    {"text": t, "frequency": f, "median_x": x}
+                    for t, f, x in conn.execute(
+                        "SELECT text, frequency, median_x FROM tags WHERE session_id = ?", (sid,)
+                    )
+                ]
+                sessions.append((sid, ckpt or started, entries, width, edge, close, top_n))
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE camera = ? AND delivered IS NULL", (self.camera,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+        for sid, end_ts, entries, width, edge, close, top_n in sessions:
+            tags_lr = build_summary(entries, frame_width=width, edge_margin=edge,
+                                    close_thresh=close, top_n=top_n)
+            self.logger.warning(f"Session {sid} was interrupted; recovered tags {tags_lr}")
+            self.close_session(sid, entries, end_ts, make_payload(tags_lr, end_ts) if tags_lr else None,
+                               status="interrupted")
+        if pending:
+            self.logger.info(f"{pending} undelivered result(s) in the outbox")
+            self.outbox_changed.set()
+        return len(sessions)
+
+
+class DeliveryWorker:
+    """
+    Sends the camera's outbox rows, oldest first, through `senders`
+    ({channel: fn(payload)}; an exception means "retry later").
+    """
+
+    def __init__(self, store: SessionStore, senders: dict, *, metrics: Metrics | None = None,
+                 logger: logging.Logger | None = None):
+        self.store   = store
+        self.senders = senders
+        self.metrics = metrics
+        self.logger  = logger or logging.getLogger(__name__)
+        self._stop   = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"delivery-{store.camera}", daemon=True)
+
+    def start(self) -> "DeliveryWorker":
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self.store.outbox_changed.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        conn = _connect(self.store.path)
+        try:
+            while not self._stop.is_set():
+                self.store.outbox_changed.clear()
+                try:
+                    wait = self._deliver_due(conn)
+                except sqlite3.Error as e:
+                    self.logger.error(f"Outbox query failed: {e}")
+                    wait = RETRY_BASE_S
+                self.store.outbox_changed.wait(wait)
+        finally:
+            conn.close()
+
+    def _deliver_due(self, conn) -> float:
+        """Send every due row; returns the seconds until the next retry."""
+        # rows of channels without a sender here (e.g. upload with
+        # EARTAG_UPLOAD_URL unset) wait in the outbox, not counted as due
+        mine = f"camera = ? AND delivered IS NULL AND channel IN ({', '.join('?' * len(self.senders))})"
+        args = (self.store.camera, *self.senders)
+        rows = conn.execute(
+            f"SELECT id, channel, payload, attempts FROM outbox WHERE {mine} AND next_try <= ? ORDER BY id",
+            (*args, time.time()),
+        ).fetchall()
+        for row_id, channel, payload, attempts in rows:
+            if self._stop.is_set():
+                break
+            send = self.senders[channel]
+            t0 = time.perf_counter()
+            try:
+                send(json.loads(payload))
+            except Exception as e:
+                delay = min(RETRY_MAX_S, RETRY_BASE_S * 2 ** attempts)
+                conn.execute(
+                    "UPDATE outbox SET attempts = attempts + 1, next_try = ?, last_error = ? WHERE id = ?",
+                    (time.time() + delay, str(e), row_id),
+                )
+                self.logger.warning(f"{channel} delivery failed ({e}); retry in {delay:.0f}s")
+                if self.metrics is not None:
+                    self.metrics.inc("delivery_retries")
+                continue
+            conn.execute("UPDATE outbox SET attempts = attempts + 1, delivered = ? WHERE id = ?",
+                         (time.time(), row_id))
+            if self.metrics is not None:
+                self.metrics.observe_since(channel, t0)
+                self.metrics.inc("delivered")
+
+        pending, next_try = conn.execute(
+            f"SELECT COUNT(*), MIN(next_try) FROM outbox WHERE {mine}", args,
+        ).fetchone()
+        if self.metrics is not None:
+            self.metrics.set_gauge("outbox_pending", pending)
+        return max(0.1, next_try - time.time()) if next_try is not None else RETRY_MAX_S
+
+
+def serial_sender(ser, logger: logging.Logger):
+    """Outbox sender for the ESP32 serial link; reopens the port after an error."""
+    from eartag_jetson.common.common_utils import write_payload
+
+    def send(payload: dict):
+        if not ser.is_open:
+            ser.open()
+        try:
+            write_payload(ser, payload, logger)
+        except Exception:
+            ser.close()                       # reopened on the next attempt
+            raise
+    return send
+
+
+def http_sender(url: str, timeout: float = 10.0):
+    """Outbox sender that POSTs the payload (without the BLE password) as JSON."""
+
+    def send(payload: dict):
+        body = json.dumps({k: v for k, v in payload.items() if k != "password"}).encode("utf-8")
+        req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            if resp.status >= 300:
+                raise IOError(f"upload returned HTTP {resp.status}")
+    return send
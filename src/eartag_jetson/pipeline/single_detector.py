@@ -2,18 +2,19 @@
 import os
 import glob
 import cv2
-import logging
-import re
 import time
+import threading
 from collections import defaultdict
 from datetime import datetime
-from ultralytics import YOLO
-from paddleocr import PaddleOCR
-from eartag_jetson.common.common_utils import (
-    find_project_root,
-    export_yolo_to_engine,
-    get_logger
-)
+from eartag_jetson.common.common_utils import get_logger
+from eartag_jetson.common.log_utils import FrameLogSampler
+from eartag_jetson.common.capture import CaptureInfo, FrameScaler, negotiate, open_capture, read_timed
+from eartag_jetson.common.metrics import Metrics
+from eartag_jetson.pipeline.model_cache import load_models
+from eartag_jetson.pipeline.recognizer import RECOGNIZER, load_recognizer, publish_counts
+from eartag_jetson.pipeline.roster import HerdRoster
+from eartag_jetson.pipeline.stage_executor import Stage, StageExecutor
+from eartag_jetson.pipeline.summary import fold_reads, new_agg
 
 API_ENDPOINT     = "https://your.api/endpoint"
 
@@ -23,9 +24,19 @@ class StallDetector:
         *,
         sources: list[str] | None = None,
         caps: dict[int, cv2.VideoCapture] | None = None,
+        capture_info: CaptureInfo | None = None,
         api_endpoint: str,
         min_detections: int,
         streak_threshold: int,
+        end_threshold_ratio: float = 0.4,
+        end_timeout: float = 4.0,
+        detect_scale: float = 1.0,
+        metrics: Metrics | None = None,
+        track: bool = True,
+        settle_p: float = 0.999,
+        roster: HerdRoster | None = None,
+        stage_workers: dict[str, int] | None = None,
+        pipeline_depth: int = 2,
     ):
         """
         Either pass:
@@ -35,51 +46,59 @@ class StallDetector:
             to skip opening cameras internally.
         """
         self.logger = get_logger("multi_cam_detector")
+        self.frame_log = FrameLogSampler()
+        self._log_frame = False
         self.api_endpoint = api_endpoint
         self.min_detections = min_detections
         self.streak_threshold = streak_threshold
+        self.end_threshold_ratio = end_threshold_ratio
+        self.end_timeout = end_timeout
+        # YOLO runs on a downscaled copy; crops still come from the full frame
+        self.scaler = FrameScaler(detect_scale)
+        self.metrics = metrics or Metrics()
+        self.track = track             # aggregate per tracked tag, not per OCR string
+        self.settle_p = settle_p       # tracked tags this sure are not OCR'd again
+        self.roster = roster           # accept herd IDs only (roster.py)
+        # YOLO on the next frame while this one is OCR'd (None: one frame at a time)
+        self.stage_workers = stage_workers
+        self.pipeline_depth = pipeline_depth
+        self.yolo_lock = threading.Lock()
 
         # initialize models & OCR
         self.model, self.ocr = self._init_models()
+        self.recognizer = load_recognizer(ocr=self.ocr, logger=self.logger)
 
         # decide whether to use pre‑opened captures or open new ones
+        self.capture_infos: dict[int, CaptureInfo] = {}
+        # pre-opened captures belong to the caller and outlive this detector
+        self._owns_caps = caps is None
         if caps is not None:
             self.caps = caps
             self.logger.info(f"Using {len(caps)} pre‑opened captures")
+            if capture_info is not None:
+                self.capture_infos[0] = capture_info
+            else:
+                for idx, cap in caps.items():
+                    self.capture_infos[idx] = negotiate(cap, idx, logger=self.logger)
         else:
             assert sources is not None, "Must provide `sources` if no `caps` given"
             self.caps = self._init_captures(sources)
+        self.capture_infos = {
+            idx: info.with_detect_scale(detect_scale) for idx, info in self.capture_infos.items()
+        }
 
     def _init_models(self):
-        BASE_DIR = find_project_root()
-        RES_DIR = os.path.join(BASE_DIR, "src", "eartag_jetson", "resources")
-        pt_path = os.path.join(RES_DIR, "seg_model.pt")
-        eng_path = os.path.join(RES_DIR, "seg_model.engine")
-
-        logging.getLogger("ppocr").setLevel(logging.ERROR)
-        self.logger.info("Loading YOLO model...")
-        model_pt = YOLO(pt_path, task="detect")
-        export_yolo_to_engine(model_pt, eng_path, self.logger)
-        model = YOLO(eng_path, task="detect")
-
-        self.logger.info("Initializing PaddleOCR...")
-        ocr = PaddleOCR(
-            use_angle_cls=True,
-            lang="en",
-            ocr_version="PP-OCRv4",
-            use_space_char=True,
-            drop=0.9,
-        )
-        return model, ocr
+        # loaded once per process, not per session
+        return load_models(logger=self.logger, ocr=RECOGNIZER == "paddle")
 
     def _init_captures(self, sources):
         caps = {}
         for idx, src in enumerate(sources):
-            src_obj = int(src) if isinstance(src, str) and src.isdigit() else src
-            cap = cv2.VideoCapture(src_obj)
-            if not cap.isOpened():
+            try:
+                cap, self.capture_infos[idx] = open_capture(src, logger=self.logger)
+            except IOError:
                 self.logger.error(f"Cannot open camera {src}")
-                raise IOError(f"Cannot open {src}")
+                raise
             self.logger.info(f"Camera {idx} opened: {src}")
             caps[idx] = cap
         return caps
@@ -93,8 +112,10 @@ class StallDetector:
         devs = [os.path.realpath(lnk) for lnk in links if os.path.realpath(lnk).startswith("/dev/video")]
         return sorted(set(devs), key=lambda d: int(d.split("video")[-1]))
 
-    def detect_and_aggregate(self, frame, agg):
-        results = self.model(frame)
+    def detect(self, frame):
+        """YOLO boxes (x0, y0, x1, y1, conf) at full resolution, left to right."""
+        with self.yolo_lock:         # the scaler buffer and the model are shared
+            results = self.model(self.scaler(frame))
         dets = sorted(
             [
                 (*map(int, box.xyxy[0][:2].tolist()), *map(int, box.xyxy[0][2:].tolist()), float(box.conf[0]))
@@ -102,35 +123,76 @@ class StallDetector:
             ],
             key=lambda x: x[0]
         )
-        self.logger.info(f"YOLO found {len(dets)} boxes")
+        return self.scaler.to_full(dets, frame.shape[1], frame.shape[0])
+
+    def detect_and_aggregate(self, frame, agg):
+        return self.read_and_aggregate(frame, self.detect(frame), agg)
+
+    def read_and_aggregate(self, frame, dets, agg):
+        """OCR the boxes of one frame (drawing them) and fold the reads into `agg`."""
+        # per-frame lines are written for at most one frame per interval
+        self._log_frame = self.frame_log()
+        if self._log_frame:
+            self.logger.info(
+                "YOLO found %d boxes (%d frames not logged)", len(dets), self.frame_log.take_skipped()
+            )
 
-        valid = 0
+        # boxes of settled tracks are not OCR'd again
+        tracks = agg.assign(dets) if hasattr(agg, "assign") else None
+        reads = [None] * len(dets)
+        todo, crops = [], []
         for idx, (x0, y0, x1, y1, conf) in enumerate(dets):
+            if tracks is not None and tracks[idx].settled:
+                reads[idx] = (tracks[idx].text, 1.0)
+                self.metrics.inc("ocr_skipped")
+                continue
+            todo.append(idx)
+            crops.append(cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2RGB))
+
+        # one recognizer batch per frame, cropped before the boxes are drawn
+        for idx, read in zip(todo, self.recognizer.read(crops)):
+            if read is not None:
+                self.logger.debug("OCR on box %d: '%s'", idx, read[0])
+            reads[idx] = read
+        publish_counts(self.recognizer, self.metrics)
+        for (x0, y0, x1, y1, conf) in dets:
             cv2.rectangle(frame, (x0, y0), (x1, y1), (255, 0, 0), 2)
             cv2.putText(frame, f"{conf:.2f}", (x0, y0-5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
 
-            crop = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
-            res = self.ocr.ocr(crop, cls=True)
+        # per text, or per track when tracking is on
+        accepted = fold_reads(dets, reads, agg, tracks, self.roster)
+        if self.roster is not None:
+            for name, n in self.roster.take_counts().items():
+                self.metrics.inc(name, n)
+        tags = dict((x0, text) for text, x0 in accepted)
+        for (x0, y0, x1, y1, _) in dets:
+            if x0 in tags:
+                cv2.rectangle(frame, (x0, y0), (x1, y1), (0, 255, 0), 2)
+                cv2.putText(frame, tags[x0], (x0, y0-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        if self._log_frame:
+            for text, x0 in accepted:
+                self.logger.info("Accepted tag %s at x=%d", text, x0)
 
-            if res and res[0]:
-                text, _ = res[0][0][1]
-                self.logger.debug(f"OCR on box {idx}: '{text}'")
-                if re.fullmatch(r"\d{4}", text):
-                    valid += 1
-                    entry = agg[text]
-                    entry["count"] += 1
-                    entry["x_list"].append(x0)
-                    cv2.rectangle(frame, (x0, y0), (x1, y1), (0, 255, 0), 2)
-                    cv2.putText(frame, text, (x0, y0-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                    self.logger.info(f"Accepted tag {text} at x={x0}")
+        return len(accepted)
 
-        return valid
+    def read_frame(self, cam_id: int):
+        """
+        `cap.read()` of camera `cam_id` timed as capture (grab) and decode
+        (retrieve); on GStreamer "capture+decode" and "retrieve", see CaptureInfo.
+        """
+        ret, frame, grab_s, decode_s, _ = read_timed(self.caps[cam_id])
+        info = self.capture_infos.get(cam_id)
+        self.metrics.observe(info.grab_stage if info else "capture", grab_s * 1000.0)
+        self.metrics.observe(info.decode_stage if info else "decode", decode_s * 1000.0)
+        if not ret:
+            self.metrics.inc("dropped_frames")
+        return ret, frame
 
     def wait_for_milking(self) -> bool:
         self.logger.info("Waiting for milking to start...")
         while True:
-            for cam_id, cap in self.caps.items():
-                ret, frame = cap.read()
+            for cam_id in self.caps:
+                ret, frame = self.read_frame(cam_id)
                 if not ret:
                     self.logger.warning(f"Camera {cam_id} stream ended")
                     #change to continue for stream
@@ -151,43 +213,70 @@ class StallDetector:
         End is detected via relative drop and sustained timeout.
         """
         self.logger.info("Running milking session…")
-        agg = defaultdict(lambda: {"count":0,"x_list":[]})
+        agg = new_agg(tracked=self.track, settle_p=self.settle_p) if self.track else new_agg()
         peak_seen = 0
-        end_threshold_ratio = 0.4
-        end_timeout = 4.0
+        end_threshold_ratio = self.end_threshold_ratio
+        end_timeout = self.end_timeout
         end_start = None
+        ended = False
 
-        while True:
-            ret, frame = next(iter(self.caps.values())).read()
-            if not ret:
-                #finite video, change to continue 
-                self.logger.info("End of video stream reached")
-                break
-            v = self.detect_and_aggregate(frame, agg)
-            peak_seen = max(peak_seen, v)
-
-            if peak_seen >= self.min_detections:
-                if v < peak_seen * end_threshold_ratio:
-                    if end_start is None:
-                        end_start = time.time()
-                        self.logger.debug(f"Below {end_threshold_ratio*100:.0f}% of peak; starting end timer")
-                else:
-                    end_start = None
+        # pipelined: YOLO (yolo stage) overlaps OCR + aggregation (ocr stage,
+        # in frame order) of the previous frame
+        ex = None
+        if self.stage_workers is not None:
+            ex = StageExecutor([
+                Stage("yolo", lambda f: (f, self.detect(f)),
+                      workers=self.stage_workers.get("yolo", 1)),
+                Stage("ocr", lambda fd: self.read_and_aggregate(*fd, agg), ordered=True),
+            ], depth=self.pipeline_depth, metrics=self.metrics).start()
 
-                if end_start and (time.time() - end_start) >= end_timeout:
-                    self.logger.info("Milking session ended (relative drop sustained)")
+        try:
+            while not ended:
+                ret, frame = self.read_frame(next(iter(self.caps)))
+                if not ret:
+                    #finite video, change to continue 
+                    self.logger.info("End of video stream reached")
                     break
+                if ex is None:
+                    counts = [self.detect_and_aggregate(frame, agg)]
+                else:
+                    ex.submit(frame)
+                    counts = ex.poll()
 
-            source_id = list(self.caps.keys())[0]
-            # display_frame = cv2.resize(frame, None, fx=0.3, fy=0.3)
-            # cv2.imshow(f"Cam_{source_id}", display_frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                return None, None
+                for v in counts:
+                    peak_seen = max(peak_seen, v)
+
+                    if peak_seen >= self.min_detections:
+                        if v < peak_seen * end_threshold_ratio:
+                            if end_start is None:
+                                end_start = time.time()
+                                self.logger.debug(f"Below {end_threshold_ratio*100:.0f}% of peak; starting end timer")
+                        else:
+                            end_start = None
+
+                        if end_start and (time.time() - end_start) >= end_timeout:
+                            self.logger.info("Milking session ended (relative drop sustained)")
+                            ended = True
+                            break
+
+                source_id = list(self.caps.keys())[0]
+                # display_frame = cv2.resize(frame, None, fx=0.3, fy=0.3)
+                # cv2.imshow(f"Cam_{source_id}", display_frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    return None, None
+        finally:
+            if ex is not None:
+                ex.close()
+                self.logger.info("Stage utilization: " + ", ".join(
+                    f"{name} {util:.0%}" for name, util in ex.utilization().items()
+                ))
 
         return agg, end_start
 
     def shutdown(self):
-        for cap in self.caps.values():
-            cap.release()
+        self.recognizer.close()
+        if self._owns_caps:
+            for cap in self.caps.values():
+                cap.release()
         cv2.destroyAllWindows()
         self.logger.info("StallDetector shutdown complete.")
\ No newline at end of file
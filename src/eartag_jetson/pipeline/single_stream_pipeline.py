@@ -2,11 +2,14 @@
 import os
 os.environ['GLOG_minloglevel'] = '2'  
 
-import cv2, time, logging, serial
-import numpy as np
-from collections import defaultdict
+import time, logging, serial
+from eartag_jetson.common.capture import open_capture, REFERENCE_WIDTH, REFERENCE_HEIGHT
 from eartag_jetson.common.common_utils import find_project_root, get_logger, send_over_esp
+from eartag_jetson.pipeline.roster import load_roster
 from eartag_jetson.pipeline.single_detector import StallDetector
+from eartag_jetson.pipeline.stage_executor import parse_stage_workers
+from eartag_jetson.pipeline.stall_config import load_stall_config
+from eartag_jetson.pipeline.summary import build_summary
 from serial import SerialException
 
 # ─── CONSTANTS ───────────────────────────────────────────────────────────────────
@@ -15,24 +18,34 @@ BLE_CODES      = ["MM2502V0003FMT"]   # index matches camera index
 SERIAL_PORT    = "/dev/ttyACM0"
 BAUD_RATE      = 115200
 
-FRAME_WIDTH    = 4608
-EDGE_MARGIN    = 350    # px to ignore on each side of the frame
+EDGE_MARGIN    = 350    # px to ignore on each side of the frame (at 4608 px wide)
 CLOSE_THRESH   = 250    # px for collapsing near‑duplicates
 TOP_N          = 4      # max number of stalls to keep
 MIN_DETECTIONS = 7      # start session when ≥7 tags visible
 STREAK_THRESH  = 50     # unused for video, but ctor requires it
+# YOLO on the next frame while this one is OCR'd (EARTAG_PIPELINE=1)
+STAGE_WORKERS  = parse_stage_workers(os.environ.get("EARTAG_PIPELINE"))
 
 # ─── MAIN ────────────────────────────────────────────────────────────────────────
 def main():
 
     logger = get_logger(__name__)
+    # constants below are defaults; stall_config.json overrides them per camera
+    cfg = load_stall_config(
+        BLE_CODES[0],
+        edge_margin=EDGE_MARGIN,
+        close_thresh=CLOSE_THRESH,
+        top_n=TOP_N,
+        min_detections=MIN_DETECTIONS,
+        streak_threshold=STREAK_THRESH,
+    )
+    roster = load_roster()
+    if roster is not None:
+        logger.info(f"Herd roster: {len(roster)} tags")
 
     # ─── SETUP LIVE CAPTURE ────────────────────────────────────────────────────────
-    cap = cv2.VideoCapture(0)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 4608)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 2592)
-    if not cap.isOpened():
-        raise IOError("Cannot open camera stream")
+    # the real resolution is read back once; the summary uses it, not a constant
+    cap, info = open_capture(0, width=REFERENCE_WIDTH, height=REFERENCE_HEIGHT, logger=logger)
     logger.info("Camera stream opened")
 
     try:
@@ -49,9 +62,17 @@ def main():
             # ─── NEW DETECTOR FOR EACH SESSION ─────────────────────────────────
             detector = StallDetector(
                 caps={0: cap},
+                capture_info=info,
                 api_endpoint="",
-                min_detections=MIN_DETECTIONS,
-                streak_threshold=STREAK_THRESH,
+                min_detections=cfg.min_detections,
+                streak_threshold=cfg.streak_threshold,
+                end_threshold_ratio=cfg.end_threshold_ratio,
+                end_timeout=cfg.end_timeout,
+                detect_scale=cfg.detect_scale,
+                track=cfg.track,
+                settle_p=cfg.settle_p,
+                roster=roster,
+                stage_workers=STAGE_WORKERS,
             )
 
             logger.info("Waiting for milking to start…")
@@ -66,44 +87,18 @@ def main():
             detector.shutdown()
 
             # ─── BUILD SUMMARY ──────────────────────────────────────────────────────────────
-            summary = []
-            for text, data in agg.items():
-                median_x = float(np.median(data['x_list']))
-                summary.append({
-                    'text': text,
-                    'frequency': data['count'],
-                    'median_x': median_x
-                })
-
-            # ─── DROP ENTRIES NEAR THE LEFT / RIGHT EDGES ───────────────────────────────────
-        
-            summary = [
-                e for e in summary
-                if EDGE_MARGIN <= e['median_x'] <= FRAME_WIDTH - EDGE_MARGIN
-            ]
-            if not summary:                # nothing left → exit early
+            # edge filter, merge near-duplicates by position, top N left-to-right
+            tags_lr = build_summary(
+                agg,
+                frame_width=info.width,
+                edge_margin=cfg.edge_margin,
+                close_thresh=cfg.close_thresh,
+                top_n=cfg.top_n,
+            )
+            if not tags_lr:                # nothing left → exit early
                 logger.info("No valid detections after edge filter; waiting for next session.")
                 continue
 
-            # ─── MERGE NEAR-DUPLICATES BY POSITION ──────────────────────────────────────────
-            summary.sort(key=lambda e: e['median_x'])
-
-            deduped, cluster = [], [summary[0]]
-            for entry in summary[1:]:
-                if abs(entry['median_x'] - cluster[-1]['median_x']) <= CLOSE_THRESH:
-                    cluster.append(entry)
-                else:
-                    deduped.append(max(cluster, key=lambda e: (e['frequency'], -e['median_x'])))
-                    cluster = [entry]
-            deduped.append(max(cluster, key=lambda e: (e['frequency'], -e['median_x'])))
-
-            # ─── FILTER TOP N BY FREQUENCY ─────────────────────────────────────────────────
-            top_items = sorted(deduped, key=lambda e: e['frequency'], reverse=True)[:TOP_N]
-            top_items.sort(key=lambda e: e['median_x'])     # left-to-right
-
-            # ⬅️ 1. get the ordered list of tags
-            tags_lr = [e["text"] for e in top_items]        # e.g. ["3013", "2784", "2321", "3010"]
-
             # ─── SEND OVER UART ──────────────────────────────────────────────
             send_over_esp(ser, BLE_CODES, tags_lr, end_ts, logger)
             logger.info(f"Session done: sent {tags_lr}")
@@ -0,0 +1,254 @@
+# pipeline/stage_executor.py
+"""
+Frame pipeline that overlaps the per-frame stages of consecutive frames.
+
+Without it a frame goes capture → YOLO → OCR → aggregate before the next
+one is read, so the GPU idles during OCR and the CPU idles during YOLO.
+`StageExecutor` runs every stage on its own worker thread(s) with bounded
+queues in between: while frame t is being OCR'd, YOLO already runs on t+1
+and the main thread is grabbing t+2.
+
+    ex = StageExecutor([
+        Stage("yolo", detect, workers=1),
+        Stage("crop", assign_and_crop, ordered=True),
+        Stage("ocr", read, workers=2),
+        Stage("aggregate", fold, ordered=True),
+    ], depth=2, metrics=metrics)
+    ex.start()
+    ex.submit(frame)            # blocks while the first queue is full
+    for out in ex.poll(): ...   # finished frames, in submission order
+
+Every item carries its sequence number. An `ordered` stage (single worker)
+only ever sees items in that order – use it for anything that updates
+session state (tracker assignment, the aggregate) – and results come out of
+`poll()` / `get()` in order whatever the concurrency of the other stages.
+An exception in a stage is re-raised by `poll()` / `get()` for its item.
+
+Per-stage utilization (busy time / (workers × wall time)) is published as
+`util_<stage>` gauges and the queue fill as `queue_<stage>`.
+"""
+import heapq
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from eartag_jetson.common.metrics import Metrics
+
+_STOP = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[Any], Any]
+    workers: int = 1
+    ordered: bool = False       # items arrive in sequence order (needs workers == 1)
+
+
+class _Failed:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class _Reorder:
+    """Releases (seq, item) pairs strictly in seq order."""
+
+    def __init__(self):
+        self.heap: list = []
+        self.next = 0
+
+    def push(self, seq, item):
+        heapq.heappush(self.heap, (seq, id(item), item))
+
+    def pop_ready(self):
+        while self.heap and self.heap[0][0] == self.next:
+            seq, _, item = heapq.heappop(self.heap)
+            self.next += 1
+            yield seq, item
+
+
+class StageExecutor:
+    def __init__(self, stages: list[Stage], *, depth: int = 2, metrics: Metrics | None = None):
+        for st in stages:
+            if st.ordered and st.workers != 1:
+                raise ValueError(f"ordered stage {st.name!r} must have exactly one worker")
+            if st.workers < 1:
+                raise ValueError(f"stage {st.name!r} needs at least one worker")
+        self.stages  = stages
+        self.metrics = metrics
+        self.queues  = [queue.Queue(maxsize=max(1, depth * st.workers)) for st in stages]
+        self.out: queue.Queue = queue.Queue()          # unbounded: never blocks a worker
+        self.busy    = [0.0] * len(stages)
+        self._lock   = threading.Lock()
+        self._alive  = [st.workers for st in stages]
+        self._threads: list[threading.Thread] = []
+        self._seq    = 0
+        self._done   = _Reorder()
+        self._ready: deque = deque()                   # in order, not yet handed out
+        self._closed = False
+        self._t0     = None
+
+    # ─── workers ─────────────────────────────────────────────────────────────
+    def _forward(self, idx: int, seq, item):
+        if idx + 1 < len(self.stages):
+            self.queues[idx + 1].put((seq, item))
+        else:
+            self.out.put((seq, item))
+
+    def _run_item(self, idx: int, seq, item):
+        if not isinstance(item, _Failed):
+            t0 = time.perf_counter()
+            try:
+                item = self.stages[idx].fn(item)
+            except Exception as e:
+                item = _Failed(e)
+            with self._lock:
+                self.busy[idx] += time.perf_counter() - t0
+        self._forward(idx, seq, item)
+
+    def _stopped(self, idx: int):
+        """Last worker of stage `idx` out: stop the next stage's workers."""
+        with self._lock:
+            self._alive[idx] -= 1
+            last = self._alive[idx] == 0
+        if not last:
+            return
+        if idx + 1 < len(self.stages):
+            for _ in range(self.stages[idx + 1].workers):
+                self.queues[idx + 1].put(_STOP)
+        else:
+            self.out.put(_STOP)
+
+    def _worker(self, idx: int):
+        q, ordered = self.queues[idx], self.stages[idx].ordered
+        pending = _Reorder() if ordered else None
+        while True:
+            msg = q.get()
+            if msg is _STOP:
+                break
+            if not ordered:
+                self._run_item(idx, *msg)
+                continue
+            pending.push(*msg)
+            for seq, item in pending.pop_ready():
+                self._run_item(idx, seq, item)
+        self._stopped(idx)
+
+    # ─── producer / consumer side ────────────────────────────────────────────
+    def start(self) -> "StageExecutor":
+        self._t0 = time.perf_counter()
+        for idx, st in enumerate(self.stages):
+            for w in range(st.workers):
+                t = threading.Thread(target=self._worker, args=(idx,),
+                                     name=f"stage-{st.name}-{w}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        return self
+
+    def submit(self, item) -> int:
+        """Queue one item for the first stage; returns its sequence number."""
+        seq = self._seq
+        self._seq += 1
+        self.queues[0].put((seq, item))
+        return seq
+
+    def _collect(self, block: bool, timeout: float | None):
+        try:
+            msg = self.out.get(block, timeout)
+        except queue.Empty:
+            return False
+        if msg is _STOP:
+            self._closed = True
+            return False
+        self._done.push(*msg)
+        return True
+
+    def _take(self):
+        item = self._ready.popleft()
+        if isinstance(item, _Failed):
+            raise item.error
+        return item
+
+    def poll(self) -> list:
+        """Every result finished so far, in submission order (non-blocking)."""
+        while self._collect(False, None):
+            pass
+        self._ready.extend(item for _, item in self._done.pop_ready())
+        self.report()
+        outs = []
+        while self._ready:
+            if outs and isinstance(self._ready[0], _Failed):
+                break                   # hand out the good results first
+            outs.append(self._take())
+        return outs
+
+    def get(self, timeout: float | None = None):
+        """Next result in submission order; blocks up to `timeout` (None → forever)."""
+        while not self._ready:
+            if self._closed or not self._collect(True, timeout):
+                raise queue.Empty
+            self._ready.extend(item for _, item in self._done.pop_ready())
+        return self._take()
+
+    @property
+    def in_flight(self) -> int:
+        return self._seq - self._done.next + len(self._ready)
+
+    def close(self) -> list:
+        """
+        Finish the queued items and stop the workers; returns the results not
+        handed out yet (failed items are dropped – the session is over).
+        """
+        for _ in range(self.stages[0].workers):
+            self.queues[0].put(_STOP)
+        while not self._closed:
+            self._collect(True, None)
+        for t in self._threads:
+            t.join()
+        self._ready.extend(item for _, item in self._done.pop_ready())
+        self.report()
+        outs = [item for item in self._ready if not isinstance(item, _Failed)]
+        self._ready.clear()
+        return outs
+
+    # ─── reporting ───────────────────────────────────────────────────────────
+    def utilization(self) -> dict[str, float]:
+        """Busy share of each stage's workers since start()."""
+        wall = time.perf_counter() - self._t0 if self._t0 else 0.0
+        with self._lock:
+            busy = list(self.busy)
+        return {
+            st.name: (b / (wall * st.workers) if wall > 0 else 0.0)
+            for st, b in zip(self.stages, busy)
+        }
+
+    def report(self):
+        if self.metrics is None:
+            return
+        for name, util in self.utilization().items():
+            self.metrics.set_gauge(f"util_{name}", util)
+        for st, q in zip(self.stages, self.queues):
+            self.metrics.set_gauge(f"queue_{st.name}", q.qsize() / q.maxsize)
+
+
+def parse_stage_workers(spec: str | None) -> dict[str, int] | None:
+    """
+    `EARTAG_PIPELINE` value → detector `stage_workers`: "" / "0" → None
+    (sequential), "1" → {} (pipelined, one worker per stage),
+    "yolo=1,ocr=2" → workers per stage.
+    """
+    spec = (spec or "").strip()
+    if spec in ("", "0"):
+        return None
+    if spec == "1":
+        return {}
+    workers = {}
+    for part in spec.split(","):
+        name, _, n = part.partition("=")
+        workers[name.strip()] = int(n)
+    return workers
@@ -0,0 +1,81 @@
+# pipeline/stall_config.py
+"""
+Per-camera stall settings, loaded from a JSON file instead of module constants.
+
+    {
+      "default": {"edge_margin": 500, "close_thresh": 250, "top_n": 4},
+      "cameras": {
+        "MM2502V0003FMT": {"edge_margin": 350, "min_detections": 6}
+      }
+    }
+
+Values are resolved as: dataclass defaults < caller defaults (the pipeline's
+own constants) < file "default" < file "cameras"[camera]. The file comes from
+`EARTAG_STALL_CONFIG`, else resources/stall_config.json if present.
+`auto_tune.py` writes files in this format.
+"""
+import os
+import json
+from dataclasses import dataclass, asdict, fields, replace
+from eartag_jetson.pipeline.summary import EDGE_MARGIN, CLOSE_THRESH, TOP_N
+
+CONFIG_PATH = os.environ.get(
+    "EARTAG_STALL_CONFIG",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "resources", "stall_config.json"),
+)
+
+
+@dataclass(frozen=True)
+class StallConfig:
+    edge_margin: int           = EDGE_MARGIN   # px ignored at each side (at 4608 px wide)
+    close_thresh: int          = CLOSE_THRESH  # px for collapsing near-duplicates (same)
+    top_n: int                 = TOP_N         # max number of stalls to keep
+    min_detections: int        = 7             # start session when ≥N tags visible
+    streak_threshold: int      = 50
+    end_threshold_ratio: float = 0.4           # session ends below this share of peak…
+    end_timeout: float         = 4.0           # …sustained for this many seconds
+    detect_scale: float        = 1.0           # YOLO input as a fraction of the capture size
+    track: bool                = True          # vote reads per tracked tag (tracker.py)
+    settle_p: float            = 0.999         # stop OCR on a track this sure of its tag (≥ 1: never)
+    frame_budget_ms: float     = 0.0           # degrade while frames cost more (deadline.py; 0: never)
+    degrade_order: str         = "settled,imgsz,skip"
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _known(values: dict) -> dict:
+    names = {f.name for f in fields(StallConfig)}
+    unknown = set(values) - names
+    if unknown:
+        raise ValueError(f"Unknown stall config keys: {sorted(unknown)}")
+    return values
+
+
+def load_stall_config(camera: str | None = None, path: str | None = None,
+                      **defaults) -> StallConfig:
+    """Resolve the settings for `camera` (see module docstring for precedence)."""
+    cfg = replace(StallConfig(), **_known(defaults))
+    path = path or CONFIG_PATH
+    if not path or not os.path.exists(path):
+        return cfg
+    with open(path) as f:
+        data = json.load(f)
+    cfg = replace(cfg, **_known(data.get("default", {})))
+    if camera is not None:
+        cfg = replace(cfg, **_known(data.get("cameras", {}).get(str(camera), {})))
+    return cfg
+
+
+def save_stall_configs(path: str, per_camera: dict[str, dict],
+                       default: dict | None = None):
+    """
+    Write per-camera overrides (and a file "default") holding only the given
+    keys; pass `cfg.to_dict()` to pin every field.
+    """
+    data = {
+        "default": _known(dict(default or {})),
+        "cameras": {cam: _known(dict(values)) for cam, values in per_camera.items()},
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
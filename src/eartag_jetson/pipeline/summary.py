@@ -0,0 +1,117 @@
+# pipeline/summary.py
+import re
+from collections import defaultdict
+import numpy as np
+from eartag_jetson.common.capture import REFERENCE_WIDTH
+
+# ─── DEFAULTS ────────────────────────────────────────────────────────────────
+# pixel settings are given at REFERENCE_WIDTH and scaled to the real capture
+EDGE_MARGIN    = 500          # px to ignore at each side
+CLOSE_THRESH   = 250          # px for collapsing near-duplicates
+TOP_N          = 4            # max number of stalls to keep
+
+TAG_PATTERN    = re.compile(r"\d{4}")
+
+
+def new_agg(tracked: bool = False, **track_kw):
+    """
+    Empty session aggregate: per text ({text: {"count", "x_list"}}), or per
+    track (tracker.TrackAggregate(**track_kw)) when `tracked`.
+    """
+    if tracked:
+        from eartag_jetson.pipeline.tracker import TrackAggregate
+        return TrackAggregate(**track_kw)
+    return defaultdict(lambda: {"count": 0, "x_list": []})
+
+
+def _pattern_tag(text: str) -> str | None:
+    return text if TAG_PATTERN.fullmatch(text) else None
+
+
+def fold_reads(dets, reads, agg, tracks=None, roster=None) -> list[tuple[str, int]]:
+    """
+    Add one frame's OCR reads (aligned with `dets`) to `agg`.
+    Returns the accepted (text, x0) pairs. With a `roster` (roster.HerdRoster)
+    only herd IDs are accepted, misreads snapped to their ID, instead of any
+    text matching TAG_PATTERN.
+    """
+    accept = roster.match if roster is not None else _pattern_tag
+    if hasattr(agg, "fold"):                 # TrackAggregate
+        return agg.fold(dets, reads, accept, tracks)
+    accepted = []
+    for (x0, y0, x1, y1, conf), read in zip(dets, reads):
+        if read is None:
+            continue
+        text = accept(read[0])
+        if text:
+            entry = agg[text]
+            entry["count"] += 1
+            entry["x_list"].append(x0)
+            accepted.append((text, x0))
+    return accepted
+
+
+def summarize_agg(agg) -> list[dict]:
+    """
+    Turn the aggregate built by `detect_and_aggregate` into summary entries
+    ({'text', 'frequency', 'median_x'}). A list is already entries (e.g. a
+    session restored from session_store.py) and is returned as is.
+    """
+    if isinstance(agg, list):
+        return agg
+    if hasattr(agg, "entries"):              # TrackAggregate
+        return agg.entries()
+    return [
+        {'text': t,
+         'frequency': d['count'],
+         'median_x': float(np.median(d['x_list']))}
+        for t, d in agg.items() if d['x_list']
+    ]
+
+
+def build_summary(
+    agg,
+    *,
+    frame_width: int,
+    edge_margin: int = EDGE_MARGIN,
+    close_thresh: int = CLOSE_THRESH,
+    top_n: int = TOP_N,
+) -> list[str]:
+    """
+    Edge-filter, merge near duplicates and keep the top-N tags of a session.
+    `frame_width` is the true capture width (see CaptureInfo); the margins are
+    compared in normalized units, so they hold at any capture resolution.
+    Returns the tags ordered left to right (empty if nothing survives).
+    """
+    edge  = edge_margin / REFERENCE_WIDTH
+    close = close_thresh / REFERENCE_WIDTH
+    summary = [
+        e for e in summarize_agg(agg)
+        if edge <= e['median_x'] / frame_width <= 1.0 - edge
+    ]
+    if not summary:
+        return []
+
+    # merge near duplicates
+    summary.sort(key=lambda e: e['median_x'])
+    deduped, cluster = [], [summary[0]]
+    for e in summary[1:]:
+        if abs(e['median_x'] - cluster[-1]['median_x']) / frame_width <= close:
+            cluster.append(e)
+        else:
+            deduped.append(max(cluster, key=lambda x: (x['frequency'], -x['median_x'])))
+            cluster = [e]
+    deduped.append(max(cluster, key=lambda x: (x['frequency'], -x['median_x'])))
+
+    # top-N, left to right
+    top_items = sorted(deduped, key=lambda e: e['frequency'], reverse=True)[:top_n]
+    top_items.sort(key=lambda e: e['median_x'])
+    return [e['text'] for e in top_items]
+
+
+def ordering_accuracy(pred: list[str], truth: list[str]) -> float:
+    """Fraction of positions where the predicted left-to-right tag is correct."""
+    n = max(len(pred), len(truth))
+    if n == 0:
+        return 1.0
+    return sum(p == t for p, t in zip(pred, truth)) / n
@@ -0,0 +1,225 @@
+# pipeline/tracker.py
+"""
+Per-tag tracks across frames, so a session is aggregated per cow instead of
+per OCR string.
+
+`TagTracker` matches each frame's YOLO boxes to live tracks (greedy, by IoU,
+falling back to centroid distance for boxes that moved more than they
+overlap) and retires tracks that go unseen for `max_misses` frames. The
+track's position is the median of its recent x0 values.
+
+Every accepted OCR read is evidence on its track's text, fused per
+character: a read of confidence c says "this digit" with probability c and
+each other digit with (1 - c) / 9, and the log-likelihoods add up across
+frames. The track's text is the per-position argmax, so a misread digit is
+outvoted inside its track instead of becoming a separate "tag" for the
+CLOSE_THRESH merge to clean up. PaddleOCR only reports one confidence per
+string, which is applied to each of its characters.
+
+Once the posterior of the winning string reaches `settle_p` (after at least
+`min_reads` reads) the track is settled: the detectors stop OCR'ing its box
+and every later sighting counts as a read of the settled text.
+
+`TrackAggregate` is a drop-in `agg` for `fold_reads` / `build_summary`:
+memory is bounded by the number of tracks (each keeps a fixed-size x
+window and a digits × 10 table), not by the number of reads.
+"""
+import math
+from collections import deque
+import numpy as np
+
+IOU_THRESH  = 0.3       # min overlap to continue a track
+MAX_SHIFT   = 0.5       # …or centroid within this × box width
+MAX_MISSES  = 15        # frames a track survives without a matching box
+X_WINDOW    = 64        # recent x0 values kept per track
+SETTLE_P    = 0.999     # posterior of the winning text that settles a track (≥ 1: never)
+MIN_READS   = 3         # reads a track needs before it can settle
+CONF_RANGE  = (0.2, 0.995)  # OCR confidence clipped into this range
+
+
+def iou(a, b) -> float:
+    ix = min(a[2], b[2]) - max(a[0], b[0])
+    iy = min(a[3], b[3]) - max(a[1], b[1])
+    if ix <= 0 or iy <= 0:
+        return 0.0
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    __slots__ = ("id", "box", "misses", "hits", "xs", "reads", "support", "logp", "settled")
+
+    def __init__(self, track_id: int, box):
+        self.id      = track_id
+        self.box     = box
+        self.misses  = 0
+        self.hits    = 1
+        self.xs      = deque([box[0]], maxlen=X_WINDOW)
+        self.reads   = 0            # reads fused into logp
+        self.support = 0            # reads + sightings after settling
+        self.logp: np.ndarray | None = None     # per position, per digit
+        self.settled = False
+
+    def update(self, box):
+        self.box = box
+        self.misses = 0
+        self.hits += 1
+        self.xs.append(box[0])
+
+    def vote(self, text: str, conf: float) -> bool:
+        """Fuse one read; False if it doesn't fit this track (length, non-digits)."""
+        if not text.isdigit() or (self.logp is not None and len(text) != len(self.logp)):
+            return False
+        if self.logp is None:
+            self.logp = np.zeros((len(text), 10))
+        c = min(max(float(conf), CONF_RANGE[0]), CONF_RANGE[1])
+        other = math.log((1.0 - c) / 9.0)
+        self.logp += other
+        self.logp[np.arange(len(text)), [int(ch) for ch in text]] += math.log(c) - other
+        self.reads += 1
+        self.support += 1
+        return True
+
+    def posterior(self) -> float:
+        """Probability of `text` under the fused reads (positions independent)."""
+        if self.logp is None:
+            return 0.0
+        p = np.exp(self.logp - self.logp.max(axis=1, keepdims=True))
+        return float(np.prod(p.max(axis=1) / p.sum(axis=1)))
+
+    @property
+    def x(self) -> float:
+        return float(np.median(self.xs))
+
+    @property
+    def text(self) -> str | None:
+        """Most likely digit at every position."""
+        if self.logp is None:
+            return None
+        return "".join(map(str, self.logp.argmax(axis=1)))
+
+
+class TagTracker:
+    def __init__(self, *, iou_thresh: float = IOU_THRESH, max_shift: float = MAX_SHIFT,
+                 max_misses: int = MAX_MISSES):
+        self.iou_thresh = iou_thresh
+        self.max_shift  = max_shift
+        self.max_misses = max_misses
+        self.active: list[Track] = []
+        self.retired: list[Track] = []        # only tracks that were read
+        self._next_id = 0
+
+    def _score(self, track: Track, box) -> float:
+        """Match quality (> 0) or 0 if `box` can't continue `track`."""
+        overlap = iou(track.box, box)
+        if overlap >= self.iou_thresh:
+            return 1.0 + overlap
+        tb = track.box
+        gate = self.max_shift * max(1, tb[2] - tb[0])
+        dx = abs((tb[0] + tb[2]) - (box[0] + box[2])) / 2
+        dy = abs((tb[1] + tb[3]) - (box[1] + box[3])) / 2
+        d = max(dx, dy)
+        return 1.0 - d / gate if d < gate else 0.0
+
+    def update(self, dets) -> list[Track]:
+        """Assign this frame's boxes to tracks; returns the track of every box."""
+        pairs = sorted(
+            (
+                (s, ti, di)
+                for ti, track in enumerate(self.active)
+                for di, det in enumerate(dets)
+                if (s := self._score(track, det)) > 0.0
+            ),
+            reverse=True,
+        )
+        assigned: list[Track | None] = [None] * len(dets)
+        used = set()
+        for _, ti, di in pairs:
+            if ti in used or assigned[di] is not None:
+                continue
+            used.add(ti)
+            track = self.active[ti]
+            track.update(dets[di])
+            assigned[di] = track
+
+        for ti, track in enumerate(self.active):
+            if ti not in used:
+                track.misses += 1
+        for di, det in enumerate(dets):
+            if assigned[di] is None:
+                assigned[di] = Track(self._next_id, det)
+                self._next_id += 1
+                self.active.append(assigned[di])
+
+        alive = []
+        for track in self.active:
+            if track.misses <= self.max_misses:
+                alive.append(track)
+            elif track.reads:
+                self.retired.append(track)
+        self.active = alive
+        return assigned
+
+    def tracks(self):
+        yield from self.retired
+        yield from self.active
+
+
+class TrackAggregate:
+    """Session aggregate over tracks; see module docstring."""
+
+    def __init__(self, tracker: TagTracker | None = None, *, settle_p: float = SETTLE_P,
+                 min_reads: int = MIN_READS):
+        self.tracker   = tracker or TagTracker()
+        self.settle_p  = settle_p
+        self.min_reads = min_reads
+
+    def assign(self, dets) -> list[Track]:
+        """Track every box of a new frame (before OCR, to skip settled tracks)."""
+        return self.tracker.update(dets)
+
+    def fold(self, dets, reads, accept, tracks=None) -> list[tuple[str, int]]:
+        """
+        Fuse every accepted read (`accept(text)` → the tag, or None) into
+        its box's track; `tracks` comes from `assign` when it was called for this frame.
+        Boxes of settled tracks count as a read of the settled text.
+        """
+        if tracks is None:
+            tracks = self.tracker.update(dets)
+        accepted = []
+        for det, read, track in zip(dets, reads, tracks):
+            if track.settled:
+                track.support += 1
+                accepted.append((track.text, det[0]))
+                continue
+            text = accept(read[0]) if read is not None else None
+            if not text or not track.vote(text, read[1]):
+                continue
+            if track.reads >= self.min_reads and track.posterior() >= self.settle_p:
+                track.settled = True
+            accepted.append((text, det[0]))
+        return accepted
+
+    def entries(self) -> list[dict]:
+        """
+        One summary entry per tag text. A cow whose track broke (occlusion)
+        has several tracks with the same text; they are combined, positioned
+        at the track with the most support.
+        """
+        by_text: dict[str, dict] = {}
+        for track in self.tracker.tracks():
+            text = track.text
+            if text is None:
+                continue
+            n = track.support
+            e = by_text.get(text)
+            if e is None:
+                by_text[text] = {'text': text, 'frequency': n, 'median_x': track.x, '_best': n}
+            else:
+                e['frequency'] += n
+                if n > e['_best']:
+                    e['median_x'], e['_best'] = track.x, n
+        for e in by_text.values():
+            del e['_best']
+        return list(by_text.values())
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# pipeline/train_digit_ocr.py
+"""
+Train and export the digit-only recognizer (DigitRecognizer in recognizer.py).
+
+Labeled crops use PaddleOCR's recognition format: a labels.tsv with one
+`<image path>\\t<digits>` line per crop, paths relative to the file.
+
+    crops   pseudo-label cached crops (detection_cache build --crops --reads):
+            reads with confidence ≥ --min-conf and --digits digits are kept
+            (review them before training: they are PaddleOCR's mistakes too)
+    train   small CNN + CTC on 32×128 grayscale crops, best epoch on the
+            validation set exported to ONNX (dynamic batch) for onnxruntime
+
+    python3 -m eartag_jetson.pipeline.train_digit_ocr crops video6.detcache --out /tmp/tags
+    python3 -m eartag_jetson.pipeline.train_digit_ocr train --train /tmp/tags/labels.tsv --val val/labels.tsv
+
+The model is conv-only (no RNN) so it exports to a plain ONNX graph that runs
+fast on the Jetson's CPU cores; the 32 output steps leave CTC plenty of room
+for four digits with repeats.
+"""
+import os
+import random
+import argparse
+import cv2
+import numpy as np
+from eartag_jetson.common.common_utils import get_logger
+from eartag_jetson.pipeline.recognizer import DIGIT_MODEL, DigitRecognizer
+
+N_CLASSES = 11                  # CTC blank + "0"…"9"
+
+
+# ─── labeled crops ───────────────────────────────────────────────────────────
+def load_labels(tsv: str) -> list[tuple[str, str]]:
+    """(image path, text) of every line of a PaddleOCR-style labels file."""
+    base = os.path.dirname(os.path.abspath(tsv))
+    out = []
+    with open(tsv) as f:
+        for line in f:
+            path, _, text = line.rstrip("\n").partition("\t")
+            if path and text:
+                out.append((os.path.join(base, path), text))
+    return out
+
+
+def load_crops(tsv: str) -> tuple[list[np.ndarray], list[str]]:
+    """RGB crops and their labels (unreadable images skipped)."""
+    crops, texts = [], []
+    for path, text in load_labels(tsv):
+        img = cv2.imread(path)
+        if img is not None:
+            crops.append(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+            texts.append(text)
+    return crops, texts
+
+
+def export_crops(caches: list[str], out: str, *, min_conf: float = 0.9, digits: int = 4,
+                 logger=None) -> str:
+    """Write confidently read cached crops to <out>/images plus <out>/labels.tsv."""
+    from eartag_jetson.pipeline.detection_cache import DetectionCache
+    logger = logger or get_logger("train_digit_ocr")
+    img_dir = os.path.join(out, "images")
+    os.makedirs(img_dir, exist_ok=True)
+    tsv = os.path.join(out, "labels.tsv")
+    n = 0
+    with open(tsv, "w") as f:
+        for ci, path in enumerate(caches):
+            cache = DetectionCache(path)
+            if not (cache.has_crops and cache.has_reads):
+                raise ValueError(f"{path} needs both crops and reads (build --crops --reads)")
+            for i in range(len(cache)):
+                for j, (crop, read) in enumerate(zip(cache.frame_crops(i), cache.frame_reads(i))):
+                    if read is None or read[1] < min_conf:
+                        continue
+                    if len(read[0]) != digits or not read[0].isdigit():
+                        continue
+                    name = f"c{ci:02d}_{i:06d}_{j}.png"
+                    cv2.imwrite(os.path.join(img_dir, name), cv2.cvtColor(np.asarray(crop), cv2.COLOR_RGB2BGR))
+                    f.write(f"images/{name}\t{read[0]}\n")
+                    n += 1
+    logger.info(f"{n} labeled crops from {len(caches)} cache(s) → {tsv}")
+    return tsv
+
+
+# ─── model ───────────────────────────────────────────────────────────────────
+def build_model():
+    """1×32×128 grayscale → N×32×11 CTC scores."""
+    import torch.nn as nn
+
+    def block(cin, cout):
+        return [nn.Conv2d(cin, cout, 3, padding=1, bias=False), nn.BatchNorm2d(cout), nn.ReLU(inplace=True)]
+
+    class DigitCTC(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.features = nn.Sequential(
+                *block(1, 32), nn.MaxPool2d(2),                 # 16×64
+                *block(32, 64), nn.MaxPool2d(2),                # 8×32
+                *block(64, 128), *block(128, 128),
+                nn.MaxPool2d((2, 1)),                           # 4×32
+                *block(128, 192), nn.MaxPool2d((4, 1)),         # 1×32
+                nn.Dropout(0.2),
+            )
+            self.head = nn.Conv2d(192, N_CLASSES, 1)
+
+        def forward(self, x):
+            y = self.head(self.features(x))                     # N×11×1×32
+            return y.squeeze(2).permute(0, 2, 1)                # N×32×11
+
+    return DigitCTC()
+
+
+def _augment(crop: np.ndarray, rng: random.Random) -> np.ndarray:
+    """Lighting, blur and small geometric jitter, as seen across stalls."""
+    h, w = crop.shape[:2]
+    angle = rng.uniform(-6, 6)
+    scale = rng.uniform(0.9, 1.1)
+    m = cv2.getRotationMatrix2D((w / 2, h / 2), angle, scale)
+    m[:, 2] += (rng.uniform(-0.05, 0.05) * w, rng.uniform(-0.05, 0.05) * h)
+    out = cv2.warpAffine(crop, m, (w, h), borderMode=cv2.BORDER_REPLICATE)
+    alpha, beta = rng.uniform(0.7, 1.3), rng.uniform(-30, 30)
+    out = cv2.convertScaleAbs(out, alpha=alpha, beta=beta)
+    if rng.random() < 0.3:
+        out = cv2.GaussianBlur(out, (3, 3), 0)
+    return out
+
+
+def _targets(texts: list[str]):
+    import torch
+    flat = [int(c) + 1 for t in texts for c in t]
+    return torch.tensor(flat, dtype=torch.long), torch.tensor([len(t) for t in texts], dtype=torch.long)
+
+
+def _accuracy(model, crops, texts, batch: int, device) -> float:
+    import torch
+    model.eval()
+    hits = 0
+    with torch.no_grad():
+        for i in range(0, len(crops), batch):
+            x = torch.from_numpy(DigitRecognizer.preprocess(crops[i:i + batch])).to(device)
+            reads = DigitRecognizer.decode(model(x).cpu().numpy())
+            hits += sum(r is not None and r[0] == t for r, t in zip(reads, texts[i:i + batch]))
+    return hits / len(crops) if crops else 0.0
+
+
+def export_onnx(model, out: str):
+    import torch
+    model.eval().cpu()
+    dummy = torch.zeros(1, 1, DigitRecognizer.HEIGHT, DigitRecognizer.WIDTH)
+    torch.onnx.export(
+        model, dummy, out,
+        input_names=["x"], output_names=["logits"],
+        dynamic_axes={"x": {0: "n"}, "logits": {0: "n"}},
+        opset_version=13,
+    )
+    return out
+
+
+def train(train_tsv: str, val_tsv: str | None, out: str = DIGIT_MODEL, *, epochs: int = 40,
+          batch: int = 128, lr: float = 1e-3, seed: int = 0, logger=None) -> str:
+    """Train on `train_tsv`, keep the best epoch on `val_tsv` (or the last), export ONNX."""
+    import torch
+    import torch.nn.functional as F
+    logger = logger or get_logger("train_digit_ocr")
+    rng = random.Random(seed)
+    torch.manual_seed(seed)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    crops, texts = load_crops(train_tsv)
+    if not crops:
+        raise ValueError(f"No labeled crops in {train_tsv}")
+    val_crops, val_texts = load_crops(val_tsv) if val_tsv else ([], [])
+    logger.info(f"{len(crops)} training / {len(val_crops)} validation crops on {device}")
+
+    model = build_model().to(device)
+    opt = torch.optim.AdamW(model.parameters(), lr=lr, weight_decay=1e-4)
+    steps = epochs * -(-len(crops) // batch)
+    sched = torch.optim.lr_scheduler.OneCycleLR(opt, max_lr=lr, total_steps=steps)
+    ctc = torch.nn.CTCLoss(blank=DigitRecognizer.BLANK, zero_infinity=True)
+
+    best, best_state = -1.0, None
+    order = list(range(len(crops)))
+    for epoch in range(epochs):
+        model.train()
+        rng.shuffle(order)
+        total = 0.0
+        for i in range(0, len(order), batch):
+            idx = order[i:i + batch]
+            x = DigitRecognizer.preprocess([_augment(crops[k], rng) for k in idx])
+            y, y_len = _targets([texts[k] for k in idx])
+            logp = F.log_softmax(model(torch.from_numpy(x).to(device)), dim=2).permute(1, 0, 2)
+            x_len = torch.full((len(idx),), logp.shape[0], dtype=torch.long)
+            loss = ctc(logp, y, x_len, y_len)
+            opt.zero_grad()
+            loss.backward()
+            opt.step()
+            sched.step()
+            total += loss.item() * len(idx)
+        acc = _accuracy(model, val_crops, val_texts, batch, device) if val_crops else 0.0
+        logger.info(f"epoch {epoch + 1}/{epochs}  loss {total / len(crops):.4f}  val exact {acc:.3f}")
+        if not val_crops or acc >= best:
+            best = acc
+            best_state = {k: v.detach().cpu().clone() for k, v in model.state_dict().items()}
+
+    model.load_state_dict(best_state)
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    torch.save(best_state, os.path.splitext(out)[0] + ".pt")
+    export_onnx(model, out)
+    logger.info(f"Digit recognizer written to {out}" + (f" (val exact {best:.3f})" if val_crops else ""))
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Digit-only CTC recognizer: labeled crops, training, ONNX export")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    cp = sub.add_parser("crops", help="pseudo-label cached crops into a labels.tsv")
+    cp.add_argument("caches", nargs="+", help="detection caches built with --crops --reads")
+    cp.add_argument("--out", required=True)
+    cp.add_argument("--min-conf", type=float, default=0.9)
+    cp.add_argument("--digits", type=int, default=4)
+
+    tp = sub.add_parser("train", help="train and export to ONNX")
+    tp.add_argument("--train", required=True, help="labels.tsv of the training crops")
+    tp.add_argument("--val", help="labels.tsv of held-out crops (best epoch is kept)")
+    tp.add_argument("--out", default=DIGIT_MODEL)
+    tp.add_argument("--epochs", type=int, default=40)
+    tp.add_argument("--batch", type=int, default=128)
+    tp.add_argument("--lr", type=float, default=1e-3)
+    args = ap.parse_args()
+
+    if args.cmd == "crops":
+        path = export_crops(args.caches, args.out, min_conf=args.min_conf, digits=args.digits)
+    else:
+        path = train(args.train, args.val, args.out, epochs=args.epochs, batch=args.batch, lr=args.lr)
+    print(f"[INFO] {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+# pipeline/zygote.py
+"""
+Imported only by the forkserver (EARTAG_LAUNCH=forkserver with
+EARTAG_PRELOAD_MODELS=1): loads the models once so every forked camera
+worker starts with them already in (shared) memory.
+"""
+from eartag_jetson.common.log_utils import get_logger
+from eartag_jetson.pipeline.model_cache import preload
+
+preload(logger=get_logger("zygote"))